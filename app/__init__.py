@@ -5,11 +5,19 @@ import datetime
 import logging
 from logging.handlers import TimedRotatingFileHandler
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Initialize Celery outside create_app to avoid circular imports
 celery = Celery(__name__, broker='redis://172.30.226.220:6379/0')
 
 
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    # Celery子进程启动时预热分词词典，父进程已加载时直接复用
+    from app.utils import warmup
+    warmup.warm_up()
+
+
 def create_app(config_name):
     app = Flask(__name__)
     
@@ -28,12 +36,14 @@ def create_app(config_name):
     celery.Task = ContextTask
     # import module
     from app.api.rag import rag
+    from app.api.health import health
     #from app.api.handle_login import handle_login
     #from app.api.get_answer import  get_answer
     #from app.api.ask_lp import ask_lp
     #from app.api.history import history
     # register blueprint
     app.register_blueprint(rag)
+    app.register_blueprint(health)
     #app.register_blueprint(handle_login)
    # app.register_blueprint(get_answer)
    # app.register_blueprint(ask_lp)
@@ -54,6 +64,10 @@ def create_app(config_name):
     handler.setFormatter(formatter)
     #====================================logging config======================================
     app.celery = celery
+
+    # 预热jieba词典、用户词典和词性标注模型，避免每个worker的首个请求承担加载耗时
+    from app.utils import warmup
+    warmup.start_warm_up()
     print("app  init before  return!")    
 
     return app
@@ -0,0 +1,19 @@
+from app.api import *
+from app.utils import warmup
+
+health = Blueprint('health', __name__)
+
+@health.route('/health', methods=['GET'])
+def liveness():
+    """
+    存活检查：进程可以处理请求即返回200
+    """
+    return jsonify({'status': 'ok'})
+
+@health.route('/ready', methods=['GET'])
+def readiness():
+    """
+    就绪检查：分词词典和词性标注模型预热完成前返回503
+    """
+    status = warmup.status()
+    return jsonify(status), (200 if status['ready'] else 503)
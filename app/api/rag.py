@@ -1,11 +1,10 @@
 from app.api import *
+from flask import Response, stream_with_context
 import requests
 from tasks import generate_meeting_minutes
 
-from rank_bm25 import BM25Okapi
-import faiss
-import numpy as np
 import numpy as np
+import jieba
 import re
 import requests
 import json
@@ -17,7 +16,20 @@ from pptx import Presentation
 from openpyxl import load_workbook
 from werkzeug.utils import secure_filename
 import uuid
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from app.utils.storage import storage
+from app.utils.rag_index import HybridIndex
+from app.utils.corpus_store import CorpusStore
+from app.utils.tokenizer import create_tokenizer
+from app.utils import http_client
+from app.utils.embedding_cache import EmbeddingCache
+from app.utils.answer_cache import AnswerCache
+from app.utils.reranker import Reranker, RerankBudget
+from query_expansion import QueryExpander
+from app.utils.embedding_pipeline import EmbeddingPipeline
+from app.utils.llm_stream import stream_completion
 
 rag = Blueprint('rag', __name__)
 
@@ -28,21 +40,232 @@ config.read('config.ini')
 # 加载配置
 VLLM_SERVER_URL = config.get('vllm', 'server_url', fallback='http://your-vllm-server-address/generate')
 VLLM_RERANK_URL = config.get('vllm', 'rerank_url', fallback='http://your-vllm-server-address/rerank')
+# 流式生成接口：vllm（/generate，stream=true）或openai（/v1/completions）
+VLLM_STREAM_URL = config.get('vllm', 'stream_url', fallback='') or VLLM_SERVER_URL
+VLLM_STREAM_API = config.get('vllm', 'stream_api', fallback='vllm')
+VLLM_MODEL = config.get('vllm', 'model', fallback='')
 EMBEDDING_MODEL = 'BAAI/bge-large-zh'  # 更适合中文的嵌入模型
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 RRF_K = 60
 TOP_K = 10
 TOP_N = 5
-RERANK_TOP_N = 5  # rerank后保留的文档数
+RETRIEVAL_TOP_N = 10  # 每个检索方法取前N个结果
+FINAL_TOP_N = 5  # 最终返回的相关文档数
+MAX_BATCH_QUERIES = 64  # 批量查询接口单次最多的查询数
 
 # VLLM嵌入服务配置
 VLLM_EMBEDDING_URL = "http://localhost:8000/embed"  # VLLM嵌入服务地址
 
-documents = []
-embeddings = []
-bm25 = None
-index = None
+# 各后端共享的keep-alive连接池，超时和重试可在[http]中按后端覆盖
+# 嵌入和rerank是纯计算请求，POST可以安全重试
+embedding_client = http_client.get_client('embedding', VLLM_EMBEDDING_URL, idempotent=True)
+rerank_client = http_client.get_client('rerank', VLLM_RERANK_URL, read_timeout=10.0, idempotent=True)
+
+# rerank组件，(查询, 文本块)得分缓存在LRU中，重复的候选不再请求rerank服务
+reranker = Reranker(rerank_client, cache_size=config.getint('rag', 'rerank_cache_size', fallback=10000))
+# rerank候选数：fixed总是rerank前TOP_K个，adaptive按融合得分分布决定（第一名明显领先时跳过rerank）
+rerank_budget = RerankBudget(
+    mode=config.get('rag', 'rerank_mode', fallback='fixed'),
+    fixed_candidates=TOP_K,
+    min_candidates=config.getint('rag', 'rerank_min_candidates', fallback=FINAL_TOP_N),
+    max_candidates=config.getint('rag', 'rerank_max_candidates', fallback=20),
+    skip_gap=config.getfloat('rag', 'rerank_skip_gap', fallback=0.5),
+    flat_ratio=config.getfloat('rag', 'rerank_flat_ratio', fallback=0.8),
+)
+generate_client = http_client.get_client('generate', VLLM_SERVER_URL, read_timeout=120.0, max_retries=1)
+
+# 语料持久化目录，同一主机上的多个worker进程mmap同一份文件，共享页缓存
+RAG_CORPUS_DIR = config.get('rag', 'corpus_dir', fallback='') or os.path.join(getattr(storage, 'base_path', 'uploads'), 'rag_corpus')
+RAG_AUTOSAVE = config.getboolean('rag', 'autosave', fallback=True)
+# 检查其他worker是否发布了新语料版本的间隔（秒）
+RAG_SYNC_INTERVAL = config.getfloat('rag', 'sync_interval', fallback=2.0)
+# 向量缓冲区存储类型：float32 / float16 / int8
+RAG_EMBEDDING_DTYPE = config.get('rag', 'embedding_dtype', fallback='float32')
+# BM25分词器：jieba / bigram / whitespace
+RAG_TOKENIZER = config.get('rag', 'tokenizer', fallback='jieba')
+# 按内容哈希跳过重复上传的文本块
+RAG_DEDUP = config.getboolean('rag', 'dedup', fallback=True)
+# 向量索引配置：flat / hnsw / ivf_flat / ivf_pq
+RAG_VECTOR_CONFIG = {
+    'index_type': config.get('rag', 'index_type', fallback='flat'),
+    'metric': config.get('rag', 'metric', fallback='ip'),
+    'hnsw_m': config.getint('rag', 'hnsw_m', fallback=32),
+    'ef_construction': config.getint('rag', 'hnsw_ef_construction', fallback=200),
+    'ef_search': config.getint('rag', 'hnsw_ef_search', fallback=64),
+    'nlist': config.getint('rag', 'ivf_nlist', fallback=0),
+    'nprobe': config.getint('rag', 'ivf_nprobe', fallback=16),
+    'pq_m': config.getint('rag', 'pq_m', fallback=16),
+    'pq_nbits': config.getint('rag', 'pq_nbits', fallback=8),
+    'train_threshold': config.getint('rag', 'train_threshold', fallback=0),
+    'retrain_factor': config.getint('rag', 'retrain_factor', fallback=4),
+}
+# 向量检索相似度阈值（内积度量下为余弦相似度）
+RAG_SIMILARITY_THRESHOLD = config.getfloat('rag', 'similarity_threshold', fallback=0.4)
+# 各检索阶段的截止时间（秒），超时的阶段不参与融合
+RAG_STAGE_TIMEOUTS = {
+    'bm25': config.getfloat('rag', 'bm25_timeout', fallback=1.0),
+    'vector': config.getfloat('rag', 'vector_timeout', fallback=3.0),
+    'keyword': config.getfloat('rag', 'keyword_timeout', fallback=1.0),
+}
+
+# 检索阶段并发执行的线程池
+_retrieval_executor = ThreadPoolExecutor(max_workers=config.getint('rag', 'retrieval_workers', fallback=16),
+                                         thread_name_prefix='retrieval')
+# 批量查询的rerank和生成使用独立线程池，不占用在线查询的检索线程
+_batch_executor = ThreadPoolExecutor(max_workers=config.getint('rag', 'batch_workers', fallback=8),
+                                     thread_name_prefix='rag-batch')
+
+def create_embedding_cache():
+    """
+    创建查询向量缓存，开启embedding_cache_redis时复用utils中的Redis连接作为二级缓存
+    """
+    redis_client = None
+    if config.getboolean('rag', 'embedding_cache_redis', fallback=False):
+        try:
+            from utils import redis_client
+        except Exception as e:
+            print(f"查询向量缓存无法使用Redis：{str(e)}")
+    return EmbeddingCache(
+        max_size=config.getint('rag', 'embedding_cache_size', fallback=10000),
+        ttl=config.getint('rag', 'embedding_cache_ttl', fallback=3600),
+        redis_client=redis_client,
+    )
+
+# 查询扩展引擎，启动时加载同义词词典，词典文件修改后自动重新加载
+query_expander = QueryExpander(
+    file_path=config.get('rag', 'synonyms_path', fallback='keywords.txt'),
+    cache_size=config.getint('rag', 'expansion_cache_size', fallback=1024),
+)
+
+# 查询向量缓存，重复的问题跳过嵌入服务调用
+embedding_cache = create_embedding_cache()
+
+# 语义答案缓存：相似问题（查询向量余弦相似度不低于阈值）直接返回之前的答案，上传新文档后失效
+RAG_ANSWER_CACHE = config.getboolean('rag', 'answer_cache', fallback=True)
+answer_cache = AnswerCache(
+    max_size=config.getint('rag', 'answer_cache_size', fallback=1000),
+    ttl=config.getint('rag', 'answer_cache_ttl', fallback=3600),
+    threshold=config.getfloat('rag', 'answer_cache_threshold', fallback=0.95),
+)
+
+def embed_texts(texts, timeout=None, retries=None):
+    """
+    调用嵌入服务生成一批文本的向量
+    :param texts: 文本列表
+    :param timeout: 请求超时（秒），默认使用客户端配置
+    :param retries: 最大重试次数，默认使用客户端配置
+    :return: 向量列表
+    """
+    headers = {"Content-Type": "application/json"}
+    data = {"model": EMBEDDING_MODEL, "input": texts}
+    response = embedding_client.post(json=data, headers=headers, timeout=timeout, retries=retries)
+    response.raise_for_status()
+    return [item["embedding"] for item in response.json()["data"]]
+
+# 上传分块的并发嵌入流水线，按token预算切分批次，避免超出嵌入服务的批大小限制
+# 失败批次由流水线重试，单次请求不再重试
+embedding_pipeline = EmbeddingPipeline(
+    lambda texts: embed_texts(texts, retries=0),
+    max_batch_tokens=config.getint('rag', 'embedding_batch_tokens', fallback=8192),
+    max_batch_size=config.getint('rag', 'embedding_batch_size', fallback=64),
+    max_workers=config.getint('rag', 'embedding_workers', fallback=4),
+    max_retries=config.getint('rag', 'embedding_batch_retries', fallback=2),
+)
+
+def embed_query(query, timeout=None):
+    """
+    获取查询向量，优先从缓存读取
+    :param query: 查询文本
+    :param timeout: 嵌入请求的剩余时间预算（秒），指定时不重试，超时抛出异常；默认使用客户端的超时和重试配置
+    :return: 查询向量 (1, dim)
+    """
+    embedding = embedding_cache.get(EMBEDDING_MODEL, query)
+    if embedding is None:
+        retries = 0 if timeout is not None else None
+        embedding = np.array(embed_texts([query], timeout=timeout, retries=retries)[0], dtype='float32')
+        embedding_cache.put(EMBEDDING_MODEL, query, embedding)
+    return embedding.reshape(1, -1)
+
+def embed_queries(queries):
+    """
+    批量获取查询向量，缓存未命中的查询合并为一次（分批）嵌入请求
+    :param queries: 查询文本列表
+    :return: 查询向量矩阵 (len(queries), dim)
+    """
+    embeddings = [embedding_cache.get(EMBEDDING_MODEL, query) for query in queries]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        new_embeddings, _ = embedding_pipeline.embed([queries[i] for i in missing])
+        for i, embedding in zip(missing, new_embeddings):
+            embedding_cache.put(EMBEDDING_MODEL, queries[i], embedding)
+            embeddings[i] = embedding
+    return np.vstack(embeddings).astype('float32')
+
+def load_hybrid_index():
+    """
+    启动时从持久化目录映射语料，不存在或加载失败时创建空索引
+    """
+    if CorpusStore(RAG_CORPUS_DIR).exists():
+        try:
+            return HybridIndex.load(RAG_CORPUS_DIR, tokenizer=create_tokenizer(RAG_TOKENIZER), vector_config=RAG_VECTOR_CONFIG, dedup=RAG_DEDUP)
+        except Exception as e:
+            print(f"加载RAG语料失败：{str(e)}")
+    return HybridIndex(tokenizer=create_tokenizer(RAG_TOKENIZER), k1=1.5, b=0.75, embedding_dtype=RAG_EMBEDDING_DTYPE, vector_config=RAG_VECTOR_CONFIG, dedup=RAG_DEDUP)
+
+# 混合检索索引（文档、BM25、FAISS），上传时增量更新
+hybrid_index = load_hybrid_index()
+
+# 后台持久化线程，上传频繁时合并为一次保存
+_persist_executor = ThreadPoolExecutor(max_workers=1)
+_persist_pending = threading.Event()
+
+def _persist_corpus():
+    # 保存只写入新增文档组成的段，开始前清除标记，保存期间的上传会再提交一次
+    _persist_pending.clear()
+    try:
+        hybrid_index.save(RAG_CORPUS_DIR)
+    except Exception as e:
+        print(f"保存RAG语料失败：{str(e)}")
+
+def schedule_persist():
+    """
+    提交一次后台保存，已有待执行的保存时直接复用
+    """
+    if _persist_pending.is_set():
+        return
+    _persist_pending.set()
+    _persist_executor.submit(_persist_corpus)
+
+_corpus_store = CorpusStore(RAG_CORPUS_DIR)
+_sync_state = {'checked': 0.0, 'current': _corpus_store.current()}
+_sync_pending = threading.Event()
+
+def _sync_corpus():
+    _sync_pending.clear()
+    try:
+        if hybrid_index.sync(RAG_CORPUS_DIR):
+            # 加载了其他worker上传的文档，之前缓存的答案失效
+            answer_cache.bump_version()
+    except Exception as e:
+        print(f"同步RAG语料失败：{str(e)}")
+
+@rag.before_request
+def schedule_sync():
+    """
+    多个worker共享语料目录：每隔RAG_SYNC_INTERVAL秒检查一次CURRENT，
+    其他worker发布新版本后在后台加载新增的文档，不阻塞当前请求
+    """
+    now = time.monotonic()
+    if now - _sync_state['checked'] < RAG_SYNC_INTERVAL:
+        return
+    _sync_state['checked'] = now
+    current = _corpus_store.current()
+    if current == _sync_state['current'] or _sync_pending.is_set():
+        return
+    _sync_state['current'] = current
+    _sync_pending.set()
+    _persist_executor.submit(_sync_corpus)
 
 # 文本分块函数
 def split_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, mode='fixed'):
@@ -141,13 +364,102 @@ def rrf_fusion(results_list, k=60):
     fused_results = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)
     return fused_results
 
+def extract_keywords(query):
+    """
+    提取查询中的关键词（过滤单字）
+    """
+    return [kw for kw in jieba.cut_for_search(query) if len(kw) > 1]  # 过滤短词
+
+def _run_stage(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+def retrieve(query, snapshot, top_n, nprobe=None, ef_search=None, on_embedding=None):
+    """
+    并发执行BM25、向量和关键词检索，嵌入请求与本地打分同时进行
+    每个阶段有独立的截止时间，超时或失败的阶段被跳过，使用已完成阶段的结果
+    嵌入请求以向量阶段的剩余时间作为超时且不重试，超时后立即释放检索线程
+    :param query: 查询文本
+    :param snapshot: 索引快照
+    :param top_n: 每个检索方法取前N个结果
+    :param nprobe: IVF查询的聚类数
+    :param ef_search: HNSW查询搜索宽度
+    :param on_embedding: 向量阶段生成查询向量后的回调（如查找答案缓存），与BM25和关键词阶段并发执行
+    :return: ({阶段名: [(doc_id, score), ...]}, {阶段名: {'status': 'ok'/'timeout'/'error', 'ms': 耗时}})
+    """
+    def bm25_stage():
+        # 查询理解与扩展后做BM25检索
+        return hybrid_index.search_bm25(query_expander.expand(query), top_n, snapshot)
+
+    def vector_stage():
+        # 向量检索直接返回相似度（归一化向量的内积即余弦相似度）
+        remaining = RAG_STAGE_TIMEOUTS['vector'] - (time.perf_counter() - start)
+        if remaining <= 0:
+            # 排队期间已经超过截止时间
+            raise FutureTimeoutError()
+        query_embedding = embed_query(query, timeout=remaining)
+        if on_embedding is not None:
+            on_embedding(query_embedding)
+        return hybrid_index.search_vector(query_embedding, top_n, snapshot, nprobe=nprobe, ef_search=ef_search,
+                                          min_score=RAG_SIMILARITY_THRESHOLD)
+
+    def keyword_stage():
+        # 关键词匹配增强：通过二元组倒排索引匹配，只检查候选文档
+        keywords = extract_keywords(query)
+        return hybrid_index.search_keywords(keywords, top_n, snapshot) if keywords else []
+
+    start = time.perf_counter()
+    futures = {
+        'bm25': _retrieval_executor.submit(_run_stage, bm25_stage),
+        'vector': _retrieval_executor.submit(_run_stage, vector_stage),
+        'keyword': _retrieval_executor.submit(_run_stage, keyword_stage),
+    }
+    results, stages = {}, {}
+    for name, future in futures.items():
+        remaining = RAG_STAGE_TIMEOUTS[name] - (time.perf_counter() - start)
+        try:
+            results[name], elapsed = future.result(timeout=max(remaining, 0))
+            stages[name] = {'status': 'ok', 'ms': round(elapsed, 2)}
+        except (FutureTimeoutError, requests.exceptions.Timeout):
+            # 未开始的阶段直接取消，已在执行的阶段结果被丢弃；嵌入请求按剩余时间超时
+            future.cancel()
+            stages[name] = {'status': 'timeout', 'ms': round((time.perf_counter() - start) * 1000, 2)}
+            print(f"检索阶段{name}超时")
+        except Exception as e:
+            stages[name] = {'status': 'error', 'ms': round((time.perf_counter() - start) * 1000, 2)}
+            print(f"检索阶段{name}异常：{str(e)}")
+    return results, stages
+
+def retrieve_batch(queries, snapshot, top_n, nprobe=None, ef_search=None):
+    """
+    批量检索：一次嵌入请求生成全部查询向量（与本地打分并发进行），
+    BM25批量打分共享查询词的倒排表，FAISS以多行查询矩阵一次检索
+    :param queries: 查询文本列表
+    :return: [{阶段名: [(doc_id, score), ...]}, ...]，向量检索失败时该阶段缺省
+    """
+    embedding_future = _retrieval_executor.submit(embed_queries, queries)
+    bm25_results = hybrid_index.search_bm25_batch([query_expander.expand(query) for query in queries], top_n, snapshot)
+    keyword_results = []
+    for query in queries:
+        keywords = extract_keywords(query)
+        keyword_results.append(hybrid_index.search_keywords(keywords, top_n, snapshot) if keywords else [])
+
+    results = [{'bm25': bm25, 'keyword': keyword} for bm25, keyword in zip(bm25_results, keyword_results)]
+    try:
+        vector_results = hybrid_index.search_vector_batch(embedding_future.result(), top_n, snapshot, nprobe=nprobe,
+                                                          ef_search=ef_search, min_score=RAG_SIMILARITY_THRESHOLD)
+        for result, vector in zip(results, vector_results):
+            result['vector'] = vector
+    except Exception as e:
+        print(f"批量向量检索异常：{str(e)}")
+    return results
+
 @rag.route('/rag/upload', methods=['POST'])
 def upload_text():
     """
     上传文本并进行分块、索引
     """
-    global documents, embeddings, bm25, index
-    
     text = request.form.get('text')
     if not text:
         return jsonify({'error': 'No text provided'}), 400
@@ -166,191 +478,285 @@ def upload_text():
     if not chunks:
         return jsonify({'error': 'Text is too short or empty'}), 400
     
-    # 更新文档列表
-    documents.extend(chunks)
-    
-    # 生成文档向量（使用VLLM嵌入服务）
-    headers = {"Content-Type": "application/json"}
-    data = {"model": EMBEDDING_MODEL, "input": chunks}
-    response = requests.post(VLLM_EMBEDDING_URL, json=data, headers=headers)
-    response.raise_for_status()
-    new_embeddings = np.array([item["embedding"] for item in response.json()["data"]], dtype='float32')
-    embeddings.extend(new_embeddings.tolist())
-    
-    # 构建BM25索引（优化参数）
-    tokenized_docs = [doc.split() for doc in documents]
-    bm25 = BM25Okapi(tokenized_docs, k1=1.5, b=0.75)  # 调整BM25参数提高精度
-    
-    # 构建FAISS向量索引
-    embeddings_np = np.array(embeddings, dtype='float32')
-    dimension = embeddings_np.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings_np)
+    # 跳过已入库的重复文本块，不再重复生成向量
+    new_chunks = hybrid_index.new_chunks(chunks) if RAG_DEDUP else chunks
+    embedding_stats = {'batches': 0, 'seconds': 0.0, 'chunks_per_sec': 0.0}
+    if new_chunks:
+        # 生成文档向量（使用VLLM嵌入服务，分批并发请求）
+        new_embeddings, embedding_stats = embedding_pipeline.embed(new_chunks)
+        
+        # 增量更新BM25倒排索引和FAISS向量索引，只处理新增分块
+        if RAG_AUTOSAVE:
+            # 在语料锁内先加载其他worker发布的文档再追加，并立即把本批次写成段发布；段合并和向量检查点在后台完成
+            hybrid_index.add_and_persist(RAG_CORPUS_DIR, new_chunks, new_embeddings)
+            schedule_persist()
+        else:
+            hybrid_index.add(new_chunks, new_embeddings)
+        # 语料变化，之前缓存的答案失效
+        answer_cache.bump_version()
     
     return jsonify({
         'message': 'Text uploaded and indexed successfully',
         'num_chunks': len(chunks),
-        'total_docs': len(documents)
+        'num_duplicates': len(chunks) - len(new_chunks),
+        'total_docs': len(hybrid_index),
+        'embedding_batches': embedding_stats['batches'],
+        'embedding_seconds': embedding_stats['seconds'],
+        'chunks_per_sec': embedding_stats['chunks_per_sec']
     })
 
-@rag.route('/rag/query', methods=['POST'])
-def rag_query():
+def fuse_results(stage_results):
     """
-    执行RAG查询，融合向量检索和BM25
+    RRF融合各检索阶段的结果（只融合按时完成的阶段），返回rerank候选
+    :param stage_results: {阶段名: [(doc_id, score), ...]}
+    :return: [(doc_id, score), ...]，最多rerank_budget.limit个
     """
-    global documents, embeddings, bm25, index
-    
-    query = request.form.get('query')
-    if not query:
-        return jsonify({'error': 'No query provided'}), 400
-    
-    if not documents or not bm25 or not index:
-        return jsonify({'error': 'No documents indexed yet'}), 400
-    
-    # 参数配置
-    TOP_N = 10  # 每个检索方法取前N个结果
-    FINAL_TOP_N = 5  # 最终返回的相关文档数
-    SIMILARITY_THRESHOLD = 0.2  # 向量检索相似度阈值（归一化后）
-    
-    # 1. 查询理解与扩展
-    import sys
-    import os
-    sys.path.append('/Users/gongshuai/workspace/chat-wx')
-    from query_expansion import expand_query
-    expanded_query = expand_query(query)
-    
-    # 2. BM25检索
-    tokenized_query = expanded_query.split()
-    bm25_scores = bm25.get_scores(tokenized_query)
-    bm25_results = [(i, score) for i, score in enumerate(bm25_scores)]
-    bm25_results = sorted(bm25_results, key=lambda x: x[1], reverse=True)[:TOP_N]
-    
-    # 2. 向量检索
-    headers = {"Content-Type": "application/json"}
-    data = {"model": EMBEDDING_MODEL, "input": [query]}
-    response = requests.post(VLLM_EMBEDDING_URL, json=data, headers=headers)
-    response.raise_for_status()
-    query_embedding = np.array([response.json()["data"][0]["embedding"]], dtype='float32')
-    D, I = index.search(query_embedding, TOP_N)
-    
-    # 归一化向量检索得分（转换为相似度）
-    vector_results = []
-    for i, d in zip(I[0], D[0]):
-        # 计算余弦相似度（假设FAISS使用的是L2距离）
-        # 余弦相似度 = 1 / (1 + L2距离) （简化版，更精确的需要向量归一化）
-        similarity = 1 / (1 + d)
-        if similarity >= SIMILARITY_THRESHOLD:
-            vector_results.append((i, similarity))
-    
-    # 3. 关键词匹配增强
-    # 提取查询中的关键词
-    import jieba
-    jieba.setLogLevel(20)
-    keywords = list(jieba.cut_for_search(query))
-    keywords = [kw for kw in keywords if len(kw) > 1]  # 过滤短词
-    
-    keyword_results = []
-    if keywords:
-        for i, doc in enumerate(documents):
-            score = 0
-            for kw in keywords:
-                if kw in doc:
-                    score += 1
-            if score > 0:
-                keyword_results.append((i, score))
-        keyword_results = sorted(keyword_results, key=lambda x: x[1], reverse=True)[:TOP_N]
-    
-    # 4. 融合排序
-    results_list = [bm25_results, vector_results]
-    if keyword_results:
-        results_list.append(keyword_results)
+    results_list = [stage_results[name] for name in ('bm25', 'vector', 'keyword') if stage_results.get(name)]
     
     fused_results = rrf_fusion(results_list, k=50)  # 调整k值可能影响结果
     
-    # 5. 去重并过滤低得分结果
+    # 去重并过滤低得分结果
     unique_docs = {}
     for doc_id, score in fused_results:
         if doc_id not in unique_docs:
             unique_docs[doc_id] = score
     
-    # 6. Rerank重排
-    reranked_docs = []
-    candidate_docs = sorted(unique_docs.items(), key=lambda x: x[1], reverse=True)[:TOP_K]  # 取前TOP_K个结果进行rerank
-    
-    if candidate_docs:
-        try:
-            # 调用vllm的rerank服务
-            rerank_input = {
-                'query': query,
-                'documents': [documents[doc_id] for doc_id, score in candidate_docs],
-                'top_n': RERANK_TOP_N
-            }
-            
-            response = requests.post(
-                VLLM_RERANK_URL,
-                json=rerank_input
-            )
-            
-            if response.status_code == 200:
-                rerank_results = response.json().get('results', [])
-                
-                # 构建rerank后的结果
-                reranked_docs = []
-                for i, result in enumerate(rerank_results):
-                    doc_id = candidate_docs[i][0]
-                    reranked_docs.append({
-                        'doc_id': doc_id,
-                        'content': documents[doc_id],
-                        'score': result.get('score', candidate_docs[i][1]),
-                        'rerank_score': result.get('score', 0.0)
-                    })
-                
-                # 如果rerank返回结果不足，补充原始结果
-                if len(reranked_docs) < FINAL_TOP_N:
-                    remaining_docs = [doc for doc in candidate_docs if doc[0] not in [d['doc_id'] for d in reranked_docs]]
-                    for doc_id, score in remaining_docs[:FINAL_TOP_N - len(reranked_docs)]:
-                        reranked_docs.append({
-                            'doc_id': doc_id,
-                            'content': documents[doc_id],
-                            'score': score
-                        })
-        except Exception as e:
-            # 若rerank失败，使用原始融合结果
-            print(f"Rerank服务调用异常：{str(e)}")
-            reranked_docs = [{
-                'doc_id': doc_id,
-                'content': documents[doc_id],
-                'score': score
-            } for doc_id, score in candidate_docs[:FINAL_TOP_N]]
-    else:
-        reranked_docs = []
+    return sorted(unique_docs.items(), key=lambda x: x[1], reverse=True)[:rerank_budget.limit]  # 保留rerank候选
+
+def top_candidates(candidate_docs):
+    """
+    不rerank时直接取融合得分最高的FINAL_TOP_N个文档
+    """
+    documents = hybrid_index.documents
+    return [{'doc_id': doc_id, 'content': documents[doc_id], 'score': score}
+            for doc_id, score in candidate_docs[:FINAL_TOP_N]]
+
+def rerank_candidates(query, candidate_docs):
+    """
+    按融合得分分布选取候选调用rerank服务重排，未送去rerank的候选按融合顺序补在后面，失败时使用原始融合结果
+    :param query: 查询文本
+    :param candidate_docs: [(doc_id, score), ...]
+    :return: (最相关的FINAL_TOP_N个文档, {'status': 'ok'/'skipped'/'fallback', 'candidates': 送去rerank的候选数,
+             'avoided': 相对固定模式节省的候选数, 'ms': 耗时})
+    """
+    start = time.perf_counter()
+    budget = rerank_budget.select([score for _, score in candidate_docs])
+    info = {'status': 'ok', 'candidates': budget, 'avoided': rerank_budget.record(len(candidate_docs), budget)}
+    if budget == 0:
+        info.update(status='skipped', ms=0.0)
+        return top_candidates(candidate_docs), info
+    
+    documents = hybrid_index.documents
+    try:
+        reranked = reranker.rerank(query, [(doc_id, documents[doc_id], score)
+                                           for doc_id, score in candidate_docs[:budget]], FINAL_TOP_N)
+        retrieved_docs = (reranked + top_candidates(candidate_docs[budget:]))[:FINAL_TOP_N]
+    except Exception as e:
+        # 若rerank失败，使用原始融合结果
+        print(f"Rerank服务调用异常：{str(e)}")
+        info['status'] = 'fallback'
+        retrieved_docs = top_candidates(candidate_docs)
+    info['ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return retrieved_docs, info
+
+def search_documents(query, snapshot, nprobe=None, ef_search=None, rerank=True):
+    """
+    检索、融合并rerank，返回最相关的文档
+    :param query: 查询文本
+    :param snapshot: 索引快照
+    :param nprobe: IVF查询的聚类数
+    :param ef_search: HNSW查询搜索宽度
+    :param rerank: 是否调用rerank服务
+    :return: (retrieved_docs, 各检索阶段和rerank的状态和耗时)
+    """
+    # 1-3. 查询扩展+BM25检索、向量检索、关键词匹配并发执行
+    stage_results, stages = retrieve(query, snapshot, RETRIEVAL_TOP_N, nprobe=nprobe, ef_search=ef_search)
     
-    # 获取最相关的文档
-    retrieved_docs = reranked_docs[:FINAL_TOP_N]
+    # 4-5. 融合排序、去重
+    candidate_docs = fuse_results(stage_results)
     
-    # 调用大模型生成答案
+    # 6. Rerank重排
+    if not rerank:
+        return top_candidates(candidate_docs), stages
+    retrieved_docs, stages['rerank'] = rerank_candidates(query, candidate_docs)
+    return retrieved_docs, stages
+
+def build_prompt(query, retrieved_docs):
+    """
+    用检索到的文档构建生成答案的提示词
+    """
     context = '\n'.join([doc['content'] for doc in retrieved_docs])
-    prompt = f"基于以下上下文回答问题：\n\n上下文：{context}\n\n问题：{query}\n\n回答："
-    
+    return f"基于以下上下文回答问题：\n\n上下文：{context}\n\n问题：{query}\n\n回答："
+
+def generate_answer(prompt):
+    """
+    调用大模型生成答案
+    :return: (答案, 是否成功)，失败时答案为错误说明
+    """
     try:
         # 调用vllm提供的大模型服务
-        response = requests.post(
-            VLLM_SERVER_URL,
-            json={'prompt': prompt, 'temperature': 0.7, 'max_tokens': 512}
-        )
+        response = generate_client.post(json={'prompt': prompt, 'temperature': 0.7, 'max_tokens': 512})
         
         if response.status_code == 200:
-            answer = response.json().get('text', '')
-        else:
-            answer = '大模型服务调用失败'
-            
+            return response.json().get('text', ''), True
+        return '大模型服务调用失败', False
     except Exception as e:
-        answer = f'大模型服务调用异常：{str(e)}'
+        return f'大模型服务调用异常：{str(e)}', False
+
+def _parse_query_request():
+    """
+    解析查询参数并获取索引快照
+    :return: (query, snapshot, nprobe, ef_search, 错误响应)
+    """
+    query = request.form.get('query')
+    if not query:
+        return None, None, None, None, (jsonify({'error': 'No query provided'}), 400)
+    # 近似向量索引的查询参数（可选）
+    nprobe = request.form.get('nprobe', type=int)
+    ef_search = request.form.get('ef_search', type=int)
+    
+    # 查询全程使用同一快照，不受并发上传影响
+    snapshot = hybrid_index.snapshot()
+    if snapshot.num_docs == 0:
+        return None, None, None, None, (jsonify({'error': 'No documents indexed yet'}), 400)
+    return query, snapshot, nprobe, ef_search, None
+
+@rag.route('/rag/query', methods=['POST'])
+def rag_query():
+    """
+    执行RAG查询，融合向量检索和BM25
+    """
+    # 在获取快照之前读取语料版本，检索期间语料更新时答案不写入缓存
+    cache_version = answer_cache.version
+    query, snapshot, nprobe, ef_search, error = _parse_query_request()
+    if error:
+        return error
+    
+    # 语义答案缓存在向量阶段生成查询向量后查找，与BM25和关键词检索并发进行；命中时直接返回，不再rerank和生成
+    cache_lookup = {}
+    def lookup_answer(query_embedding):
+        cache_lookup['embedding'] = query_embedding
+        try:
+            cache_lookup['cached'], cache_lookup['similarity'] = answer_cache.get(query_embedding)
+        except Exception as e:
+            print(f"答案缓存查询异常：{str(e)}")
+    
+    # 1-3. 查询扩展+BM25检索、向量检索（复用其查询向量查找答案缓存）、关键词匹配并发执行
+    stage_results, stages = retrieve(query, snapshot, RETRIEVAL_TOP_N, nprobe=nprobe, ef_search=ef_search,
+                                     on_embedding=lookup_answer if RAG_ANSWER_CACHE else None)
+    cached = cache_lookup.get('cached')
+    if cached is not None:
+        return jsonify(dict(cached, query=query, cached_query=cached['query'],
+                            cache_similarity=round(cache_lookup['similarity'], 4)))
+    
+    # 4-6. 融合排序、去重后rerank
+    retrieved_docs, stages['rerank'] = rerank_candidates(query, fuse_results(stage_results))
+    
+    # 调用大模型生成答案
+    answer, success = generate_answer(build_prompt(query, retrieved_docs))
+    query_embedding = cache_lookup.get('embedding')
+    if success and query_embedding is not None:
+        answer_cache.put(query_embedding, {'query': query, 'answer': answer, 'retrieved_docs': retrieved_docs},
+                         version=cache_version)
     
     return jsonify({
         'query': query,
         'answer': answer,
-        'retrieved_docs': retrieved_docs
+        'retrieved_docs': retrieved_docs,
+        'retrieval_stages': stages
+    })
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@rag.route('/rag/query/stream', methods=['POST'])
+def rag_query_stream():
+    """
+    流式RAG查询（Server-Sent Events）：
+    先推送docs事件（检索到的文档），再逐段推送token事件（生成的文本片段），
+    最后推送done事件（完整答案）；生成失败时推送error事件
+    """
+    query, snapshot, nprobe, ef_search, error = _parse_query_request()
+    if error:
+        return error
+    
+    retrieved_docs, stages = search_documents(query, snapshot, nprobe=nprobe, ef_search=ef_search)
+    prompt = build_prompt(query, retrieved_docs)
+    
+    def generate():
+        yield _sse('docs', {'query': query, 'retrieved_docs': retrieved_docs, 'retrieval_stages': stages})
+        answer = []
+        try:
+            for text in stream_completion(generate_client, prompt, api=VLLM_STREAM_API, url=VLLM_STREAM_URL,
+                                          model=VLLM_MODEL, temperature=0.7, max_tokens=512):
+                answer.append(text)
+                yield _sse('token', {'text': text})
+        except Exception as e:
+            yield _sse('error', {'error': f'大模型服务调用异常：{str(e)}'})
+            return
+        yield _sse('done', {'answer': ''.join(answer)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@rag.route('/rag/retrieve', methods=['POST'])
+def rag_retrieve():
+    """
+    只执行检索（可选rerank），不调用大模型生成
+    参数：query，rerank（默认true），nprobe，ef_search
+    """
+    query, snapshot, nprobe, ef_search, error = _parse_query_request()
+    if error:
+        return error
+    rerank = request.form.get('rerank', 'true').lower() != 'false'
+    
+    retrieved_docs, stages = search_documents(query, snapshot, nprobe=nprobe, ef_search=ef_search, rerank=rerank)
+    return jsonify({
+        'query': query,
+        'retrieved_docs': retrieved_docs,
+        'retrieval_stages': stages
+    })
+
+@rag.route('/rag/query/batch', methods=['POST'])
+def rag_query_batch():
+    """
+    批量RAG查询，请求体为JSON：
+    {"queries": ["...", ...], "rerank": true, "generate": true, "nprobe": 可选, "ef_search": 可选}
+    查询向量一次生成、BM25批量打分、FAISS多行检索，rerank和生成并发执行
+    """
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q for q in queries):
+        return jsonify({'error': 'queries must be a non-empty list of strings'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'Too many queries, at most {MAX_BATCH_QUERIES} per batch'}), 400
+    
+    snapshot = hybrid_index.snapshot()
+    if snapshot.num_docs == 0:
+        return jsonify({'error': 'No documents indexed yet'}), 400
+    
+    stage_results = retrieve_batch(queries, snapshot, RETRIEVAL_TOP_N, nprobe=data.get('nprobe'),
+                                   ef_search=data.get('ef_search'))
+    candidates = [fuse_results(result) for result in stage_results]
+    
+    rerank_infos = [None] * len(queries)
+    if data.get('rerank', True):
+        retrieved, rerank_infos = zip(*_batch_executor.map(rerank_candidates, queries, candidates))
+    else:
+        retrieved = [top_candidates(candidate_docs) for candidate_docs in candidates]
+    
+    answers = [None] * len(queries)
+    if data.get('generate', True):
+        prompts = [build_prompt(query, docs) for query, docs in zip(queries, retrieved)]
+        answers = [answer for answer, _ in _batch_executor.map(generate_answer, prompts)]
+    
+    return jsonify({
+        'results': [{
+            'query': query,
+            'answer': answer,
+            'retrieved_docs': docs,
+            'rerank': rerank_info
+        } for query, answer, docs, rerank_info in zip(queries, answers, retrieved, rerank_infos)]
     })
 
 @rag.route('/rag/docs', methods=['GET'])
@@ -358,9 +764,64 @@ def get_docs():
     """
     获取所有已索引的文档
     """
+    snapshot = hybrid_index.snapshot()
+    return jsonify({
+        'total_docs': snapshot.num_docs,
+        'documents': hybrid_index.documents[:snapshot.num_docs]
+    })
+
+@rag.route('/rag/persist', methods=['POST'])
+def persist_docs():
+    """
+    立即将语料持久化到存储目录
+    本worker有未保存的文档、而其他worker已经发布了新文档时返回409
+    """
+    try:
+        hybrid_index.save(RAG_CORPUS_DIR)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({
+        'message': 'Corpus persisted successfully',
+        'total_docs': len(hybrid_index),
+        'corpus_dir': RAG_CORPUS_DIR
+    })
+
+@rag.route('/rag/index/recall', methods=['GET'])
+def get_index_recall():
+    """
+    以精确检索为基准评估当前向量索引的recall@k
+    """
+    k = request.args.get('k', 10, type=int)
+    num_queries = request.args.get('num_queries', 100, type=int)
+    nprobe = request.args.get('nprobe', type=int)
+    ef_search = request.args.get('ef_search', type=int)
+    return jsonify(hybrid_index.vector_recall(k=k, num_queries=num_queries, nprobe=nprobe, ef_search=ef_search))
+
+@rag.route('/rag/memory', methods=['GET'])
+def get_memory():
+    """
+    查看RAG索引的内存占用（含每个分块的平均字节数）
+    """
+    return jsonify(hybrid_index.memory_usage())
+
+@rag.route('/rag/metrics/http', methods=['GET'])
+def get_http_metrics():
+    """
+    查看各后端服务（嵌入、rerank、生成、音频识别等）的请求数、重试数和延迟分位数
+    """
+    return jsonify(http_client.metrics())
+
+@rag.route('/rag/metrics/cache', methods=['GET'])
+def get_cache_metrics():
+    """
+    查看各缓存的命中统计
+    """
     return jsonify({
-        'total_docs': len(documents),
-        'documents': documents
+        'query_embedding': embedding_cache.stats(),
+        'answer': answer_cache.stats(),
+        'query_expansion': query_expander.stats(),
+        'rerank': reranker.stats(),
+        'rerank_budget': rerank_budget.stats(),
     })
 
 # 全局变量存储会议背景知识
@@ -1,6 +1,6 @@
 from app.api import *
 from tasks.ask import ask
-from utils import  checkroom, getAccessToken,filter_content
+from utils import  checkroom, getAccessToken,filter_content,mask_content
 import xml.etree.ElementTree as ET
 import hashlib
 import time
@@ -20,6 +20,8 @@ MESSAGE_INVALID = config['msg']['MESSAGE_INVALID']
 MESSAGE_TOO_REQ = config['msg']['MESSAGE_TOO_REQ'] 
 MESSAGE_WELCOME = config['msg'] ['MESSAGE_WELCOME']
 MESSAGE_QUOTA = config['msg']['MESSAGE_QUOTA']
+# 敏感内容处理方式：reject（直接拒绝）/ mask（敏感词替换为*后继续处理）
+SENSITIVE_ACTION = config.get('wx', 'sensitive_action', fallback='reject')
 
 
 def buildResponse(from_user,to_user,answer):
@@ -77,8 +79,9 @@ def handle_ask():
     if content.startswith("tt_live"):
         parts = content.split(":")
 
-    filtered = filter_content(content);
-    if  filtered:
+    if SENSITIVE_ACTION == 'mask':
+        content = mask_content(content)
+    elif filter_content(content):
         return buildResponse(from_user,to_user,MESSAGE_INVALID);
     
     # do something with the content, e.g. call a machine learning model to get an answer
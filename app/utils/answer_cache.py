@@ -0,0 +1,115 @@
+import threading
+import time
+
+import numpy as np
+
+from app.utils.vector_index import normalize_embeddings
+
+
+class AnswerCache:
+    """
+    语义答案缓存：按查询向量的余弦相似度查找最近的已回答问题
+    条目记录写入时的语料版本，语料更新（版本号递增）后旧答案不再命中
+    向量存放在预分配的连续矩阵中，一次矩阵乘法完成最近邻查找
+    """
+
+    def __init__(self, dimension=None, max_size=1000, ttl=3600, threshold=0.95):
+        """
+        :param dimension: 向量维度，为None时在首次写入时确定
+        :param max_size: 最大条目数，满时淘汰过期、旧版本或最久未命中的条目
+        :param ttl: 过期时间（秒），0表示不过期
+        :param threshold: 命中所需的最小余弦相似度
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = 0
+        self._lock = threading.Lock()
+        self._size = 0
+        self._vectors = None
+        self._versions = np.zeros(max_size, dtype='int64')
+        self._expires = np.zeros(max_size, dtype='float64')
+        self._last_used = np.zeros(max_size, dtype='float64')
+        self._values = [None] * max_size
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        if dimension is not None:
+            self._vectors = np.zeros((max_size, dimension), dtype='float32')
+
+    def bump_version(self):
+        """
+        语料更新后调用，之前缓存的答案全部失效
+        """
+        with self._lock:
+            self.version += 1
+            return self.version
+
+    def _valid(self, now):
+        valid = self._versions[:self._size] == self.version
+        if self.ttl:
+            valid &= self._expires[:self._size] > now
+        return valid
+
+    def get(self, embedding):
+        """
+        查找相似问题的答案
+        :param embedding: 查询向量
+        :return: (缓存的值, 相似度)，未命中时返回(None, 最高相似度)
+        """
+        query = normalize_embeddings(embedding)[0]
+        now = time.monotonic()
+        with self._lock:
+            if self._size == 0 or self._vectors is None or len(query) != self._vectors.shape[1]:
+                self._stats['misses'] += 1
+                return None, 0.0
+            scores = self._vectors[:self._size] @ query
+            scores[~self._valid(now)] = -np.inf
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                self._stats['misses'] += 1
+                return None, max(score, 0.0)
+            self._last_used[best] = now
+            self._stats['hits'] += 1
+            return self._values[best], score
+
+    def put(self, embedding, value, version=None):
+        """
+        写入答案（记录当前语料版本）
+        :param embedding: 查询向量
+        :param value: 缓存的值
+        :param version: 检索开始前读取的语料版本，与当前版本不同时答案基于旧语料生成，不写入
+        :return: 是否写入
+        """
+        vector = normalize_embeddings(embedding)[0]
+        now = time.monotonic()
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype='float32')
+            elif len(vector) != self._vectors.shape[1]:
+                return False
+            if self._size < self.max_size:
+                slot = self._size
+                self._size += 1
+            else:
+                # 优先复用已失效的条目，否则淘汰最久未命中的条目
+                invalid = np.flatnonzero(~self._valid(now))
+                slot = int(invalid[0]) if len(invalid) else int(np.argmin(self._last_used))
+                self._stats['evictions'] += 1
+            self._vectors[slot] = vector
+            self._versions[slot] = self.version
+            self._expires[slot] = now + self.ttl if self.ttl else np.inf
+            self._last_used[slot] = now
+            self._values[slot] = value
+            return True
+
+    def stats(self):
+        """
+        命中统计
+        """
+        with self._lock:
+            stats = dict(self._stats, size=self._size, max_size=self.max_size, version=self.version)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,161 @@
+import contextlib
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+
+
+class CorpusStore:
+    """
+    RAG语料目录：不可变的段目录 + 版本化的manifest，CURRENT文件记录当前manifest的文件名
+    - 每次保存只把新增文档写成一个新段，段写完后写入新manifest，再用os.replace原子替换CURRENT，
+      读者看到的要么是旧版本要么是新版本，不存在目录缺失的中间状态
+    - 上一个版本的manifest及其引用的段保留到下一次发布，正在按旧版本加载的进程仍能读到完整数据
+    - 兼容早期版本的单目录格式（meta.json），视为只有一个段（语料目录本身）的版本0
+    - 多个进程共享同一语料目录时，发布新版本前需持有lock()，基于最新的manifest追加
+    """
+
+    CURRENT = 'CURRENT'
+    LOCK = 'corpus.lock'
+    # 早期单目录格式的文件，合并后不再被引用时删除
+    LEGACY_FILES = ('meta.json', 'texts.bin', 'offsets.npy', 'chunk_hashes.npy', 'embeddings.npy',
+                    'embeddings.npy.scales.npy', 'vectors.faiss', 'terms.json', 'postings_indptr.npy',
+                    'postings_doc_ids.npy', 'postings_tfs.npy', 'doc_lens.npy', 'keyword_terms.json',
+                    'keyword_postings_indptr.npy', 'keyword_postings_doc_ids.npy', 'keyword_postings_tfs.npy',
+                    'keyword_doc_lens.npy')
+    TMP_MAX_AGE = 3600  # 写入中断留下的临时文件超过该时间（秒）后清理
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self.path(self.CURRENT)) or os.path.exists(self.path('meta.json'))
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        跨进程的语料写锁（fcntl.flock），同一进程的不同线程之间同样互斥
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(self.LOCK), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def current(self):
+        """
+        当前manifest的文件名，语料不存在时为None，早期格式为'meta.json'
+        """
+        try:
+            with open(self.path(self.CURRENT), 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return 'meta.json' if os.path.exists(self.path('meta.json')) else None
+
+    def manifest(self):
+        """
+        读取当前版本的manifest，语料不存在时返回None
+        :return: {'version', 'num_docs', 'segments': [{'name', 'start', 'end'}, ...], 'vector_file', 'vector_docs', ...}
+        """
+        name = self.current()
+        if name is None:
+            return None
+        with open(self.path(name), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if name == 'meta.json':
+            has_vectors = os.path.exists(self.path('vectors.faiss'))
+            manifest = dict(manifest, version=0, segments=[{'name': '', 'start': 0, 'end': manifest['num_docs']}],
+                            vector_file='vectors.faiss' if has_vectors else None,
+                            vector_docs=manifest['num_docs'] if has_vectors else 0)
+        return manifest
+
+    def new_segment(self):
+        """
+        创建段的临时目录，写入完成后调用commit_segment
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(f"seg.tmp-{uuid.uuid4().hex}")
+        os.makedirs(path)
+        return path
+
+    def commit_segment(self, tmp_path, start, end):
+        """
+        把写好的临时目录重命名为正式的段目录
+        :return: manifest中的段描述
+        """
+        name = f"seg-{start:010d}-{end:010d}-{uuid.uuid4().hex[:8]}"
+        os.rename(tmp_path, self.path(name))
+        return {'name': name, 'start': start, 'end': end}
+
+    def vector_file(self, num_docs):
+        """
+        向量索引检查点的文件名
+        """
+        return f"vectors-{num_docs:010d}-{uuid.uuid4().hex[:8]}.faiss"
+
+    def _write_atomic(self, name, content):
+        tmp_path = self.path(f"{name}.tmp-{uuid.uuid4().hex}")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path(name))
+
+    def publish(self, manifest):
+        """
+        写入新版本的manifest并原子替换CURRENT，然后清理两个版本之前的文件
+        :param manifest: 新版本的manifest，version需大于当前版本
+        """
+        previous = self.manifest()
+        name = f"manifest-{manifest['version']:010d}.json"
+        self._write_atomic(name, json.dumps(manifest, ensure_ascii=False))
+        self._write_atomic(self.CURRENT, name)
+        self.cleanup([manifest, previous])
+
+    def cleanup(self, manifests):
+        """
+        删除不被给定manifest引用的段、向量检查点和旧manifest
+        """
+        keep = {self.CURRENT}
+        for manifest in manifests:
+            if not manifest:
+                continue
+            keep.add(f"manifest-{manifest['version']:010d}.json")
+            keep.update(segment['name'] for segment in manifest['segments'])
+            if manifest.get('vector_file'):
+                keep.add(manifest['vector_file'])
+
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = self.path(name)
+            if '.tmp-' in name:
+                # 其他进程可能正在写入，只清理中断留下的旧文件
+                try:
+                    if now - os.path.getmtime(path) < self.TMP_MAX_AGE:
+                        continue
+                except FileNotFoundError:
+                    continue
+            elif name in keep or not name.startswith(('seg-', 'vectors-', 'manifest-')):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+        if '' not in keep:
+            # 早期格式的语料已合并进新的段
+            for name in self.LEGACY_FILES:
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,299 @@
+import faiss
+import numpy as np
+
+
+class EmbeddingBuffer:
+    """
+    只追加的向量缓冲区：从段文件加载的向量作为只读部分直接引用（mmap映射，多进程共享页缓存，不复制），
+    新追加的向量写入私有的尾部，尾部容量按倍数增长（均摊O(1)追加）
+    支持float32、float16以及按行缩放的int8量化存储
+    flat索引直接在缓冲区上精确检索（search），向量只保存这一份
+    """
+
+    DTYPES = ('float32', 'float16', 'int8')
+    SEARCH_BLOCK_ROWS = 65536  # 量化存储时每次反量化的行数
+
+    def __init__(self, dimension, dtype='float32', capacity=1024):
+        """
+        :param dimension: 向量维度
+        :param dtype: 存储类型，可选值：'float32', 'float16', 'int8'
+        :param capacity: 尾部初始容量（行数）
+        """
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported embedding dtype: {dtype}")
+        self.dimension = dimension
+        self.dtype = dtype
+        self._size = 0
+        self._tail_capacity = max(capacity, 1)
+        # 只读部分与尾部放在同一个元组中整体替换，查询只读取一次保证一致
+        # 只读部分：((start, data, scales), ...)；尾部：(start, data, scales)，int8量化时scales为每行的缩放系数
+        self._state = ((), self._allocate(0, self._tail_capacity))
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        tail_start, data, _ = self._state[1]
+        return tail_start + data.shape[0]
+
+    def _allocate(self, start, capacity):
+        data = np.empty((capacity, self.dimension), dtype=self.dtype)
+        scales = np.empty(capacity, dtype='float32') if self.dtype == 'int8' else None
+        return start, data, scales
+
+    def _reserve(self, size):
+        """
+        确保尾部容量不小于size，不足时按2倍扩容，只复制尾部
+        """
+        parts, (tail_start, data, scales) = self._state
+        if size - tail_start <= data.shape[0]:
+            return
+        capacity = max(data.shape[0], self._tail_capacity)
+        while capacity < size - tail_start:
+            capacity *= 2
+        used = self._size - tail_start
+        tail = self._allocate(tail_start, capacity)
+        tail[1][:used] = data[:used]
+        if scales is not None:
+            tail[2][:used] = scales[:used]
+        self._state = (parts, tail)
+
+    def _seal(self):
+        """
+        把尾部已有的行转为只读部分，之后的追加写入新的尾部
+        """
+        parts, (tail_start, data, scales) = self._state
+        used = self._size - tail_start
+        if used:
+            parts += ((tail_start, data[:used], scales[:used] if scales is not None else None),)
+        self._state = (parts, self._allocate(self._size, 0))
+
+    def _blocks(self, start, end):
+        """
+        [start, end)行在各部分中的视图，不复制
+        :return: [(start, data, scales), ...]
+        """
+        parts, tail = self._state
+        blocks = []
+        for part_start, data, scales in parts + (tail,):
+            lo, hi = max(start, part_start), min(end, part_start + data.shape[0])
+            if lo < hi:
+                blocks.append((lo, data[lo - part_start:hi - part_start],
+                               scales[lo - part_start:hi - part_start] if scales is not None else None))
+        return blocks
+
+    def _dequantize(self, data, scales):
+        if self.dtype == 'float32':
+            return data
+        if self.dtype == 'float16':
+            return data.astype('float32')
+        return data.astype('float32') * scales[:, None]
+
+    def append(self, embeddings):
+        """
+        追加一批向量
+        :param embeddings: 向量矩阵 (n, dimension)
+        :return: 新向量的行号范围
+        """
+        embeddings = np.asarray(embeddings, dtype='float32')
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dimension:
+            raise ValueError(f'embedding dimension {embeddings.shape[-1]} does not match buffer dimension {self.dimension}')
+
+        start, end = self._size, self._size + embeddings.shape[0]
+        self._reserve(end)
+        tail_start, data, scales = self._state[1]
+        lo, hi = start - tail_start, end - tail_start
+        if self.dtype == 'int8':
+            # 对称量化：scale = max|x| / 127
+            row_scales = np.abs(embeddings).max(axis=1) / 127.0
+            row_scales[row_scales == 0] = 1.0
+            data[lo:hi] = np.round(embeddings / row_scales[:, None]).astype('int8')
+            scales[lo:hi] = row_scales
+        else:
+            data[lo:hi] = embeddings
+        self._size = end
+        return range(start, end)
+
+    def extend(self, other):
+        """
+        把另一个缓冲区的全部向量复制到尾部（按原存储类型复制，不重新量化）
+        :return: 新向量的行号范围
+        """
+        if other.dimension != self.dimension or other.dtype != self.dtype:
+            raise ValueError('embedding buffers do not match')
+        start, end = self._size, self._size + len(other)
+        self._reserve(end)
+        tail_start, data, scales = self._state[1]
+        for row, block, block_scales in other._blocks(0, len(other)):
+            lo = start + row - tail_start
+            data[lo:lo + len(block)] = block
+            if scales is not None:
+                scales[lo:lo + len(block)] = block_scales
+        self._size = end
+        return range(start, end)
+
+    def attach(self, other, offset=0):
+        """
+        追加另一个缓冲区（通常是mmap映射的段文件）中从offset开始的行，只引用不复制
+        :return: 新向量的行号范围
+        """
+        if other.dimension != self.dimension or other.dtype != self.dtype:
+            raise ValueError('embedding buffers do not match')
+        self._seal()
+        start = self._size
+        parts = self._state[0] + tuple((start + row - offset, data, scales)
+                                       for row, data, scales in other._blocks(offset, len(other)))
+        self._size = start + len(other) - offset
+        self._state = (parts, self._allocate(self._size, 0))
+        return range(start, self._size)
+
+    def replace(self, start, end, load):
+        """
+        把[start, end)行换成内容相同的另一个缓冲区（通常是覆盖这些行的段文件，mmap映射），
+        私有内存中的行随之释放；[start, end)不是恰好由完整的部分组成时不替换
+        :param load: 返回替换用缓冲区的函数，只在可以替换时调用
+        :return: 是否替换
+        """
+        if end > self._state[1][0]:
+            # 尾部只能整体替换
+            if end != self._size:
+                return False
+            self._seal()
+        parts, tail = self._state
+        starts = [part[0] for part in parts]
+        ends = [part[0] + part[1].shape[0] for part in parts]
+        if start not in starts or end not in ends:
+            return False
+        other = load()
+        if len(other) != end - start or other.dimension != self.dimension or other.dtype != self.dtype:
+            return False
+        first, last = starts.index(start), ends.index(end) + 1
+        replaced = tuple((start + row, data, scales) for row, data, scales in other._blocks(0, len(other)))
+        self._state = (parts[:first] + replaced + parts[last:], tail)
+        return True
+
+    def truncate(self, size):
+        """
+        丢弃size之后的行（追加后后续步骤失败时回滚）
+        """
+        if size >= self._size:
+            return
+        parts, tail = self._state
+        if size < tail[0]:
+            parts = tuple((start, data[:size - start], scales[:size - start] if scales is not None else None)
+                          for start, data, scales in parts if start < size)
+            tail = self._allocate(size, 0)
+        self._state = (parts, tail)
+        self._size = size
+
+    def get(self, start=0, end=None):
+        """
+        获取[start, end)行的float32向量
+        float32存储且范围在同一部分内时直接返回连续视图，不复制；其他情况返回副本
+        """
+        end = self._size if end is None else min(end, self._size)
+        blocks = self._blocks(start, end)
+        if not blocks:
+            return np.zeros((0, self.dimension), dtype='float32')
+        if len(blocks) == 1:
+            return self._dequantize(blocks[0][1], blocks[0][2])
+        return np.concatenate([self._dequantize(data, scales) for _, data, scales in blocks])
+
+    def as_float32(self):
+        """
+        获取全部向量的float32矩阵
+        """
+        return self.get(0, self._size)
+
+    def search(self, queries, k, metric=faiss.METRIC_INNER_PRODUCT, end=None):
+        """
+        在前end行上精确检索最近邻
+        float32存储时直接在各部分上计算；量化存储时分块反量化，临时内存不超过SEARCH_BLOCK_ROWS行
+        :param queries: 查询向量 (m, dimension)
+        :param k: 返回数量
+        :param metric: faiss度量
+        :param end: 参与检索的行数，默认为全部
+        :return: (D, I)，与faiss索引的search相同，不足k个时I补-1
+        """
+        end = self._size if end is None else min(end, self._size)
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        blocks = []
+        for start, data, scales in self._blocks(0, end):
+            step = data.shape[0] if self.dtype == 'float32' else self.SEARCH_BLOCK_ROWS
+            for lo in range(0, data.shape[0], step):
+                blocks.append((start + lo, data[lo:lo + step], scales[lo:lo + step] if scales is not None else None))
+        if len(blocks) <= 1:
+            data = self._dequantize(blocks[0][1], blocks[0][2]) if blocks else self.get(0, 0)
+            return faiss.knn(queries, np.ascontiguousarray(data), k, metric=metric)
+        distances, ids = [], []
+        for start, data, scales in blocks:
+            D, I = faiss.knn(queries, np.ascontiguousarray(self._dequantize(data, scales)), k, metric=metric)
+            I[I >= 0] += start
+            distances.append(D)
+            ids.append(I)
+        # 合并各块的top-k
+        D, I = np.hstack(distances), np.hstack(ids)
+        order = np.argsort(-D if metric == faiss.METRIC_INNER_PRODUCT else D, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def memory_usage(self):
+        """
+        内存占用统计，mmap映射的行与私有内存分开统计
+        :return: 字节数统计字典
+        """
+        row_bytes = np.dtype(self.dtype).itemsize * self.dimension + (4 if self.dtype == 'int8' else 0)
+        parts, (_, tail, _) = self._state
+        mapped_rows = sum(data.shape[0] for _, data, _ in parts if isinstance(data, np.memmap))
+        private_rows = sum(data.shape[0] for _, data, _ in parts if not isinstance(data, np.memmap)) + tail.shape[0]
+        return {
+            'dtype': self.dtype,
+            'dimension': self.dimension,
+            'num_vectors': self._size,
+            'capacity': self.capacity,
+            'used_bytes': row_bytes * self._size,
+            'allocated_bytes': row_bytes * (mapped_rows + private_rows),
+            'mapped_bytes': row_bytes * mapped_rows,
+            'private_bytes': row_bytes * private_rows,
+            'bytes_per_vector': row_bytes,
+        }
+
+    def save(self, path, start=0, end=None):
+        """
+        把[start, end)行保存为.npy文件，int8量化时缩放系数另存为<path>.scales.npy
+        """
+        end = self._size if end is None else min(end, self._size)
+        blocks = self._blocks(start, end)
+        if len(blocks) == 1:
+            data, scales = blocks[0][1], blocks[0][2]
+        elif blocks:
+            data = np.concatenate([block[1] for block in blocks])
+            scales = np.concatenate([block[2] for block in blocks]) if self.dtype == 'int8' else None
+        else:
+            data = np.zeros((0, self.dimension), dtype=self.dtype)
+            scales = np.zeros(0, dtype='float32')
+        np.save(path, data)
+        if self.dtype == 'int8':
+            np.save(path + '.scales.npy', scales)
+
+    @classmethod
+    def load(cls, path, dtype='float32', mmap=True):
+        """
+        从.npy文件加载，mmap模式下只读映射，之后追加的行写入私有尾部，映射的部分不复制
+        """
+        data = np.load(path, mmap_mode='r' if mmap else None)
+        scales = np.load(path + '.scales.npy', mmap_mode='r' if mmap else None) if dtype == 'int8' else None
+        buffer = cls(data.shape[1], dtype=dtype)
+        buffer._size = data.shape[0]
+        buffer._state = (((0, data, scales),), buffer._allocate(buffer._size, 0))
+        return buffer
+
+    @classmethod
+    def concat(cls, buffers):
+        """
+        按顺序拼接多个缓冲区
+        """
+        buffer = cls(buffers[0].dimension, dtype=buffers[0].dtype, capacity=sum(len(b) for b in buffers))
+        for other in buffers:
+            buffer.extend(other)
+        return buffer
@@ -0,0 +1,123 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(text):
+    """
+    查询文本归一化：全角转半角（NFKC）、小写、合并空白
+    """
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', text)).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    查询向量缓存：进程内LRU（带TTL），可选Redis作为共享的二级缓存
+    以(模型, 归一化查询)为键，值为float32字节
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, redis_client=None, redis_prefix='rag:emb:'):
+        """
+        :param max_size: 进程内缓存的最大条目数
+        :param ttl: 过期时间（秒），0表示不过期
+        :param redis_client: redis.Redis实例，为None时只使用进程内缓存
+        :param redis_prefix: Redis键前缀
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.redis_prefix = redis_prefix
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'redis_hits': 0, 'misses': 0, 'redis_errors': 0}
+
+    @staticmethod
+    def key(model, text):
+        return f'{model}\x00{normalize_query(text)}'
+
+    def _redis_key(self, key):
+        return self.redis_prefix + hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _put_local(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, model, text):
+        """
+        查找缓存的查询向量
+        :param model: 嵌入模型名称
+        :param text: 查询文本
+        :return: float32向量（只读），未命中时返回None
+        """
+        key = self.key(model, text)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._items.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return np.frombuffer(value, dtype='float32')
+                del self._items[key]
+
+        if self.redis_client is not None:
+            try:
+                value = self.redis_client.get(self._redis_key(key))
+            except Exception:
+                value = None
+                self._count('redis_errors')
+            if value is not None:
+                self._put_local(key, value)
+                self._count('redis_hits')
+                return np.frombuffer(value, dtype='float32')
+
+        self._count('misses')
+        return None
+
+    def put(self, model, text, embedding):
+        """
+        写入查询向量
+        :param model: 嵌入模型名称
+        :param text: 查询文本
+        :param embedding: 向量
+        """
+        key = self.key(model, text)
+        value = np.ascontiguousarray(embedding, dtype='float32').tobytes()
+        self._put_local(key, value)
+        if self.redis_client is not None:
+            try:
+                if self.ttl:
+                    self.redis_client.setex(self._redis_key(key), int(self.ttl), value)
+                else:
+                    self.redis_client.set(self._redis_key(key), value)
+            except Exception:
+                self._count('redis_errors')
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """
+        命中统计
+        """
+        with self._lock:
+            stats = dict(self._stats, size=len(self._items), max_size=self.max_size)
+        lookups = stats['hits'] + stats['redis_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['redis_hits']) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,106 @@
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_CJK = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf]')
+
+
+def estimate_tokens(text):
+    """
+    估算文本的token数：中文按每字一个token，其余按每4个字符一个token
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 1
+
+
+def make_batches(texts, max_batch_tokens=8192, max_batch_size=64, count_tokens=estimate_tokens):
+    """
+    按token预算和条数上限把文本切成连续的小批次，超出预算的单条文本单独成批
+    :param texts: 文本列表
+    :param max_batch_tokens: 每批的token上限
+    :param max_batch_size: 每批的条数上限
+    :param count_tokens: token计数函数
+    :return: [(start, end), ...]，文本下标区间
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        n = count_tokens(text)
+        if i > start and (tokens + n > max_batch_tokens or i - start >= max_batch_size):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+class EmbeddingPipeline:
+    """
+    并发嵌入流水线：按token预算切分小批次，在有界线程池中并发调用嵌入服务，
+    结果保持原顺序，只重试失败的批次（嵌入函数本身不应再重试，否则重试次数相乘）
+    """
+
+    def __init__(self, embed_fn, max_batch_tokens=8192, max_batch_size=64, max_workers=4, max_retries=2,
+                 backoff=0.2):
+        """
+        :param embed_fn: 嵌入函数，输入文本列表，返回同样长度的向量列表
+        :param max_batch_tokens: 每批的token上限
+        :param max_batch_size: 每批的条数上限
+        :param max_workers: 并发请求数
+        :param max_retries: 失败批次的最大重试轮数
+        :param backoff: 退避基数（秒），第n轮重试前最多等待backoff * 2^n
+        """
+        self.embed_fn = embed_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='embedding')
+
+    def _embed_batch(self, texts):
+        embeddings = self.embed_fn(texts)
+        if len(embeddings) != len(texts):
+            raise ValueError(f'embedding service returned {len(embeddings)} vectors for {len(texts)} texts')
+        return embeddings
+
+    def embed(self, texts):
+        """
+        生成全部文本的向量
+        :param texts: 文本列表
+        :return: (向量矩阵 (n, dim) float32, 统计信息)，重试耗尽时抛出最后一个失败批次的异常
+        """
+        start_time = time.perf_counter()
+        batches = make_batches(texts, self.max_batch_tokens, self.max_batch_size)
+        results = [None] * len(batches)
+        pending = list(range(len(batches)))
+        retried = 0
+        for attempt in range(self.max_retries + 1):
+            futures = [(b, self._executor.submit(self._embed_batch, texts[slice(*batches[b])])) for b in pending]
+            failed, error = [], None
+            for b, future in futures:
+                try:
+                    results[b] = future.result()
+                except Exception as e:
+                    failed.append(b)
+                    error = e
+            if not failed:
+                break
+            if attempt == self.max_retries:
+                raise error
+            retried += len(failed)
+            pending = failed
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+        embeddings = np.array([e for batch in results for e in batch], dtype='float32')
+        seconds = time.perf_counter() - start_time
+        return embeddings, {
+            'batches': len(batches),
+            'retried_batches': retried,
+            'seconds': round(seconds, 3),
+            'chunks_per_sec': round(len(texts) / seconds, 2) if seconds > 0 else 0.0,
+        }
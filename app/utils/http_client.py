@@ -0,0 +1,193 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.config import config
+
+
+class HttpClient:
+    """
+    单个后端服务的HTTP客户端：复用keep-alive连接池，带连接/读取超时、
+    有界重试（指数退避+随机抖动）和延迟统计
+    只有幂等请求（GET，或idempotent=True的后端的POST）在读取超时、连接中断和RETRY_STATUS时重试；
+    其他POST（如发送微信消息）只在连接超时（请求未发出）时重试，避免重复发送
+    """
+
+    # 这些状态码视为后端临时不可用，幂等请求可以重试
+    RETRY_STATUS = (429, 502, 503, 504)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, name, url=None, connect_timeout=3.0, read_timeout=30.0, max_retries=2,
+                 backoff=0.2, max_backoff=2.0, pool_size=10, latency_window=1000, idempotent=False):
+        """
+        :param name: 后端名称，用于统计
+        :param url: 默认请求地址
+        :param connect_timeout: 连接超时（秒）
+        :param read_timeout: 读取超时（秒）
+        :param max_retries: 最大重试次数（不含首次请求）
+        :param backoff: 退避基数（秒），第n次重试最多等待backoff * 2^n
+        :param max_backoff: 单次退避上限（秒）
+        :param pool_size: 连接池大小
+        :param latency_window: 用于计算分位数的最近请求数
+        :param idempotent: 该后端的POST请求是否可以安全重试（如嵌入、rerank等纯计算请求）
+        """
+        self.name = name
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.idempotent = idempotent
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._stats = {'requests': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0}
+
+    @property
+    def session(self):
+        """
+        连接池按进程创建，Celery等fork出的子进程不复用父进程的连接
+        """
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def _sleep_before_retry(self, attempt):
+        # full jitter：在[0, backoff * 2^attempt]内随机等待，避免重试集中打到后端
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+
+    @staticmethod
+    def _rewind(files):
+        """
+        重试前把上传文件指针移回开头
+        """
+        for value in (files or {}).values():
+            f = value[1] if isinstance(value, tuple) else value
+            if hasattr(f, 'seek'):
+                f.seek(0)
+
+    def _record(self, elapsed_ms, error, retries):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['retries'] += retries
+            self._stats['total_ms'] += elapsed_ms
+            if error:
+                self._stats['errors'] += 1
+            self._latencies.append(elapsed_ms)
+
+    def request(self, method, url=None, timeout=None, retries=None, **kwargs):
+        """
+        发送请求，幂等请求在连接失败、超时和RETRY_STATUS状态码时重试，非幂等请求只在连接超时时重试
+        :param method: HTTP方法
+        :param url: 请求地址，默认使用构造时的url
+        :param timeout: 超时，默认(connect_timeout, read_timeout)
+        :param retries: 本次请求的最大重试次数，默认使用max_retries
+        :return: requests.Response，重试耗尽时抛出最后一次的异常或返回最后一次的响应
+        """
+        url = url or self.url
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        retries = self.max_retries if retries is None else retries
+        idempotent = self.idempotent or method.upper() in self.IDEMPOTENT_METHODS
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # 连接超时时请求还没有发出，其他错误时后端可能已经处理了请求
+                if attempt >= retries or not (idempotent or isinstance(e, requests.exceptions.ConnectTimeout)):
+                    self._record((time.perf_counter() - start) * 1000, True, attempt)
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUS or attempt >= retries or not idempotent:
+                    self._record((time.perf_counter() - start) * 1000, response.status_code >= 400, attempt)
+                    return response
+                response.close()
+            self._sleep_before_retry(attempt)
+            self._rewind(kwargs.get('files'))
+            attempt += 1
+
+    def post(self, url=None, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url=None, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def metrics(self):
+        """
+        延迟统计
+        :return: 请求数、错误数、重试数、平均/分位延迟（毫秒）
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2)
+
+        return {
+            'url': self.url,
+            'requests': stats['requests'],
+            'errors': stats['errors'],
+            'retries': stats['retries'],
+            'avg_ms': round(stats['total_ms'] / stats['requests'], 2) if stats['requests'] else 0.0,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, url=None, **kwargs):
+    """
+    获取（或创建）指定后端的共享客户端
+    超时、重试和连接池参数依次取：[http]中的<name>_<key>、kwargs、[http]中的<key>、内置默认值
+    :param name: 后端名称，如'embedding', 'rerank', 'generate', 'audio', 'wechat'
+    :param url: 默认请求地址
+    :param kwargs: 该后端的默认参数（HttpClient的构造参数）
+    :return: HttpClient
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if name not in _clients:
+            options = {}
+            for key, getter, default in (('connect_timeout', config.getfloat, 3.0),
+                                         ('read_timeout', config.getfloat, 30.0),
+                                         ('max_retries', config.getint, 2),
+                                         ('backoff', config.getfloat, 0.2),
+                                         ('pool_size', config.getint, 10)):
+                value = getter('http', f'{name}_{key}')
+                if value is None:
+                    value = kwargs[key] if key in kwargs else getter('http', key, default)
+                options[key] = value
+            _clients[name] = HttpClient(name, url, **{**kwargs, **options})
+        return _clients[name]
+
+
+def metrics():
+    """
+    所有后端的延迟统计
+    """
+    return {name: client.metrics() for name, client in list(_clients.items())}
@@ -0,0 +1,63 @@
+import json
+
+
+def _iter_openai(response):
+    """
+    解析OpenAI兼容接口的SSE流（/v1/completions或/v1/chat/completions）
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        for choice in json.loads(data).get('choices', []):
+            text = choice.get('text')
+            if text is None:
+                text = (choice.get('delta') or {}).get('content')
+            if text:
+                yield text
+
+
+def _iter_vllm(response, prompt):
+    """
+    解析vLLM /generate接口的流：以\\0分隔的JSON，text为截至当前的完整输出（含prompt）
+    """
+    previous = ''
+    for chunk in response.iter_lines(delimiter=b'\0'):
+        if not chunk:
+            continue
+        text = json.loads(chunk.decode('utf-8')).get('text', '')
+        if isinstance(text, list):
+            text = text[0] if text else ''
+        if text.startswith(prompt):
+            text = text[len(prompt):]
+        if len(text) > len(previous):
+            yield text[len(previous):]
+            previous = text
+
+
+def stream_completion(client, prompt, api='vllm', url=None, model=None, temperature=0.7, max_tokens=512):
+    """
+    以流式方式调用大模型，逐段返回新生成的文本
+    :param client: app.utils.http_client.HttpClient
+    :param prompt: 提示词
+    :param api: 接口格式，可选值：'vllm'（/generate）, 'openai'（/v1/completions）
+    :param url: 流式接口地址，默认使用client的地址
+    :param model: 模型名称（openai格式需要）
+    :param temperature: 采样温度
+    :param max_tokens: 最大生成token数
+    :return: 文本片段生成器
+    """
+    payload = {'prompt': prompt, 'temperature': temperature, 'max_tokens': max_tokens, 'stream': True}
+    if model:
+        payload['model'] = model
+    response = client.post(url, json=payload, stream=True)
+    try:
+        response.raise_for_status()
+        if api == 'openai':
+            yield from _iter_openai(response)
+        else:
+            yield from _iter_vllm(response, prompt)
+    finally:
+        response.close()
@@ -0,0 +1,1571 @@
+import os
+import re
+import sys
+import json
+import math
+import uuid
+import bisect
+import shutil
+import hashlib
+import threading
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+from app.utils.corpus_store import CorpusStore
+from app.utils.embedding_buffer import EmbeddingBuffer
+from app.utils.vector_index import VectorIndex, normalize_embeddings
+from app.utils.tokenizer import WhitespaceTokenizer
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def chunk_hash(text):
+    """
+    文本块内容哈希：NFKC归一化并合并空白后取blake2b摘要，只有空白或全半角差异的文本块视为相同
+    :param text: 文本块
+    :return: 16字节摘要
+    """
+    normalized = _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).digest()
+
+
+class ReadWriteLock:
+    """
+    读写锁：允许多个读者并发，写者独占
+    FAISS的search可以并发执行，但不能与add同时进行
+    写者优先：有写者等待时新的读者阻塞，持续的查询不会让上传一直等待
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers > 0:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class MappedChunks:
+    """
+    mmap映射的文本块序列（段文件中的texts.bin和offsets.npy），只读
+    """
+
+    def __init__(self, data, offsets):
+        """
+        :param data: UTF-8文本字节（np.memmap uint8）
+        :param offsets: 各文本块在data中的起始偏移，长度为块数+1
+        """
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, _ = item.indices(len(self))
+            return MappedChunks(self.data, self.offsets[start:max(start, stop) + 1])
+        start, end = int(self.offsets[item]), int(self.offsets[item + 1])
+        return self.data[start:end].tobytes().decode('utf-8')
+
+    @property
+    def nbytes(self):
+        return int(self.offsets[-1] - self.offsets[0]) + self.offsets.nbytes
+
+
+class ChunkStore:
+    """
+    文本块存储：从段加载的部分通过mmap映射（多进程共享页缓存），新增部分保存在私有的内存列表（尾部）中
+    """
+
+    def __init__(self, data=None, offsets=None):
+        """
+        :param data: 持久化的UTF-8文本字节（np.memmap uint8）
+        :param offsets: 各文本块在data中的起始偏移，长度为块数+1
+        """
+        parts = (MappedChunks(data, offsets),) if offsets is not None else ()
+        size = len(parts[0]) if parts else 0
+        # 各部分的起始doc_id、各部分（MappedChunks或封存的尾部列表）和尾部放在同一个元组中整体替换
+        self._state = ((0,) if parts else (), parts, size, [])
+
+    def __len__(self):
+        _, _, tail_start, tail = self._state
+        return tail_start + len(tail)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        starts, parts, tail_start, tail = self._state
+        if item < 0:
+            item += tail_start + len(tail)
+        if item >= tail_start:
+            return tail[item - tail_start]
+        i = bisect.bisect_right(starts, item) - 1
+        return parts[i][item - starts[i]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def extend(self, chunks):
+        self._state[3].extend(chunks)
+
+    def _seal(self):
+        starts, parts, tail_start, tail = self._state
+        if tail:
+            starts, parts = starts + (tail_start,), parts + (tail,)
+        self._state = (starts, parts, tail_start + len(tail), [])
+
+    def attach(self, other, offset=0):
+        """
+        追加另一个存储（通常是mmap映射的段）中从offset开始的文本块，只引用不复制
+        """
+        self._seal()
+        starts, parts, size, tail = self._state
+        for other_start, part in zip(*other._state[:2]):
+            if other_start + len(part) > offset:
+                lo = max(offset - other_start, 0)
+                starts, parts = starts + (size,), parts + (part[lo:],)
+                size += len(part) - lo
+        if other._state[3]:
+            # other的尾部已复制为只读部分
+            other_tail = list(other._state[3][max(offset - other._state[2], 0):])
+            starts, parts = starts + (size,), parts + (other_tail,)
+            size += len(other_tail)
+        self._state = (starts, parts, size, tail)
+
+    def replace(self, start, end, load):
+        """
+        把[start, end)范围的文本块换成内容相同的另一个存储（通常是覆盖这些文本块的段，mmap映射），
+        私有内存中的文本块随之释放；[start, end)不是恰好由完整的部分组成时不替换
+        :param load: 返回替换用存储的函数，只在可以替换时调用
+        :return: 是否替换
+        """
+        if end > self._state[2]:
+            if end != len(self):
+                return False
+            self._seal()
+        starts, parts, tail_start, tail = self._state
+        ends = [part_start + len(part) for part_start, part in zip(starts, parts)]
+        if start not in starts or end not in ends:
+            return False
+        other = load()
+        if len(other) != end - start or other._state[3]:
+            return False
+        first, last = starts.index(start), ends.index(end) + 1
+        other_starts, other_parts = other._state[:2]
+        self._state = (starts[:first] + tuple(start + other_start for other_start in other_starts) + starts[last:],
+                       parts[:first] + other_parts + parts[last:], tail_start, tail)
+        return True
+
+    def memory_usage(self):
+        """
+        文本占用字节数：映射部分按文件大小，内存部分按Python字符串对象大小
+        """
+        _, parts, _, tail = self._state
+        total = 0
+        for part in parts + (tail,):
+            if isinstance(part, MappedChunks):
+                total += part.nbytes
+            else:
+                total += sum(sys.getsizeof(chunk) for chunk in part)
+        return total
+
+    @staticmethod
+    def write(directory, chunks):
+        """
+        把文本块保存为texts.bin和offsets.npy
+        """
+        offsets = np.zeros(len(chunks) + 1, dtype='int64')
+        with open(os.path.join(directory, 'texts.bin'), 'wb') as f:
+            position = 0
+            for i, chunk in enumerate(chunks):
+                encoded = chunk.encode('utf-8')
+                f.write(encoded)
+                position += len(encoded)
+                offsets[i + 1] = position
+        np.save(os.path.join(directory, 'offsets.npy'), offsets)
+
+    @staticmethod
+    def concat(directory, sources):
+        """
+        按顺序拼接多个目录中保存的文本块，直接复制字节，不解码
+        """
+        parts = [np.zeros(1, dtype='int64')]
+        position = 0
+        with open(os.path.join(directory, 'texts.bin'), 'wb') as f:
+            for source in sources:
+                with open(os.path.join(source, 'texts.bin'), 'rb') as src:
+                    shutil.copyfileobj(src, f)
+                offsets = np.load(os.path.join(source, 'offsets.npy'))
+                parts.append(offsets[1:] + position)
+                position += int(offsets[-1])
+        np.save(os.path.join(directory, 'offsets.npy'), np.concatenate(parts))
+
+    @classmethod
+    def load(cls, directory):
+        offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        path = os.path.join(directory, 'texts.bin')
+        # 空文件无法mmap
+        if os.path.getsize(path) > 0:
+            data = np.memmap(path, dtype='uint8', mode='r')
+        else:
+            data = np.zeros(0, dtype='uint8')
+        return cls(data, offsets)
+
+
+class IndexSnapshot:
+    """
+    索引快照：查询开始时记录已发布的文档数和BM25统计量，
+    查询过程中只读取doc_id < num_docs的数据，不受并发上传影响
+    """
+
+    def __init__(self, num_docs, total_len):
+        self.num_docs = num_docs
+        self.total_len = total_len
+
+    @property
+    def avgdl(self):
+        return self.total_len / self.num_docs if self.num_docs else 0.0
+
+
+class PostingsPart:
+    """
+    倒排索引中一段连续文档的CSR矩阵（行=词，列=段内doc_id），创建后不再修改
+    从段文件加载的部分各数组以mmap方式只读映射，多进程共享页缓存
+    """
+
+    __slots__ = ('start', 'lo', 'terms', 'vocab', 'indptr', 'doc_ids', 'tfs', 'doc_lens', 'private')
+
+    def __init__(self, start, terms, vocab, indptr, doc_ids, tfs, doc_lens, lo=0, private=False):
+        """
+        :param start: 段内doc_id为0的文档的全局doc_id
+        :param terms: term_id -> 词
+        :param vocab: 词 -> term_id
+        :param doc_lens: 段内各文档长度
+        :param lo: 只包含段内doc_id >= lo的文档（部分同步的段）
+        :param private: 是否为合并生成的私有数组（可以继续与增量段合并）
+        """
+        self.start = start
+        self.lo = lo
+        self.terms = terms
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.private = private
+
+    @property
+    def first(self):
+        return self.start + self.lo
+
+    @property
+    def end(self):
+        return self.start + len(self.doc_lens)
+
+    def sliced(self, start, lo):
+        """
+        引用相同数组、doc_id重新编号的只读部分（不与其他索引的增量段合并）
+        """
+        return PostingsPart(start, self.terms, self.vocab, self.indptr, self.doc_ids, self.tfs, self.doc_lens, lo)
+
+    def postings(self, term):
+        """
+        :return: (全局doc_ids, tfs)，词不存在时为(None, None)
+        """
+        term_id = self.vocab.get(term)
+        # 私有部分与索引共享词表，合并之后新增的词不在该部分中
+        if term_id is None or term_id >= len(self.indptr) - 1:
+            return None, None
+        start, end = int(self.indptr[term_id]), int(self.indptr[term_id + 1])
+        ids, tfs = self.doc_ids[start:end], self.tfs[start:end]
+        if self.lo:
+            i = int(np.searchsorted(ids, self.lo))
+            ids, tfs = ids[i:], tfs[i:]
+        if len(ids) == 0:
+            return None, None
+        return (np.add(ids, self.start, dtype='int64') if self.start else ids), tfs
+
+    def coo(self, start, end):
+        """
+        [start, end)范围内文档的倒排项
+        :return: (term_ids, 全局doc_ids, tfs)
+        """
+        doc_ids = np.asarray(self.doc_ids, dtype='int64') + self.start
+        terms = np.repeat(np.arange(len(self.indptr) - 1, dtype='int64'), np.diff(self.indptr))
+        mask = (doc_ids >= max(start, self.first)) & (doc_ids < end)
+        return terms[mask], doc_ids[mask], np.asarray(self.tfs)[mask]
+
+
+class PostingsIndex:
+    """
+    增量维护的倒排索引，由若干按词组织的CSR矩阵（行=词，列=文档）和一个增量段组成
+    - CSR部分：各覆盖一段连续的文档，从段文件加载的部分以mmap方式只读映射，多进程共享页缓存，不复制
+    - 增量段：新文档的倒排表，超过阈值后与末尾的私有CSR部分向量化合并（均摊O(新文档)），映射的部分不参与合并
+    """
+
+    def __init__(self, merge_ratio=0.1, merge_min_docs=1024):
+        """
+        :param merge_ratio: 增量段文档数超过末尾私有CSR部分的该比例时合并
+        :param merge_min_docs: 增量段合并的最小文档数
+        """
+        self.merge_ratio = merge_ratio
+        self.merge_min_docs = merge_min_docs
+        self.vocab = {}  # 增量段和私有CSR部分的词 -> term_id
+        self._terms = []  # term_id -> 词
+        self.total_len = 0
+        self._num_docs = 0
+        # CSR部分、增量段和增量段的文档长度放在同一个元组中整体替换，查询只读取一次保证一致
+        # 增量段：{term_id: ([doc_id, ...], [tf, ...])}，doc_id为全局编号；文档长度从末尾CSR部分之后开始
+        self._state = ((), {}, np.zeros(1024, dtype='int32'))
+
+    def __len__(self):
+        return self._num_docs
+
+    @staticmethod
+    def _delta_start(parts):
+        return parts[-1].end if parts else 0
+
+    def _lens(self, num_docs, state=None):
+        """
+        前num_docs个文档的长度
+        """
+        parts, _, delta_lens = state or self._state
+        arrays = [part.doc_lens[part.lo:] for part in parts]
+        arrays.append(delta_lens[:max(num_docs - self._delta_start(parts), 0)])
+        return np.concatenate(arrays)[:num_docs]
+
+    @property
+    def doc_lens(self):
+        return self._lens(self._num_docs)
+
+    @property
+    def num_terms(self):
+        """
+        各部分词表合并后的词数
+        """
+        vocabs = {id(part.vocab): part.vocab for part in self._state[0]}
+        vocabs[id(self.vocab)] = self.vocab
+        if len(vocabs) == 1:
+            return len(self.vocab)
+        return len(set().union(*vocabs.values()))
+
+    def memory_usage(self):
+        """
+        倒排表占用字节数：CSR数组和文档长度（映射部分按文件大小），增量段按Python列表和整数对象大小
+        """
+        parts, delta, delta_lens = self._state
+        arrays = {}
+        for part in parts:
+            for array in (part.indptr, part.doc_ids, part.tfs, part.doc_lens):
+                arrays[id(array)] = array.nbytes
+        total = sum(arrays.values()) + delta_lens.nbytes
+        for ids, tfs in list(delta.values()):
+            total += sys.getsizeof(ids) + sys.getsizeof(tfs) + sum(map(sys.getsizeof, ids))
+        return total
+
+    def _term_id(self, term):
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = len(self._terms)
+            self._terms.append(term)
+            self.vocab[term] = term_id
+        return term_id
+
+    def add(self, tokenized_docs):
+        """
+        追加已分词的文档，doc_id按追加顺序连续分配
+        :param tokenized_docs: 分词后的文档列表 [[token, ...], ...]
+        """
+        parts, delta, delta_lens = self._state
+        delta_start = self._delta_start(parts)
+        for tokens in tokenized_docs:
+            doc_id = self._num_docs
+            for term, tf in Counter(tokens).items():
+                term_id = self._term_id(term)
+                posting = delta.get(term_id)
+                if posting is None:
+                    posting = ([], [])
+                    delta[term_id] = posting
+                # 先写tf再写doc_id，并发读取时len(doc_ids) <= len(tfs)
+                posting[1].append(tf)
+                posting[0].append(doc_id)
+            i = doc_id - delta_start
+            if i >= len(delta_lens):
+                grown = np.zeros(len(delta_lens) * 2, dtype='int32')
+                grown[:i] = delta_lens[:i]
+                delta_lens = grown
+                self._state = (parts, delta, delta_lens)
+            delta_lens[i] = len(tokens)
+            self.total_len += len(tokens)
+            self._num_docs = doc_id + 1
+
+        self._maybe_merge()
+
+    def attach(self, other, offset=0):
+        """
+        追加另一个倒排索引（通常是从段文件加载的）中从offset开始的文档，doc_id依次排在已有文档之后
+        other的CSR部分直接引用，mmap映射的数组不复制；两者的增量段先合并，保持文档顺序
+        :param other: doc_id从0开始的PostingsIndex
+        :param offset: 跳过other的前offset个文档
+        """
+        other.merge()
+        self.merge()
+        start = self._num_docs
+        attached = []
+        for part in other._state[0]:
+            if part.end > offset:
+                attached.append(part.sliced(part.start + start - offset, max(part.lo, offset - part.start)))
+        self._state = (self._state[0] + tuple(attached), {}, np.zeros(1024, dtype='int32'))
+        self.total_len += int(np.sum(other.doc_lens[offset:]))
+        self._num_docs = start + len(other) - offset
+
+    def replace(self, start, end, load):
+        """
+        把[start, end)范围的文档换成内容相同的另一个倒排索引（通常是覆盖这些文档的段，mmap映射），
+        私有内存中的倒排表随之释放；[start, end)不是恰好由完整的部分组成时不替换
+        :param load: 返回替换用倒排索引的函数，只在可以替换时调用
+        :return: 是否替换
+        """
+        if end > self._delta_start(self._state[0]):
+            if end != self._num_docs:
+                return False
+            self.merge()
+        parts, delta, delta_lens = self._state
+        firsts = [part.first for part in parts]
+        ends = [part.end for part in parts]
+        if start not in firsts or end not in ends:
+            return False
+        other = load()
+        other.merge()
+        if len(other) != end - start:
+            return False
+        first, last = firsts.index(start), ends.index(end) + 1
+        replaced = tuple(part.sliced(part.start + start, part.lo) for part in other._state[0])
+        self._state = (parts[:first] + replaced + parts[last:], delta, delta_lens)
+        return True
+
+    def _maybe_merge(self):
+        parts = self._state[0]
+        private_docs = len(parts[-1].doc_lens) if parts and parts[-1].private else 0
+        if self._num_docs - self._delta_start(parts) >= max(self.merge_min_docs, private_docs * self.merge_ratio):
+            self.merge()
+
+    def merge(self):
+        """
+        将增量段合并进末尾的私有CSR部分（末尾是映射的部分时新建一个），增量段为空时不重建
+        """
+        parts, delta, delta_lens = self._state
+        delta_start = self._delta_start(parts)
+        if self._num_docs == delta_start:
+            return
+        last = parts[-1] if parts and parts[-1].private else None
+        start = last.start if last is not None else delta_start
+
+        # 末尾的私有部分展开为COO，与增量段拼接后按(term_id, doc_id)排序重建CSR
+        all_terms, all_docs, all_tfs, lens = [], [], [], []
+        if last is not None:
+            terms, doc_ids, tfs = last.coo(start, delta_start)
+            all_terms.append(terms)
+            all_docs.append(doc_ids)
+            all_tfs.append(tfs)
+            lens.append(last.doc_lens)
+            parts = parts[:-1]
+        for term_id, (ids, term_tfs) in list(delta.items()):
+            n = len(ids)
+            all_terms.append(np.full(n, term_id, dtype='int64'))
+            all_docs.append(np.asarray(ids[:n], dtype='int64'))
+            all_tfs.append(np.asarray(term_tfs[:n], dtype='int32'))
+        lens.append(delta_lens[:self._num_docs - delta_start])
+        part = self._build_part(start, self._terms, self.vocab, all_terms, all_docs, all_tfs, np.concatenate(lens))
+        self._state = (parts + (part,), {}, np.zeros(1024, dtype='int32'))
+
+    @staticmethod
+    def _build_part(start, terms, vocab, all_terms, all_docs, all_tfs, doc_lens):
+        num_terms = len(terms)
+        all_terms = np.concatenate(all_terms) if all_terms else np.zeros(0, dtype='int64')
+        all_docs = np.concatenate(all_docs) - start if all_docs else np.zeros(0, dtype='int64')
+        all_tfs = np.concatenate(all_tfs) if all_tfs else np.zeros(0, dtype='int32')
+        order = np.lexsort((all_docs, all_terms))
+        indptr = np.zeros(num_terms + 1, dtype='int64')
+        np.cumsum(np.bincount(all_terms, minlength=num_terms), out=indptr[1:])
+        return PostingsPart(start, terms, vocab, indptr, all_docs[order].astype('int32'),
+                            all_tfs[order].astype('int32'), np.asarray(doc_lens, dtype='int32'), private=True)
+
+    def postings(self, term, num_docs, state=None):
+        """
+        获取某个词在快照范围内的倒排区间
+        :param term: 词
+        :param num_docs: 快照文档数
+        :param state: 查询开始时读取的索引状态，默认读取当前状态
+        :return: (doc_ids, tfs) 两个numpy数组，词不存在时为(None, None)
+        """
+        parts, delta, _ = state or self._state
+        parts_ids, parts_tfs = [], []
+        for part in parts:
+            if part.first >= num_docs:
+                break
+            ids, tfs = part.postings(term)
+            if ids is not None:
+                parts_ids.append(ids)
+                parts_tfs.append(tfs)
+        term_id = self.vocab.get(term)
+        posting = delta.get(term_id) if term_id is not None else None
+        if posting is not None:
+            n = len(posting[0])
+            parts_ids.append(np.asarray(posting[0][:n], dtype='int32'))
+            parts_tfs.append(np.asarray(posting[1][:n], dtype='int32'))
+        if not parts_ids:
+            return None, None
+        ids = parts_ids[0] if len(parts_ids) == 1 else np.concatenate(parts_ids)
+        term_tfs = parts_tfs[0] if len(parts_tfs) == 1 else np.concatenate(parts_tfs)
+        # doc_id递增，截断到快照范围
+        df = int(np.searchsorted(ids, num_docs))
+        return ids[:df], term_tfs[:df]
+
+    def save(self, directory, prefix='', start=0, end=None):
+        """
+        把[start, end)范围内的文档合成一个CSR矩阵保存（保存后doc_id从0开始），直接使用入库时统计的词频，不重新分词
+        terms.json记录词表（按term_id排序），indptr划分每个词的倒排区间
+        :param directory: 保存目录
+        :param prefix: 文件名前缀，用于在同一目录保存多个倒排索引
+        :param start: 起始doc_id
+        :param end: 结束doc_id，默认为全部文档
+        """
+        end = self._num_docs if end is None else end
+        parts, delta, _ = self._state
+        # 各部分的词表不同，只映射[start, end)范围内出现的词
+        terms, vocab = [], {}
+        all_terms, all_docs, all_tfs = [], [], []
+
+        def collect(part_terms, term_ids, doc_ids, tfs):
+            used, inverse = np.unique(term_ids, return_inverse=True)
+            remap = np.zeros(len(used), dtype='int64')
+            for i, term_id in enumerate(used.tolist()):
+                term = part_terms[term_id]
+                if term not in vocab:
+                    vocab[term] = len(terms)
+                    terms.append(term)
+                remap[i] = vocab[term]
+            all_terms.append(remap[inverse])
+            all_docs.append(doc_ids)
+            all_tfs.append(tfs)
+
+        for part in parts:
+            if part.first < end and part.end > start:
+                collect(part.terms, *part.coo(start, end))
+        delta_terms, delta_docs, delta_tfs = [], [], []
+        for term_id, (ids, term_tfs) in list(delta.items()):
+            # 并发追加时len(doc_ids) <= len(tfs)，范围之后的文档被过滤
+            n = len(ids)
+            ids = np.asarray(ids[:n], dtype='int64')
+            mask = (ids >= start) & (ids < end)
+            delta_terms.append(np.full(int(mask.sum()), term_id, dtype='int64'))
+            delta_docs.append(ids[mask])
+            delta_tfs.append(np.asarray(term_tfs[:n], dtype='int32')[mask])
+        if delta_terms:
+            collect(self._terms, np.concatenate(delta_terms), np.concatenate(delta_docs), np.concatenate(delta_tfs))
+        part = self._build_part(start, terms, vocab, all_terms, all_docs, all_tfs, self._lens(end)[start:])
+
+        with open(os.path.join(directory, f'{prefix}terms.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(os.path.join(directory, f'{prefix}postings_indptr.npy'), part.indptr)
+        np.save(os.path.join(directory, f'{prefix}postings_doc_ids.npy'), part.doc_ids)
+        np.save(os.path.join(directory, f'{prefix}postings_tfs.npy'), part.tfs)
+        np.save(os.path.join(directory, f'{prefix}doc_lens.npy'), part.doc_lens)
+
+    @classmethod
+    def exists(cls, directory, prefix=''):
+        return os.path.exists(os.path.join(directory, f'{prefix}terms.json'))
+
+    @classmethod
+    def load(cls, directory, prefix='', **kwargs):
+        """
+        加载CSR倒排表，数组以mmap方式映射，不复制数据
+        :param directory: 保存目录
+        :param prefix: 文件名前缀
+        :param kwargs: 构造参数
+        """
+        index = cls(**kwargs)
+        with open(os.path.join(directory, f'{prefix}terms.json'), 'r', encoding='utf-8') as f:
+            terms = json.load(f)
+        vocab = {term: term_id for term_id, term in enumerate(terms)}
+        indptr = np.load(os.path.join(directory, f'{prefix}postings_indptr.npy'), mmap_mode='r')
+        doc_ids = np.load(os.path.join(directory, f'{prefix}postings_doc_ids.npy'), mmap_mode='r')
+        tfs = np.load(os.path.join(directory, f'{prefix}postings_tfs.npy'), mmap_mode='r')
+        doc_lens = np.load(os.path.join(directory, f'{prefix}doc_lens.npy'), mmap_mode='r')
+        index._num_docs = len(doc_lens)
+        index.total_len = int(np.sum(doc_lens))
+        index._state = ((PostingsPart(0, terms, vocab, indptr, doc_ids, tfs, doc_lens),), {},
+                        np.zeros(1024, dtype='int32'))
+        return index
+
+
+class BM25Index(PostingsIndex):
+    """
+    增量维护的BM25索引
+    查询对每个查询词取CSR矩阵中的一段连续倒排区间向量化计算得分，用argpartition选取top-k
+    """
+
+    def __init__(self, k1=1.5, b=0.75, **kwargs):
+        """
+        :param k1: 词频饱和参数
+        :param b: 文档长度归一化参数
+        """
+        super().__init__(**kwargs)
+        self.k1 = k1
+        self.b = b
+        # 长度归一化缓存：(num_docs, total_len, k1 * (1 - b + b * dl / avgdl))
+        self._norm_cache = None
+
+    def _norms(self, num_docs, total_len):
+        """
+        文档长度归一化项，每次语料变化后向量化计算一次并缓存
+        """
+        cache = self._norm_cache
+        if cache is not None and cache[0] == num_docs and cache[1] == total_len:
+            return cache[2]
+        avgdl = total_len / num_docs if num_docs and total_len else 1.0
+        norms = self.k1 * (1 - self.b + self.b * self._lens(num_docs).astype('float32') / avgdl)
+        self._norm_cache = (num_docs, total_len, norms)
+        return norms
+
+    def _term_scores(self, term, state, snapshot, norms):
+        """
+        单个查询词在词-文档矩阵中对应行的BM25得分
+        :return: (doc_ids, scores)，查询词不存在时返回(None, None)
+        """
+        num_docs = snapshot.num_docs
+        ids, term_tfs = self.postings(term, num_docs, state)
+        if ids is None or len(ids) == 0:
+            return None, None
+        df = len(ids)
+        idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        term_tfs = term_tfs.astype('float32')
+        return ids, idf * term_tfs * (self.k1 + 1) / (term_tfs + norms[ids])
+
+    def _score(self, query_tokens, state, snapshot, term_cache=None):
+        """
+        计算查询命中文档的得分（稀疏向量与词-文档矩阵的点积）
+        :param term_cache: 批量查询时共享的{词: (doc_ids, scores)}，每个词的得分行只计算一次
+        :return: (doc_ids, scores)，只包含至少命中一个查询词的文档
+        """
+        num_docs = snapshot.num_docs
+        norms = self._norms(num_docs, snapshot.total_len)
+        hit_ids, hit_scores = [], []
+        for term in set(query_tokens):
+            if term_cache is None:
+                ids, scores = self._term_scores(term, state, snapshot, norms)
+            else:
+                if term not in term_cache:
+                    term_cache[term] = self._term_scores(term, state, snapshot, norms)
+                ids, scores = term_cache[term]
+            if ids is None:
+                continue
+            hit_ids.append(ids)
+            hit_scores.append(scores)
+        if not hit_ids:
+            return np.zeros(0, dtype='int32'), np.zeros(0, dtype='float32')
+        if len(hit_ids) == 1:
+            return hit_ids[0], hit_scores[0]
+        all_ids = np.concatenate(hit_ids)
+        all_scores = np.concatenate(hit_scores)
+        if len(all_ids) * 8 > num_docs:
+            # 命中数接近语料规模时直接按doc_id稠密累加，避免排序
+            scores = np.bincount(all_ids, weights=all_scores, minlength=num_docs)
+            ids = np.flatnonzero(scores)
+            return ids, scores[ids]
+        # 按文档聚合多个查询词的得分，代价与命中数成正比
+        ids, inverse = np.unique(all_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=all_scores, minlength=len(ids))
+        return ids, scores
+
+    def top_n(self, query_tokens, top_n, snapshot):
+        """
+        计算查询的BM25得分并返回前top_n个文档
+        idf采用log(1 + (N - n + 0.5) / (n + 0.5))，恒为正，无需全局重算
+        :param query_tokens: 分词后的查询
+        :param top_n: 返回结果数量
+        :param snapshot: 索引快照
+        :return: [(doc_id, score), ...]
+        """
+        if snapshot.num_docs == 0:
+            return []
+        ids, scores = self._score(query_tokens, self._state, snapshot)
+        return _top_k(ids, scores, top_n)
+
+    def top_n_batch(self, query_tokens_list, top_n, snapshot):
+        """
+        批量计算多个查询的BM25得分，查询间共享的词只取一次倒排表、计算一次得分
+        :param query_tokens_list: 分词后的查询列表
+        :param top_n: 每个查询返回的结果数量
+        :param snapshot: 索引快照
+        :return: [[(doc_id, score), ...], ...]
+        """
+        if snapshot.num_docs == 0:
+            return [[] for _ in query_tokens_list]
+        state = self._state
+        term_cache = {}
+        results = []
+        for query_tokens in query_tokens_list:
+            ids, scores = self._score(query_tokens, state, snapshot, term_cache)
+            results.append(_top_k(ids, scores, top_n))
+        return results
+
+
+class KeywordIndex(PostingsIndex):
+    """
+    字符二元组倒排索引，用于关键词子串匹配
+    先用关键词各二元组的倒排表求交得到候选文档，再校验子串，代价与候选数成正比而非语料规模
+    """
+
+    @staticmethod
+    def bigrams(text):
+        return [text[i:i + 2] for i in range(len(text) - 1)]
+
+    def add_texts(self, texts):
+        """
+        追加文档原文
+        :param texts: 文本列表
+        """
+        self.add(self.bigrams(text) for text in texts)
+
+    def candidates(self, keyword, num_docs, state=None):
+        """
+        获取可能包含关键词的文档（包含关键词的全部二元组）
+        :param keyword: 关键词，长度至少为2
+        :param num_docs: 快照文档数
+        :param state: 查询开始时读取的索引状态
+        :return: 候选doc_id数组
+        """
+        state = state or self._state
+        postings = []
+        for bigram in set(self.bigrams(keyword)):
+            ids, _ = self.postings(bigram, num_docs, state)
+            if ids is None or len(ids) == 0:
+                return np.zeros(0, dtype='int32')
+            postings.append(ids)
+        # 从最短的倒排表开始求交
+        postings.sort(key=len)
+        candidates = postings[0]
+        for ids in postings[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates
+
+
+def _top_k(ids, scores, k):
+    """
+    用argpartition选出得分最高的k个文档，只对这k个排序
+    :return: [(doc_id, score), ...]
+    """
+    if len(ids) == 0 or k <= 0:
+        return []
+    if len(ids) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(ids))
+    part = part[np.argsort(-scores[part], kind='stable')]
+    return [(int(ids[i]), float(scores[i])) for i in part]
+
+
+class HybridIndex:
+    """
+    混合检索索引管理器：文档、BM25倒排索引和FAISS向量索引统一增量维护
+    上传只处理新增分块，查询通过快照读取一致的数据
+    flat（以及IVF训练前）直接在向量缓冲区上精确检索，不再在IndexFlat中保存第二份向量；
+    HNSW/IVF索引自身保存向量（或编码），与缓冲区各占一份内存，分别统计
+    """
+
+    VECTOR_CHECKPOINT_RATIO = 0.25
+
+    def __init__(self, tokenizer=None, k1=1.5, b=0.75, embedding_dtype='float32', vector_config=None, dedup=False):
+        """
+        :param tokenizer: 分词器（app.utils.tokenizer），默认按空白分词
+        :param k1: BM25参数k1
+        :param b: BM25参数b
+        :param embedding_dtype: 向量缓冲区存储类型，可选值：'float32', 'float16', 'int8'
+        :param vector_config: 向量索引配置（VectorIndex的构造参数），默认为flat、内积度量
+        :param dedup: 是否跳过内容哈希相同的重复文本块
+        """
+        self.tokenizer = tokenizer or WhitespaceTokenizer()
+        self.documents = ChunkStore()
+        self.bm25 = BM25Index(k1=k1, b=b)
+        self.keyword_index = KeywordIndex()
+        self.vector_config = dict(vector_config or {})
+        # 内积度量下向量入库和查询前做L2归一化，得分即余弦相似度
+        self.normalize = self.vector_config.get('metric', 'ip') == 'ip'
+        self.vector_index = None  # VectorIndex，首次上传时按向量维度创建
+        self.dimension = None
+        self._num_docs = 0
+        self._total_len = 0
+        self._write_lock = threading.Lock()
+        self._rw_lock = ReadWriteLock()
+        self._rebuild_thread = None  # 后台训练IVF索引的线程
+        self.embedding_dtype = embedding_dtype
+        self.embeddings = None  # EmbeddingBuffer，首次上传时按向量维度创建
+        self.dedup = dedup
+        # 内容哈希 -> 首个doc_id；_hashes按doc_id顺序保存，用于持久化
+        self.chunk_ids = {}
+        self._hashes = []
+        # 已持久化的语料目录及其manifest，save只写入manifest之后新增的文档
+        self._corpus_dir = None
+        self._manifest = None
+        self._persisted_docs = 0  # 已发布到语料目录的文档数
+        self._rewrite = False  # 下次发布时是否整体重写语料
+        self._attached = set()  # 内存中以mmap方式完整映射的段
+        self._mmap = True
+        self._save_lock = threading.Lock()  # 串行化save，不阻塞上传和查询
+
+    def __len__(self):
+        return self._num_docs
+
+    def snapshot(self):
+        """
+        获取当前已发布数据的快照
+        """
+        return IndexSnapshot(self._num_docs, self._total_len)
+
+    def _register_hashes(self, hashes):
+        for digest in hashes:
+            self.chunk_ids.setdefault(digest, len(self._hashes))
+            self._hashes.append(digest)
+
+    def _unique_indices(self, hashes):
+        """
+        索引中没有、且在本批次内首次出现的哈希的下标
+        """
+        seen = set()
+        keep = []
+        for i, digest in enumerate(hashes):
+            if digest not in self.chunk_ids and digest not in seen:
+                seen.add(digest)
+                keep.append(i)
+        return keep
+
+    def new_chunks(self, chunks):
+        """
+        过滤掉索引中已有的和本批次内重复的文本块，用于在生成向量之前跳过重复内容
+        :param chunks: 文本块列表
+        :return: 需要入库的文本块列表（保持原顺序）
+        """
+        return [chunks[i] for i in self._unique_indices([chunk_hash(chunk) for chunk in chunks])]
+
+    def add(self, chunks, embeddings):
+        """
+        追加新的文本块及其向量，开启dedup时跳过重复的文本块
+        :param chunks: 文本块列表
+        :param embeddings: 对应的向量矩阵 (len(chunks), dim)
+        :return: 新文本块的doc_id范围
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(chunks):
+            raise ValueError('embeddings shape does not match chunks')
+        if self.normalize:
+            embeddings = normalize_embeddings(embeddings)
+
+        hashes = [chunk_hash(chunk) for chunk in chunks]
+        if self.dedup:
+            keep = self._unique_indices(hashes)
+            if len(keep) < len(chunks):
+                chunks = [chunks[i] for i in keep]
+                hashes = [hashes[i] for i in keep]
+                embeddings = embeddings[keep]
+
+        # 分词在锁外完成，每个分块只在入库时分词一次，词频缓存在倒排表中
+        tokenized = [self.tokenizer(chunk) for chunk in chunks]
+        bigrams = [KeywordIndex.bigrams(chunk) for chunk in chunks]
+
+        with self._write_lock:
+            if self.dedup:
+                # 在写锁内再检查一次，并发上传相同内容时只有一份入库
+                keep = [i for i, digest in enumerate(hashes) if digest not in self.chunk_ids]
+                if len(keep) < len(chunks):
+                    chunks = [chunks[i] for i in keep]
+                    hashes = [hashes[i] for i in keep]
+                    tokenized = [tokenized[i] for i in keep]
+                    bigrams = [bigrams[i] for i in keep]
+                    embeddings = embeddings[keep]
+            if not chunks:
+                return range(len(self.documents), len(self.documents))
+            return self._append(chunks, hashes, tokenized, bigrams, embeddings)
+
+    def add_and_persist(self, directory, chunks, embeddings):
+        """
+        多个进程共享语料目录时的追加：在语料锁内先加载其他进程发布的文档，追加后立即把新文档写成段并发布，
+        各进程的doc_id与磁盘上的顺序一致；只写入本批次的文档，段合并和向量检查点由save完成
+        发布失败时文档保留在内存中，下次保存时重试
+        :param directory: 语料目录
+        :return: 新文本块的doc_id范围
+        """
+        store = CorpusStore(directory)
+        with self._save_lock, store.lock():
+            self._sync(store)
+            doc_ids = self.add(chunks, embeddings)
+            self._publish(store)
+        return doc_ids
+
+    def _append(self, chunks, hashes, tokenized, bigrams, embeddings):
+        """
+        追加已分词、已归一化的文本块（调用方持有_write_lock）
+        :return: 新文本块的doc_id范围
+        """
+        if self.dimension is None:
+            self._init_vectors(embeddings.shape[1])
+        elif embeddings.shape[1] != self.dimension:
+            raise ValueError(f'embedding dimension {embeddings.shape[1]} does not match index dimension {self.dimension}')
+
+        start = len(self.documents)
+        # 先写入向量（可能失败的一步），失败时回滚缓冲区；文档和倒排表之后才追加，doc_id与FAISS id始终一致
+        rows = self.embeddings.append(embeddings)
+        try:
+            self._add_vectors(rows)
+        except Exception:
+            self.embeddings.truncate(rows.start)
+            raise
+        self.documents.extend(chunks)
+        self._register_hashes(hashes)
+        self.bm25.add(tokenized)
+        self.keyword_index.add(bigrams)
+
+        # 所有结构更新完成后再发布，查询不会看到写了一半的数据
+        self._total_len = self.bm25.total_len
+        self._num_docs = len(self.documents)
+        return range(start, start + len(chunks))
+
+    def _init_vectors(self, dimension):
+        self.dimension = dimension
+        self.vector_index = VectorIndex(dimension, **self.vector_config)
+        self.embeddings = EmbeddingBuffer(dimension, dtype=self.embedding_dtype)
+
+    def _add_vectors(self, rows):
+        """
+        把缓冲区中rows范围内的新向量加入向量索引（调用方持有_write_lock）
+        需要重新训练时在后台线程中用已有的向量构建新索引，上传不等待训练；期间查询和追加继续使用旧索引
+        """
+        if self.vector_index.active_type != 'flat':
+            # flat检索直接读取缓冲区，只有HNSW/IVF需要写入FAISS；float32存储时直接使用缓冲区中的连续视图
+            embeddings = np.ascontiguousarray(self.embeddings.get(rows.start, rows.stop))
+            self._rw_lock.acquire_write()
+            try:
+                self.vector_index.add(embeddings)
+            finally:
+                self._rw_lock.release_write()
+        # 新向量加入成功后再开始训练，回滚的行不会进入新索引；fork出的子进程中父进程的训练线程不存活，重新开始
+        thread = self._rebuild_thread
+        if (thread is None or not thread.is_alive()) and self.vector_index.needs_rebuild(len(self.embeddings)):
+            self._rebuild_thread = threading.Thread(target=self._rebuild_vectors, args=(len(self.embeddings),),
+                                                    name='vector-rebuild', daemon=True)
+            self._rebuild_thread.start()
+
+    def _rebuild_vectors(self, size):
+        """
+        后台线程：用前size个向量训练并构建新索引，在写锁内补上构建期间新增的向量后替换旧索引
+        缓冲区只追加，前size行在构建期间不会变化；期间向量索引被整体替换时放弃本次结果
+        """
+        vector_index = self.vector_index
+        try:
+            new_index = vector_index.build(self.embeddings.get(0, size))
+            with self._write_lock:
+                if self.vector_index is not vector_index:
+                    return
+                total = len(self.embeddings)
+                if total > size:
+                    new_index.add(np.ascontiguousarray(self.embeddings.get(size, total)))
+                self._rw_lock.acquire_write()
+                try:
+                    vector_index.swap(new_index)
+                finally:
+                    self._rw_lock.release_write()
+        except Exception as e:
+            print(f"向量索引训练失败：{str(e)}")
+        finally:
+            with self._write_lock:
+                if self._rebuild_thread is threading.current_thread():
+                    self._rebuild_thread = None
+
+    def wait_vector_rebuild(self, timeout=None):
+        """
+        等待后台的向量索引训练完成
+        :param timeout: 超时时间（秒），默认一直等待
+        :return: 是否已完成
+        """
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def search_bm25(self, query, top_n, snapshot=None):
+        """
+        BM25检索
+        :param query: 查询文本
+        :param top_n: 返回结果数量
+        :param snapshot: 索引快照，默认使用当前快照
+        :return: [(doc_id, score), ...]
+        """
+        snapshot = snapshot or self.snapshot()
+        return self.bm25.top_n(self.tokenizer(query), top_n, snapshot)
+
+    def search_bm25_batch(self, queries, top_n, snapshot=None):
+        """
+        批量BM25检索
+        :param queries: 查询文本列表
+        :param top_n: 每个查询返回的结果数量
+        :param snapshot: 索引快照，默认使用当前快照
+        :return: [[(doc_id, score), ...], ...]
+        """
+        snapshot = snapshot or self.snapshot()
+        return self.bm25.top_n_batch([self.tokenizer(query) for query in queries], top_n, snapshot)
+
+    def search_keywords(self, keywords, top_n, snapshot=None):
+        """
+        关键词匹配：得分为文档中出现的关键词个数（子串匹配）
+        通过二元组倒排索引获取候选文档，只校验候选文档
+        :param keywords: 关键词列表，重复的关键词重复计分
+        :param top_n: 返回结果数量
+        :param snapshot: 索引快照，默认使用当前快照
+        :return: [(doc_id, score), ...]，按得分降序，同分按doc_id升序
+        """
+        snapshot = snapshot or self.snapshot()
+        num_docs = snapshot.num_docs
+        state = self.keyword_index._state
+        scores = Counter()
+        matched = {}
+        for kw in keywords:
+            if kw not in matched:
+                if len(kw) < 2:
+                    candidates = range(num_docs)
+                else:
+                    candidates = self.keyword_index.candidates(kw, num_docs, state)
+                matched[kw] = [int(doc_id) for doc_id in candidates if kw in self.documents[int(doc_id)]]
+            for doc_id in matched[kw]:
+                scores[doc_id] += 1
+        return sorted(sorted(scores.items()), key=lambda x: x[1], reverse=True)[:top_n]
+
+    def search_vector(self, query_embedding, top_n, snapshot=None, nprobe=None, ef_search=None, min_score=None):
+        """
+        向量检索
+        :param query_embedding: 查询向量 (1, dim)
+        :param top_n: 返回结果数量
+        :param snapshot: 索引快照，默认使用当前快照
+        :param nprobe: IVF查询的聚类数，默认使用配置值
+        :param ef_search: HNSW查询搜索宽度，默认使用配置值
+        :param min_score: 相似度阈值，低于该值的结果被过滤
+        :return: [(doc_id, similarity), ...]，内积度量下为余弦相似度，L2度量下为1 / (1 + d)
+        """
+        query_embedding = np.asarray(query_embedding, dtype='float32').reshape(1, -1)
+        return self.search_vector_batch(query_embedding, top_n, snapshot, nprobe=nprobe, ef_search=ef_search,
+                                        min_score=min_score)[0]
+
+    def search_vector_batch(self, query_embeddings, top_n, snapshot=None, nprobe=None, ef_search=None, min_score=None):
+        """
+        批量向量检索，多个查询向量在一次FAISS search中完成
+        :param query_embeddings: 查询向量矩阵 (m, dim)
+        :return: [[(doc_id, similarity), ...], ...]，参数和得分含义同search_vector
+        """
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+        snapshot = snapshot or self.snapshot()
+        if snapshot.num_docs == 0 or self.vector_index is None:
+            return [[] for _ in range(len(query_embeddings))]
+        if self.normalize:
+            query_embeddings = normalize_embeddings(query_embeddings)
+
+        if self.vector_index.active_type == 'flat':
+            # 缓冲区只追加，快照范围内的行不会变化，不需要加锁
+            D, I = self.embeddings.search(query_embeddings, top_n, self.vector_index.faiss_metric, end=snapshot.num_docs)
+        else:
+            self._rw_lock.acquire_read()
+            try:
+                D, I = self.vector_index.search(query_embeddings, top_n, nprobe=nprobe, ef_search=ef_search)
+            finally:
+                self._rw_lock.release_read()
+
+        # 过滤掉快照之后新增的文档、FAISS的空位(-1)和低于阈值的结果
+        similarities = self.vector_index.similarity(D)
+        batch_results = []
+        for row_ids, row_similarities in zip(I, similarities):
+            results = []
+            for i, similarity in zip(row_ids, row_similarities):
+                if 0 <= i < snapshot.num_docs and (min_score is None or similarity >= min_score):
+                    results.append((int(i), float(similarity)))
+            batch_results.append(results)
+        return batch_results
+
+    def get_document(self, doc_id):
+        return self.documents[doc_id]
+
+    def vector_recall(self, k=10, num_queries=100, nprobe=None, ef_search=None, seed=0):
+        """
+        从已索引向量中抽样作为查询，计算当前向量索引相对精确检索的recall@k，查询自身从两边结果中去掉
+        :param k: top-k
+        :param num_queries: 抽样查询数
+        :param nprobe: IVF查询的聚类数
+        :param ef_search: HNSW查询搜索宽度
+        :param seed: 抽样随机种子
+        :return: 统计字典
+        """
+        if self.vector_index is None or self._num_docs == 0:
+            return {'index_type': None, 'recall': None, 'k': k, 'num_queries': 0}
+        self._rw_lock.acquire_read()
+        try:
+            embeddings = self.embeddings.get(0, self._num_docs)
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)
+            if self.vector_index.active_type == 'flat':
+                # 在缓冲区上精确检索
+                recall = 1.0
+            else:
+                sample = np.sort(sample)
+                recall = self.vector_index.recall(embeddings[sample], embeddings, k=k, nprobe=nprobe,
+                                                  ef_search=ef_search, query_ids=sample)
+        finally:
+            self._rw_lock.release_read()
+        return {
+            'index_type': self.vector_index.active_type,
+            'recall': recall,
+            'k': k,
+            'num_queries': len(sample),
+        }
+
+    def memory_usage(self):
+        """
+        各组成部分的内存占用统计，HNSW/IVF索引与向量缓冲区各占一份，flat索引只有缓冲区；
+        total_bytes包括文本、向量、向量索引以及BM25和关键词倒排表
+        :return: 统计字典
+        """
+        num_docs = self._num_docs
+        embeddings = self.embeddings.memory_usage() if self.embeddings is not None else None
+        vector_index_bytes = self.vector_index.memory_usage() if self.vector_index is not None else 0
+        text_bytes = self.documents.memory_usage()
+        bm25_bytes = self.bm25.memory_usage()
+        keyword_bytes = self.keyword_index.memory_usage()
+        total = (text_bytes + (embeddings['used_bytes'] if embeddings else 0) + vector_index_bytes
+                 + bm25_bytes + keyword_bytes)
+        return {
+            'num_docs': num_docs,
+            'text_bytes': text_bytes,
+            'embeddings': embeddings,
+            'vector_index_type': self.vector_index.active_type if self.vector_index is not None else None,
+            'vector_index_bytes': vector_index_bytes,
+            'bm25_terms': self.bm25.num_terms,
+            'bm25_bytes': bm25_bytes,
+            'keyword_bigrams': self.keyword_index.num_terms,
+            'keyword_bytes': keyword_bytes,
+            'total_bytes': total,
+            'bytes_per_chunk': total / num_docs if num_docs else 0,
+        }
+
+    def save(self, directory):
+        """
+        持久化语料：只把上次保存之后新增的文档写成一个不可变的段，然后原子发布新版本的manifest
+        快照范围内的数据只追加、不修改，段在写锁之外写入，不阻塞上传和查询
+        HNSW/IVF索引在未覆盖的文档超过已覆盖的VECTOR_CHECKPOINT_RATIO倍或重新训练后保存检查点，
+        加载时只追加检查点之后的向量；检查点和段合并在语料锁之外写入，持锁时只发布
+        :param directory: 语料目录
+        :return: 发布的manifest
+        """
+        store = CorpusStore(directory)
+        with self._save_lock:
+            with store.lock():
+                self._sync(store)
+                self._publish(store)
+            self._checkpoint_vectors(store)
+            self._compact(store)
+            return self._manifest
+
+    def sync(self, directory):
+        """
+        加载其他进程发布到语料目录、本进程还没有的文档
+        :param directory: 语料目录
+        :return: 新加载的文档数
+        """
+        store = CorpusStore(directory)
+        with self._save_lock, store.lock():
+            return self._sync(store)
+
+    def _sync(self, store):
+        """
+        加载已发布的manifest中本进程之后的文档，并以该manifest为基础继续追加（调用方持有语料锁）
+        本进程有未保存的文档、而其他进程又发布了新文档时，两者的doc_id冲突，抛出RuntimeError
+        """
+        published = store.manifest()
+        if self._corpus_dir != store.directory:
+            if self._num_docs:
+                # 保存到新的目录：下次发布时整体写入，覆盖目录中已有的语料
+                self._corpus_dir, self._manifest, self._persisted_docs, self._rewrite = store.directory, None, 0, True
+                return 0
+            # 空索引直接接管目录中已有的语料
+            self._corpus_dir, self._manifest, self._persisted_docs, self._rewrite = store.directory, None, 0, False
+        if published is None:
+            return 0
+
+        start = self._num_docs
+        if published['num_docs'] > self._persisted_docs:
+            if self._num_docs > self._persisted_docs:
+                raise RuntimeError(f'{self._num_docs - self._persisted_docs} unsaved documents conflict with '
+                                   f'documents published to {store.directory}')
+            for segment in published['segments']:
+                if segment['end'] > self._num_docs:
+                    offset = self._num_docs - segment['start']
+                    self._sync_segment(store.path(segment['name']), offset)
+                    if offset == 0:
+                        self._attached.add(segment['name'])
+        self._persisted_docs = published['num_docs']
+        if not self._rewrite:
+            self._manifest = published
+            self._rebase(store)
+        return self._num_docs - start
+
+    def _sync_segment(self, path, offset):
+        """
+        追加其他进程发布的一个段中从offset开始的文档，段中的向量已经归一化
+        """
+        with self._write_lock:
+            rows = self._attach_segment(path, offset, mmap=self._mmap)
+            if self.vector_index is not None:
+                self._add_vectors(rows)
+            self._total_len = self.bm25.total_len
+            self._num_docs = len(self.documents)
+
+    def _attach_segment(self, path, offset=0, mmap=True, postings=True):
+        """
+        追加一个段中从offset开始的文档：文本、向量和倒排表以mmap方式只读映射（多进程共享页缓存），
+        不复制、不重新分词，之后新增的文档写入各结构私有的尾部
+        :param postings: 是否加载段内的BM25倒排表（分词器变化时由调用方重新分词）
+        :return: 新文档的doc_id范围
+        """
+        start = len(self.documents)
+        self.documents.attach(ChunkStore.load(path), offset)
+        self._register_hashes(row.tobytes() for row in self._segment_hashes(path)[offset:])
+        if postings:
+            self.bm25.attach(self._segment_bm25(path), offset)
+        self.keyword_index.attach(self._segment_keywords(path), offset)
+        embeddings_path = os.path.join(path, 'embeddings.npy')
+        if self.dimension is not None or os.path.exists(embeddings_path):
+            embeddings = EmbeddingBuffer.load(embeddings_path, dtype=self.embedding_dtype, mmap=mmap)
+            if self.dimension is None:
+                self._init_vectors(embeddings.dimension)
+            self.embeddings.attach(embeddings, offset)
+        return range(start, len(self.documents))
+
+    def _rebase(self, store):
+        """
+        把内存中已发布的文档换成语料目录中对应段的mmap映射（调用方持有语料锁）
+        本进程写入的段、合并后的段与内存中的数据相同，替换后私有内存释放、各进程共享页缓存，
+        内存中的部分数也随段合并保持O(log n)
+        """
+        if self._manifest is None or not self._mmap:
+            return
+        segments = self._manifest['segments']
+        self._attached &= {segment['name'] for segment in segments}
+        with self._write_lock:
+            for segment in segments:
+                name, start, end = segment['name'], segment['start'], segment['end']
+                if name in self._attached or end > self._num_docs:
+                    continue
+                path = store.path(name)
+                replaced = [
+                    self.documents.replace(start, end, lambda: ChunkStore.load(path)),
+                    self.bm25.replace(start, end, lambda: self._segment_bm25(path)),
+                    self.keyword_index.replace(start, end, lambda: self._segment_keywords(path)),
+                ]
+                if self.embeddings is not None:
+                    replaced.append(self.embeddings.replace(start, end, lambda: EmbeddingBuffer.load(
+                        os.path.join(path, 'embeddings.npy'), dtype=self.embedding_dtype)))
+                if all(replaced):
+                    self._attached.add(name)
+
+    def _publish(self, store):
+        """
+        把上次发布之后新增的文档写成一个段，基于已同步的manifest发布新版本（调用方持有语料锁）
+        """
+        with self._write_lock:
+            num_docs, total_len = self._num_docs, self._total_len
+        base = self._manifest
+        start = base['num_docs'] if base else 0
+        if base is not None and num_docs == start:
+            return
+        segments = list(base['segments']) if base else []
+        if num_docs > start:
+            segments.append(self._write_segment(store, start, num_docs))
+
+        if base is not None and base.get('vector_file'):
+            vector_file, vector_docs, vector_config = base['vector_file'], base['vector_docs'], base['vector_index']
+        else:
+            vector_file, vector_docs = None, 0
+            vector_config = self.vector_index.config() if self.vector_index is not None else None
+        self._manifest = {
+            'version': self._next_version(store),
+            'num_docs': num_docs,
+            'dimension': self.dimension,
+            'total_len': total_len,
+            'k1': self.bm25.k1,
+            'b': self.bm25.b,
+            'embedding_dtype': self.embedding_dtype,
+            'tokenizer': getattr(self.tokenizer, 'name', None),
+            'vector_index': vector_config,
+            'vector_file': vector_file,
+            'vector_docs': vector_docs,
+            'segments': segments,
+        }
+        store.publish(self._manifest)
+        self._persisted_docs, self._rewrite = num_docs, False
+        self._rebase(store)
+
+    @staticmethod
+    def _next_version(store):
+        published = store.manifest()
+        return (published['version'] if published else 0) + 1
+
+    def _checkpoint_vectors(self, store):
+        """
+        需要时保存HNSW/IVF索引的检查点：锁外写入临时文件，在语料锁内重命名并发布
+        只在索引恰好覆盖已发布的全部文档时保存，检查点与段覆盖相同的文档范围
+        """
+        with self._write_lock:
+            # 序列化只是内存复制
+            manifest = self._manifest
+            if manifest is None or self._num_docs != manifest['num_docs'] or \
+                    not self._needs_vector_checkpoint(manifest, self._num_docs):
+                return
+            num_docs = self._num_docs
+            data, config = self.vector_index.serialize(), self.vector_index.config()
+
+        vector_file = store.vector_file(num_docs)
+        tmp_path = store.path(f"{vector_file}.tmp-{uuid.uuid4().hex}")
+        data.tofile(tmp_path)
+        with store.lock():
+            self._sync(store)
+            manifest = self._manifest
+            if manifest is None or manifest.get('vector_docs', 0) >= num_docs:
+                # 其他进程已经保存了覆盖范围更大的检查点
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, store.path(vector_file))
+            self._manifest = dict(manifest, version=self._next_version(store), vector_file=vector_file,
+                                  vector_docs=num_docs, vector_index=config)
+            store.publish(self._manifest)
+
+    def _needs_vector_checkpoint(self, manifest, num_docs):
+        """
+        是否需要保存HNSW/IVF索引的检查点（flat直接使用各段中的向量，不需要索引文件）
+        """
+        if self.vector_index is None or self.vector_index.active_type == 'flat':
+            return False
+        if not manifest or not manifest.get('vector_file'):
+            return True
+        saved = manifest.get('vector_index') or {}
+        config = self.vector_index.config()
+        if any(saved.get(key) != config[key] for key in ('index_type', 'metric', 'trained_size')):
+            return True
+        covered = manifest['vector_docs']
+        return num_docs - covered >= covered * self.VECTOR_CHECKPOINT_RATIO
+
+    def _write_segment(self, store, start, end):
+        """
+        把[start, end)范围内的文档写成一个段：文本、内容哈希、向量和段内的倒排表（段内doc_id从0开始）
+        调用方持有_save_lock，[start, end)范围内的数据只追加、不修改，在写锁之外读取
+        """
+        path = store.new_segment()
+        chunks = self.documents[start:end]
+        ChunkStore.write(path, chunks)
+        np.save(os.path.join(path, 'chunk_hashes.npy'),
+                np.frombuffer(b''.join(self._hashes[start:end]), dtype='uint8').reshape(-1, 16))
+        if self.embeddings is not None:
+            self.embeddings.save(os.path.join(path, 'embeddings.npy'), start, end)
+        # 倒排表直接取自入库时统计的词频，持有语料锁时不重新分词
+        self.bm25.save(path, start=start, end=end)
+        self.keyword_index.save(path, prefix='keyword_', start=start, end=end)
+        return store.commit_segment(path, start, end)
+
+    def _compact(self, store):
+        """
+        按大小分层合并末尾的段：前一个段不大于其后所有段的文档数之和时一起合并，
+        段数保持O(log n)，每个文档被重写O(log n)次
+        合并在语料锁之外进行，发布时这些段已被其他进程合并则放弃本次结果
+        """
+        manifest = self._manifest
+        segments = manifest['segments'] if manifest else []
+        if len(segments) < 2:
+            return
+        first = len(segments) - 1
+        total = segments[first]['end'] - segments[first]['start']
+        while first > 0 and segments[first - 1]['end'] - segments[first - 1]['start'] <= total:
+            first -= 1
+            total += segments[first]['end'] - segments[first]['start']
+        if len(segments) - first < 2:
+            return
+        merging = segments[first:]
+        try:
+            tmp_path = self._merge_segments(store, merging)
+        except FileNotFoundError:
+            # 段已被其他进程合并并清理
+            return
+        with store.lock():
+            self._sync(store)
+            segments = self._manifest['segments'] if self._manifest else []
+            names = [segment['name'] for segment in segments]
+            if merging[0]['name'] not in names:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+            first = names.index(merging[0]['name'])
+            if segments[first:first + len(merging)] != merging:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+            merged = store.commit_segment(tmp_path, merging[0]['start'], merging[-1]['end'])
+            self._manifest = dict(self._manifest, version=self._next_version(store),
+                                  segments=segments[:first] + [merged] + segments[first + len(merging):])
+            store.publish(self._manifest)
+            self._rebase(store)
+
+    def _merge_segments(self, store, segments):
+        """
+        把相邻的多个段合并写入一个临时段目录，只读写文件，不修改内存中的索引
+        :return: 临时段目录，由调用方commit_segment
+        """
+        paths = [store.path(segment['name']) for segment in segments]
+        path = store.new_segment()
+        try:
+            ChunkStore.concat(path, paths)
+            np.save(os.path.join(path, 'chunk_hashes.npy'), np.concatenate([self._segment_hashes(p) for p in paths]))
+            if self.dimension is not None:
+                EmbeddingBuffer.concat([EmbeddingBuffer.load(os.path.join(p, 'embeddings.npy'), dtype=self.embedding_dtype)
+                                        for p in paths]).save(os.path.join(path, 'embeddings.npy'))
+            for load_postings, prefix in ((self._segment_bm25, ''), (self._segment_keywords, 'keyword_')):
+                index = load_postings(paths[0])
+                for p in paths[1:]:
+                    index.attach(load_postings(p))
+                index.save(path, prefix=prefix)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        return path
+
+    @staticmethod
+    def _segment_hashes(path):
+        hashes_path = os.path.join(path, 'chunk_hashes.npy')
+        if os.path.exists(hashes_path):
+            return np.load(hashes_path)
+        # 早期版本未保存内容哈希
+        hashes = [chunk_hash(chunk) for chunk in ChunkStore.load(path)]
+        return np.frombuffer(b''.join(hashes), dtype='uint8').reshape(-1, 16)
+
+    def _segment_bm25(self, path):
+        return BM25Index.load(path, k1=self.bm25.k1, b=self.bm25.b)
+
+    @staticmethod
+    def _segment_keywords(path):
+        if KeywordIndex.exists(path, prefix='keyword_'):
+            return KeywordIndex.load(path, prefix='keyword_')
+        keyword_index = KeywordIndex()
+        keyword_index.add_texts(ChunkStore.load(path))
+        return keyword_index
+
+    @classmethod
+    def load(cls, directory, tokenizer=None, mmap=True, vector_config=None, dedup=False):
+        """
+        从语料目录加载当前版本的索引，各段以mmap方式只读映射
+        :param directory: 语料目录
+        :param tokenizer: 分词函数
+        :param mmap: 是否以mmap方式加载
+        :param vector_config: 向量索引配置，索引类型与持久化的不同时重新构建
+        :param dedup: 是否跳过内容哈希相同的重复文本块
+        :return: HybridIndex
+        """
+        store = CorpusStore(directory)
+        while True:
+            current = store.current()
+            manifest = store.manifest()
+            if manifest is None:
+                raise FileNotFoundError(f'No corpus found in {directory}')
+            try:
+                return cls._load_manifest(store, manifest, tokenizer, mmap, vector_config, dedup)
+            except FileNotFoundError:
+                # 加载期间其他进程发布了新版本并清理了旧段，按新版本重新加载
+                if store.current() == current:
+                    raise
+
+    @classmethod
+    def _load_manifest(cls, store, meta, tokenizer, mmap, vector_config, dedup):
+        embedding_dtype = meta.get('embedding_dtype', 'float32')
+        vector_config = dict(vector_config or {})
+        hybrid = cls(tokenizer=tokenizer, k1=meta['k1'], b=meta['b'], embedding_dtype=embedding_dtype,
+                     vector_config=vector_config, dedup=dedup)
+        hybrid._mmap = mmap
+        if meta['dimension'] is not None:
+            hybrid._init_vectors(meta['dimension'])
+        same_tokenizer = meta.get('tokenizer') == getattr(hybrid.tokenizer, 'name', None)
+        for segment in meta['segments']:
+            hybrid._attach_segment(store.path(segment['name']), mmap=mmap, postings=same_tokenizer)
+            hybrid._attached.add(segment['name'])
+        if not same_tokenizer:
+            # 分词器配置变化，重新分词一次构建倒排表，下次保存时整体重写语料
+            hybrid.bm25.add(hybrid.tokenizer(chunk) for chunk in hybrid.documents)
+        rewrite = not same_tokenizer
+
+        if meta['dimension'] is not None:
+            # 早期版本未记录度量，均为L2
+            saved_config = {'metric': 'l2', **(meta.get('vector_index') or {})}
+            same_type = vector_config.get('index_type', 'flat') == saved_config.get('index_type', 'flat')
+            same_metric = vector_config.get('metric', 'ip') == saved_config['metric']
+            if not same_metric and hybrid.normalize:
+                # 切换为内积度量时，已持久化的向量需要先归一化，下次保存时整体重写语料
+                embeddings = hybrid.embeddings
+                hybrid.embeddings = EmbeddingBuffer(hybrid.dimension, dtype=embedding_dtype, capacity=len(embeddings))
+                hybrid.embeddings.append(normalize_embeddings(embeddings.as_float32()))
+                rewrite = True
+            # flat（包括训练前的IVF）直接使用缓冲区，不需要读取索引文件
+            saved_flat = saved_config.get('index_type', 'flat') == 'flat' or (
+                saved_config.get('index_type') in ('ivf_flat', 'ivf_pq') and not saved_config.get('trained_size'))
+            if same_type and same_metric and not saved_flat and meta.get('vector_file'):
+                # 查询参数等以当前配置为准，结构参数在下次重新训练时生效
+                config = {**saved_config, **vector_config}
+                hybrid.vector_index = VectorIndex.load(store.path(meta['vector_file']), hybrid.dimension, config, mmap=mmap)
+                if meta['vector_docs'] < meta['num_docs']:
+                    # 追加检查点之后新增的向量
+                    hybrid._add_vectors(range(meta['vector_docs'], meta['num_docs']))
+            else:
+                # 索引类型或度量变化，用持久化的向量重新构建
+                hybrid.vector_index = VectorIndex(hybrid.dimension, **vector_config)
+                all_embeddings = hybrid.embeddings.as_float32()
+                if hybrid.vector_index.needs_rebuild(len(all_embeddings)):
+                    hybrid.vector_index.swap(hybrid.vector_index.build(all_embeddings))
+                elif len(all_embeddings) and hybrid.vector_index.active_type != 'flat':
+                    hybrid.vector_index.add(np.ascontiguousarray(all_embeddings))
+
+        hybrid._total_len = hybrid.bm25.total_len
+        hybrid._num_docs = meta['num_docs']
+        hybrid._corpus_dir, hybrid._persisted_docs, hybrid._rewrite = store.directory, meta['num_docs'], rewrite
+        if not rewrite:
+            hybrid._manifest = meta
+        return hybrid
@@ -0,0 +1,191 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from app.utils.embedding_cache import normalize_query
+from app.utils.rag_index import chunk_hash
+
+
+class Reranker:
+    """
+    rerank组件：按rerank服务返回的index映射结果，
+    (查询哈希, 文本块哈希) -> 得分缓存在有界LRU中，只把未缓存的文本块发送给rerank服务
+    """
+
+    def __init__(self, client, cache_size=10000):
+        """
+        :param client: rerank服务的HttpClient
+        :param cache_size: 得分缓存的最大条目数
+        """
+        self.client = client
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'requests': 0}
+
+    @staticmethod
+    def query_hash(query):
+        return hashlib.blake2b(normalize_query(query).encode('utf-8'), digest_size=16).digest()
+
+    def _request(self, query, texts):
+        """
+        调用rerank服务，返回与texts对应的得分列表（服务未返回的位置为None）
+        """
+        payload = {'query': query, 'documents': texts, 'top_n': len(texts)}
+        response = self.client.post(json=payload)
+        response.raise_for_status()
+        scores = [None] * len(texts)
+        for result in response.json().get('results', []):
+            index = result.get('index')
+            score = result.get('relevance_score', result.get('score'))
+            if index is not None and 0 <= index < len(texts) and score is not None:
+                scores[index] = float(score)
+        return scores
+
+    def scores(self, query, texts):
+        """
+        计算查询与每个文本的相关性得分，已缓存的文本块不再请求
+        :param query: 查询文本
+        :param texts: 文本列表
+        :return: 得分列表，与texts一一对应，rerank服务未返回的位置为None
+        """
+        query_key = self.query_hash(query)
+        keys = [(query_key, chunk_hash(text)) for text in texts]
+        scores = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._cache.get(key)
+                if score is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    scores[i] = score
+            self._stats['hits'] += len(texts) - len(missing)
+            self._stats['misses'] += len(missing)
+        if not missing:
+            return scores
+
+        new_scores = self._request(query, [texts[i] for i in missing])
+        with self._lock:
+            self._stats['requests'] += 1
+            for i, score in zip(missing, new_scores):
+                scores[i] = score
+                if score is not None:
+                    self._cache[keys[i]] = score
+                    self._cache.move_to_end(keys[i])
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query, candidates, top_n):
+        """
+        对候选文档重排
+        :param query: 查询文本
+        :param candidates: [(doc_id, content, score), ...]，按融合得分降序
+        :param top_n: 返回数量
+        :return: [{'doc_id', 'content', 'score', 'rerank_score'}, ...]，
+                 有rerank得分的按得分降序排在前面，没有得分的按原顺序补在后面
+        """
+        if not candidates:
+            return []
+        scores = self.scores(query, [content for _, content, _ in candidates])
+        scored = [(score, i) for i, score in enumerate(scores) if score is not None]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        reranked = []
+        for score, i in scored:
+            doc_id, content, _ = candidates[i]
+            reranked.append({'doc_id': doc_id, 'content': content, 'score': score, 'rerank_score': score})
+        for i, score in enumerate(scores):
+            if score is None:
+                doc_id, content, fused_score = candidates[i]
+                reranked.append({'doc_id': doc_id, 'content': content, 'score': fused_score})
+        return reranked[:top_n]
+
+    def stats(self):
+        """
+        缓存命中统计（按文本块计数）和远程调用次数
+        """
+        with self._lock:
+            stats = dict(self._stats, size=len(self._cache), max_size=self.cache_size)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class RerankBudget:
+    """
+    按RRF融合得分分布决定送去rerank的候选数：
+    第一名得分明显领先时跳过rerank，得分平缓（区分度低）时扩大候选范围
+    """
+
+    MODES = ('fixed', 'adaptive')
+
+    def __init__(self, mode='fixed', fixed_candidates=10, min_candidates=5, max_candidates=20,
+                 skip_gap=0.5, flat_ratio=0.8):
+        """
+        :param mode: 'fixed'（总是rerank前fixed_candidates个）或'adaptive'
+        :param fixed_candidates: 固定模式的候选数，也是统计节省量的基准
+        :param min_candidates: 自适应模式下rerank的最少候选数
+        :param max_candidates: 自适应模式下rerank的最多候选数
+        :param skip_gap: 第一名与第二名的相对分差(s1 - s2) / s1不低于该值时跳过rerank
+        :param flat_ratio: 得分不低于第一名该比例的候选都送去rerank
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported rerank mode: {mode}, expected one of {self.MODES}")
+        self.mode = mode
+        self.fixed_candidates = fixed_candidates
+        self.min_candidates = min_candidates
+        self.max_candidates = max_candidates
+        self.skip_gap = skip_gap
+        self.flat_ratio = flat_ratio
+        self._lock = threading.Lock()
+        self._stats = {'queries': 0, 'skipped': 0, 'candidates': 0, 'candidates_avoided': 0}
+
+    @property
+    def limit(self):
+        """
+        融合阶段需要保留的候选数
+        """
+        return self.max_candidates if self.mode == 'adaptive' else self.fixed_candidates
+
+    def select(self, scores):
+        """
+        :param scores: 按降序排列的融合得分
+        :return: 送去rerank的候选数，0表示跳过rerank
+        """
+        if self.mode == 'fixed':
+            return min(len(scores), self.fixed_candidates)
+        if len(scores) <= 1:
+            return 0
+        top = scores[0]
+        if top <= 0 or (top - scores[1]) / top >= self.skip_gap:
+            return 0
+        threshold = top * self.flat_ratio
+        count = sum(1 for score in scores if score >= threshold)
+        return min(max(count, self.min_candidates), self.max_candidates, len(scores))
+
+    def record(self, total, selected):
+        """
+        记录一次查询的候选数
+        :param total: 融合后的候选总数
+        :param selected: 实际送去rerank的候选数
+        :return: 相对固定模式节省的候选数（扩大范围时为负）
+        """
+        avoided = min(total, self.fixed_candidates) - selected
+        with self._lock:
+            self._stats['queries'] += 1
+            self._stats['skipped'] += selected == 0
+            self._stats['candidates'] += selected
+            self._stats['candidates_avoided'] += avoided
+        return avoided
+
+    def stats(self):
+        """
+        跳过rerank的查询数（即节省的rerank调用数）和候选数统计
+        """
+        with self._lock:
+            stats = dict(self._stats, mode=self.mode)
+        stats['skip_rate'] = round(stats['skipped'] / stats['queries'], 4) if stats['queries'] else 0.0
+        stats['avg_candidates'] = round(stats['candidates'] / stats['queries'], 2) if stats['queries'] else 0.0
+        return stats
@@ -0,0 +1,130 @@
+import re
+import threading
+
+# 只由空白或标点组成的token不参与BM25
+_SKIP_TOKEN = re.compile(r'^[\s\W_]+$')
+# CJK字符之外的连续字母数字作为一个整词
+_SEGMENT = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf]+|[A-Za-z0-9]+')
+_CJK = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf]')
+
+# 已加载到jieba全局词典的用户词典，多个分词器实例（及启动预热）共享，只加载一次
+_loaded_user_dicts = set()
+_jieba_lock = threading.Lock()
+
+
+def load_user_words(file_path='keywords.txt'):
+    """
+    从同义词词典中读取所有词语作为分词用户词典
+    :param file_path: 词典文件路径，每行格式：关键词 同义词1 同义词2 ...
+    :return: 词语列表
+    """
+    words = []
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                words.extend(line.split())
+    except FileNotFoundError:
+        pass
+    return words
+
+
+class Tokenizer:
+    """
+    分词器基类，子类实现tokenize，返回小写、去除空白和标点的token列表
+    """
+
+    name = 'base'
+
+    def tokenize(self, text):
+        raise NotImplementedError
+
+    def __call__(self, text):
+        return self.tokenize(text)
+
+
+class WhitespaceTokenizer(Tokenizer):
+    """
+    按空白分词（原有行为）
+    """
+
+    name = 'whitespace'
+
+    def tokenize(self, text):
+        return text.split()
+
+
+class JiebaTokenizer(Tokenizer):
+    """
+    jieba搜索引擎模式分词，加载keywords.txt中的词作为用户词典
+    """
+
+    name = 'jieba'
+
+    def __init__(self, user_dict='keywords.txt'):
+        """
+        :param user_dict: 用户词典（同义词词典）路径
+        """
+        self.user_dict = user_dict
+        self._initialized = False
+
+    def initialize(self):
+        """
+        加载jieba词典和用户词，重复调用无副作用
+        """
+        if self._initialized:
+            return
+        with _jieba_lock:
+            if self.user_dict not in _loaded_user_dicts:
+                import jieba
+                jieba.setLogLevel(20)
+                jieba.initialize()
+                for word in load_user_words(self.user_dict):
+                    jieba.add_word(word)
+                _loaded_user_dicts.add(self.user_dict)
+            self._initialized = True
+
+    def tokenize(self, text):
+        self.initialize()
+        import jieba
+        return [token.lower() for token in jieba.cut_for_search(text) if not _SKIP_TOKEN.match(token)]
+
+
+class BigramTokenizer(Tokenizer):
+    """
+    字符二元组分词：中文按相邻两字切分（单字成词时保留单字），字母数字按整词切分
+    不依赖词典，适合专有名词较多的语料
+    """
+
+    name = 'bigram'
+
+    def tokenize(self, text):
+        tokens = []
+        for segment in _SEGMENT.findall(text):
+            if not _CJK.match(segment):
+                tokens.append(segment.lower())
+            elif len(segment) == 1:
+                tokens.append(segment)
+            else:
+                tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        return tokens
+
+
+TOKENIZERS = {
+    WhitespaceTokenizer.name: WhitespaceTokenizer,
+    JiebaTokenizer.name: JiebaTokenizer,
+    BigramTokenizer.name: BigramTokenizer,
+}
+
+
+def create_tokenizer(name='jieba'):
+    """
+    根据名称创建分词器
+    :param name: 分词器名称，可选值：'jieba', 'bigram', 'whitespace'
+    :return: 分词器实例
+    """
+    if name not in TOKENIZERS:
+        raise ValueError(f"不支持的分词器: {name}")
+    return TOKENIZERS[name]()
@@ -0,0 +1,274 @@
+import math
+
+import faiss
+import numpy as np
+
+
+def normalize_embeddings(embeddings):
+    """
+    按行L2归一化，返回新的float32矩阵（零向量保持不变）
+    :param embeddings: 向量矩阵 (n, dimension)
+    """
+    embeddings = np.array(embeddings, dtype='float32', ndmin=2)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    embeddings /= norms
+    return embeddings
+
+
+class VectorIndex:
+    """
+    可配置的向量索引后端：flat（精确检索）、hnsw、ivf_flat、ivf_pq
+    IVF类索引需要训练：向量数达到训练阈值前使用flat，达到后自动训练重建，
+    之后每增长retrain_factor倍重新训练一次
+    度量默认为内积（ip），调用方负责对向量做L2归一化，此时得分即余弦相似度
+    """
+
+    TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+    METRICS = {'ip': faiss.METRIC_INNER_PRODUCT, 'l2': faiss.METRIC_L2}
+
+    def __init__(self, dimension, index_type='flat', metric='ip', hnsw_m=32, ef_construction=200, ef_search=64,
+                 nlist=0, nprobe=16, pq_m=16, pq_nbits=8, train_threshold=0, retrain_factor=4):
+        """
+        :param dimension: 向量维度
+        :param index_type: 索引类型，可选值：'flat', 'hnsw', 'ivf_flat', 'ivf_pq'
+        :param metric: 度量，可选值：'ip'（内积，归一化后为余弦相似度）, 'l2'
+        :param hnsw_m: HNSW每个节点的邻居数
+        :param ef_construction: HNSW构建时的搜索宽度
+        :param ef_search: HNSW默认查询搜索宽度
+        :param nlist: IVF聚类中心数，0表示按4*sqrt(n)自动选择
+        :param nprobe: IVF默认查询的聚类数
+        :param pq_m: PQ子空间数（需整除维度，否则取不大于它的最大因数）
+        :param pq_nbits: PQ每个子空间的编码位数
+        :param train_threshold: IVF开始训练的向量数，0表示按nlist的39倍自动选择
+        :param retrain_factor: 向量数增长到上次训练时的该倍数后重新训练
+        """
+        if index_type not in self.TYPES:
+            raise ValueError(f"Unsupported vector index type: {index_type}")
+        if metric not in self.METRICS:
+            raise ValueError(f"Unsupported vector metric: {metric}")
+        self.dimension = dimension
+        self.index_type = index_type
+        self.metric = metric
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.train_threshold = train_threshold
+        self.retrain_factor = retrain_factor
+        self.trained_size = 0  # 上次训练时的向量数，0表示尚未训练
+        self.mmapped = False
+        self.index = self._create_untrained()
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def faiss_metric(self):
+        return self.METRICS[self.metric]
+
+    @property
+    def is_ivf(self):
+        return self.index_type in ('ivf_flat', 'ivf_pq')
+
+    @property
+    def active_type(self):
+        """
+        当前实际使用的索引类型（IVF训练前为flat）
+        """
+        if self.is_ivf and not self.trained_size:
+            return 'flat'
+        return self.index_type
+
+    def _create_untrained(self):
+        if self.index_type == 'hnsw':
+            index = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, self.faiss_metric)
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+            return index
+        return self._create_flat()
+
+    def _create_flat(self):
+        if self.metric == 'ip':
+            return faiss.IndexFlatIP(self.dimension)
+        return faiss.IndexFlatL2(self.dimension)
+
+    def _nlist_for(self, size):
+        if self.nlist:
+            return self.nlist
+        return max(1, int(4 * math.sqrt(size)))
+
+    def _pq_m(self):
+        m = min(self.pq_m, self.dimension)
+        while self.dimension % m:
+            m -= 1
+        return m
+
+    def _train_threshold(self, size):
+        if self.train_threshold:
+            return self.train_threshold
+        return 39 * self._nlist_for(size)
+
+    def needs_rebuild(self, size):
+        """
+        判断向量数达到size后是否需要（重新）训练IVF索引
+        """
+        if not self.is_ivf:
+            return False
+        if not self.trained_size:
+            return size >= self._train_threshold(size)
+        return size >= self.trained_size * self.retrain_factor
+
+    def build(self, embeddings):
+        """
+        用全部向量训练并构建新的IVF索引，不修改当前索引，调用方在锁外执行后再swap
+        :param embeddings: 全部向量 (n, dimension)
+        :return: 新的faiss索引
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        nlist = min(self._nlist_for(len(embeddings)), len(embeddings))
+        quantizer = self._create_flat()
+        if self.index_type == 'ivf_pq':
+            index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, self._pq_m(), self.pq_nbits, self.faiss_metric)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, self.faiss_metric)
+        index.train(embeddings)
+        index.add(embeddings)
+        index.nprobe = self.nprobe
+        return index
+
+    def swap(self, index):
+        """
+        替换为build构建的新索引
+        """
+        self.index = index
+        self.trained_size = index.ntotal
+        self.mmapped = False
+
+    def add(self, embeddings):
+        if self.mmapped:
+            # mmap加载的HNSW索引只读，首次追加时复制到内存
+            self.index = faiss.clone_index(self.index)
+            self.mmapped = False
+        self.index.add(embeddings)
+
+    def _search_params(self, nprobe=None, ef_search=None):
+        active = self.active_type
+        if active in ('ivf_flat', 'ivf_pq'):
+            return faiss.SearchParametersIVF(nprobe=int(nprobe or self.nprobe))
+        if active == 'hnsw':
+            return faiss.SearchParametersHNSW(efSearch=int(ef_search or self.ef_search))
+        return None
+
+    def similarity(self, distances):
+        """
+        将search返回的得分转换为相似度：内积度量下即余弦相似度，L2度量下为1 / (1 + d)
+        """
+        if self.metric == 'ip':
+            return distances
+        return 1 / (1 + distances)
+
+    def search(self, queries, k, nprobe=None, ef_search=None):
+        """
+        检索最近邻，nprobe/ef_search按请求传入，不修改索引的全局参数
+        :param queries: 查询向量 (m, dimension)
+        :param k: 返回数量
+        :param nprobe: IVF查询的聚类数
+        :param ef_search: HNSW查询搜索宽度
+        :return: (D, I)
+        """
+        params = self._search_params(nprobe, ef_search)
+        if params is None:
+            return self.index.search(queries, k)
+        return self.index.search(queries, k, params=params)
+
+    def recall(self, queries, embeddings, k=10, nprobe=None, ef_search=None, query_ids=None):
+        """
+        以精确检索（flat）为基准计算recall@k
+        :param queries: 查询向量 (m, dimension)
+        :param embeddings: 全部向量 (n, dimension)
+        :param k: top-k
+        :param query_ids: 查询取自已索引向量时各查询自身的id，从两边结果中去掉，避免自身命中抬高recall
+        :return: 平均recall@k
+        """
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        extra = 0 if query_ids is None else 1
+        k = min(k, len(embeddings) - extra)
+        if k <= 0 or len(queries) == 0:
+            return 1.0
+        _, exact = faiss.knn(queries, np.ascontiguousarray(embeddings, dtype='float32'), k + extra,
+                             metric=self.faiss_metric)
+        _, approx = self.search(queries, k + extra, nprobe=nprobe, ef_search=ef_search)
+        exact, approx = exact.tolist(), approx.tolist()
+        if query_ids is not None:
+            exact = [[i for i in row if i != qid][:k] for row, qid in zip(exact, query_ids)]
+            approx = [[i for i in row if i != qid][:k] for row, qid in zip(approx, query_ids)]
+        hits = sum(len(set(e) & set(a)) for e, a in zip(exact, approx))
+        return hits / (k * len(queries))
+
+    def memory_usage(self):
+        """
+        估算索引占用字节数
+        """
+        n = self.index.ntotal
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexHNSW):
+            # 向量存储 + 每层邻居表（底层2*M个邻居，int32）
+            return n * (self.dimension * 4 + self.hnsw_m * 2 * 4)
+        if isinstance(index, faiss.IndexIVF):
+            # 编码 + id（int64） + 聚类中心
+            return n * (index.code_size + 8) + index.nlist * self.dimension * 4
+        return n * self.dimension * 4
+
+    def config(self):
+        """
+        持久化所需的配置
+        """
+        return {
+            'index_type': self.index_type,
+            'metric': self.metric,
+            'hnsw_m': self.hnsw_m,
+            'ef_construction': self.ef_construction,
+            'ef_search': self.ef_search,
+            'nlist': self.nlist,
+            'nprobe': self.nprobe,
+            'pq_m': self.pq_m,
+            'pq_nbits': self.pq_nbits,
+            'train_threshold': self.train_threshold,
+            'retrain_factor': self.retrain_factor,
+            'trained_size': self.trained_size,
+        }
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+
+    def serialize(self):
+        """
+        序列化为与save相同格式的字节数组（内存复制），调用方可以在锁内序列化、锁外写文件
+        """
+        return faiss.serialize_index(self.index)
+
+    @classmethod
+    def load(cls, path, dimension, config=None, mmap=True):
+        """
+        加载索引，mmap模式下只读映射，首次追加时复制
+        IVF索引不使用mmap：映射后的倒排表为OnDiskInvertedLists，无法clone_index，也不能追加
+        :param path: 索引文件路径
+        :param dimension: 向量维度
+        :param config: save时保存的配置
+        :param mmap: 是否以mmap方式加载
+        """
+        config = dict(config or {})
+        trained_size = config.pop('trained_size', 0)
+        vector_index = cls(dimension, **config)
+        if mmap and not vector_index.is_ivf:
+            vector_index.index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            vector_index.mmapped = True
+        else:
+            vector_index.index = faiss.read_index(path)
+        vector_index.trained_size = trained_size
+        return vector_index
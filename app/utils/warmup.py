@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+from app.utils.config import config
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_status = {'state': 'pending', 'steps': {}, 'error': None, 'seconds': None}
+
+
+def _warm_up_jieba(user_dict, cache_file):
+    """
+    加载jieba前缀词典（优先从预先生成的缓存文件读取）和用户词典
+    """
+    import jieba
+    if cache_file:
+        # 缓存文件不存在或比词典旧时，jieba会重新生成并写入该路径，之后的进程直接读取
+        jieba.dt.cache_file = os.path.abspath(cache_file)
+    from app.utils.tokenizer import JiebaTokenizer
+    JiebaTokenizer(user_dict).initialize()
+
+
+def _warm_up_posseg():
+    """
+    加载词性标注模型（查询扩展使用）
+    """
+    import jieba.posseg as pseg
+    pseg.lcut('预热词性标注模型')
+
+
+def warm_up(user_dict=None, cache_file=None):
+    """
+    预热分词和词性标注，重复调用时已完成的步骤无额外开销
+    失败时记录错误并标记为degraded，相关组件仍会在首次使用时懒加载
+    :param user_dict: 用户词典（同义词词典）路径
+    :param cache_file: jieba前缀词典缓存文件路径
+    :return: 预热状态
+    """
+    user_dict = user_dict or config.get('warmup', 'user_dict', 'keywords.txt')
+    cache_file = cache_file if cache_file is not None else config.get('warmup', 'jieba_cache', '')
+    with _lock:
+        if _ready.is_set():
+            return status()
+        _status['state'] = 'warming_up'
+        start = time.perf_counter()
+        try:
+            for name, step in (('jieba', lambda: _warm_up_jieba(user_dict, cache_file)),
+                               ('posseg', _warm_up_posseg)):
+                step_start = time.perf_counter()
+                step()
+                _status['steps'][name] = round((time.perf_counter() - step_start) * 1000, 2)
+            _status['state'] = 'ready'
+        except Exception as e:
+            _status['state'] = 'degraded'
+            _status['error'] = str(e)
+            print(f"预热失败：{str(e)}")
+        _status['seconds'] = round(time.perf_counter() - start, 3)
+        _ready.set()
+    return status()
+
+
+def start_warm_up(mode=None):
+    """
+    按配置执行预热
+    :param mode: 'sync'（阻塞直到完成）, 'async'（后台线程）, 'off'（不预热，直接标记就绪）
+    """
+    mode = mode or config.get('warmup', 'mode', 'sync')
+    if mode == 'off':
+        with _lock:
+            _status['state'] = 'skipped'
+            _ready.set()
+    elif mode == 'async':
+        threading.Thread(target=warm_up, name='warmup', daemon=True).start()
+    else:
+        warm_up()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def status():
+    """
+    预热状态：state、各步骤耗时（毫秒）、总耗时（秒）和错误信息
+    """
+    return dict(_status, steps=dict(_status['steps']), ready=_ready.is_set())
@@ -3,6 +3,11 @@
 查询扩展模块
 """
 
+import os
+import threading
+import time
+from collections import OrderedDict
+
 import jieba
 import jieba.posseg as pseg
 
@@ -35,11 +40,124 @@ def load_synonyms_dict(file_path='keywords.txt'):
     return synonyms_dict
 
 
+class QueryExpander:
+    """
+    查询扩展引擎：启动时加载一次同义词词典，词典文件修改后自动重新加载，
+    最近查询的扩展结果缓存在LRU中
+    """
+
+    def __init__(self, file_path='keywords.txt', topn=2, cache_size=1024, check_interval=1.0):
+        """
+        :param file_path: 同义词词典路径
+        :param topn: 默认每个关键词保留的同义词数量，expand时可以按调用指定
+        :param cache_size: 扩展结果缓存的最大条目数
+        :param check_interval: 检查词典文件修改时间的最小间隔（秒）
+        """
+        self.file_path = file_path
+        self.topn = topn
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._stats = {'calls': 0, 'hits': 0, 'loads': 0, 'total_ms': 0.0}
+        self._next_check = 0.0
+        self._mtime = None
+        self.synonyms_dict = {}
+        self.reload()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.file_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """
+        重新加载词典（保留完整的同义词列表，扩展时按topn截取），并清空扩展结果缓存
+        """
+        mtime = self._file_mtime()
+        synonyms_dict = load_synonyms_dict(self.file_path)
+        with self._lock:
+            self.synonyms_dict = synonyms_dict
+            self._mtime = mtime
+            self._cache.clear()
+            self._stats['loads'] += 1
+
+    def _check_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        if self._file_mtime() != self._mtime:
+            self.reload()
+
+    def expand(self, query, topn=None):
+        """
+        查询扩展
+        :param query: 原始查询
+        :param topn: 每个关键词保留的同义词数量，默认使用构造时的topn
+        :return: 扩展后的查询
+        """
+        if not query:
+            return query
+        topn = self.topn if topn is None else topn
+        key = (query, topn)
+        start = time.perf_counter()
+        self._check_reload()
+        with self._lock:
+            expanded = self._cache.get(key)
+            if expanded is not None:
+                self._cache.move_to_end(key)
+            synonyms_dict = self.synonyms_dict
+        hit = expanded is not None
+        if not hit:
+            expanded = expand_query(query, synonyms_dict, topn=topn)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            # 扩展期间词典被重新加载时不缓存旧词典的结果
+            if not hit and synonyms_dict is self.synonyms_dict:
+                self._cache[key] = expanded
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            self._stats['calls'] += 1
+            self._stats['hits'] += hit
+            self._stats['total_ms'] += elapsed
+        return expanded
+
+    def stats(self):
+        """
+        调用次数、缓存命中、词典加载次数和平均耗时（毫秒）
+        """
+        with self._lock:
+            stats = dict(self._stats, cache_size=len(self._cache), dictionary_size=len(self.synonyms_dict))
+        stats['avg_ms'] = round(stats.pop('total_ms') / stats['calls'], 3) if stats['calls'] else 0.0
+        stats['hit_rate'] = round(stats['hits'] / stats['calls'], 4) if stats['calls'] else 0.0
+        return stats
+
+
+_expanders = {}
+_expanders_lock = threading.Lock()
+
+
+def get_query_expander(file_path='keywords.txt'):
+    """
+    获取进程内共享的查询扩展引擎，每个词典文件一个
+    """
+    key = os.path.abspath(file_path)
+    expander = _expanders.get(key)
+    if expander is None:
+        with _expanders_lock:
+            expander = _expanders.get(key)
+            if expander is None:
+                expander = _expanders[key] = QueryExpander(file_path)
+    return expander
+
+
 def expand_query(query, synonyms_dict=None, topn=2):
     """
     查询扩展
     :param query: 原始查询
-    :param synonyms_dict: 同义词词典
+    :param synonyms_dict: 同义词词典，为None时使用共享的查询扩展引擎（不再每次读取词典文件）
     :param topn: 每个关键词保留的同义词数量
     :return: 扩展后的查询
     """
@@ -47,7 +165,7 @@ def expand_query(query, synonyms_dict=None, topn=2):
         return query
     
     if synonyms_dict is None:
-        synonyms_dict = load_synonyms_dict()
+        return get_query_expander().expand(query, topn=topn)
     
     # 使用jieba进行词性标注
     words = pseg.cut(query)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量扫描历史消息中的敏感词，输出命中记录并统计吞吐量
+
+    python scan_sensitive.py --jsonl requests.jsonl --fields title body
+    python scan_sensitive.py --ssdb wxuser_ --fields ask answer --output hits.jsonl
+
+命中记录按行输出JSON：{"key": ..., "matches": [[start, end, word], ...]}，
+JSONL的key为行号，SSDB的key为键名；统计信息输出到stderr
+"""
+
+import argparse
+import collections
+import configparser
+import json
+import sys
+import time
+
+from sensitive_filter import (SensitiveDictionary, TextNormalizer, DEFAULT_NOISE_CHARS, filter_batch)
+
+
+def record_text(record, fields=None):
+    """
+    从一条记录中取出要扫描的文本
+    :param record: JSON解析后的记录或原始字符串
+    :param fields: 字段列表，为空时取所有字符串字段
+    :return: 各字段用换行连接后的文本
+    """
+    if isinstance(record, dict):
+        values = [record.get(field) for field in fields] if fields else record.values()
+        return '\n'.join(value for value in values if isinstance(value, str))
+    return record if isinstance(record, str) else ''
+
+
+def iter_jsonl(path, fields=None):
+    """
+    逐行读取JSONL文件，不是JSON的行按原文扫描
+    :return: 生成器，产生(行号, 文本)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = line
+            yield line_no, record_text(record, fields)
+
+
+def iter_ssdb(client, prefix='wxuser_', fields=None, batch=1000):
+    """
+    按键名顺序分页读取SSDB中以prefix开头的键
+    :return: 生成器，产生(键名, 文本)
+    """
+    start, end = prefix, prefix + '\xff'
+    while True:
+        keys = client.keys(start, end, batch)
+        if not keys:
+            break
+        for key in keys:
+            value = client.get(key)
+            if isinstance(value, bytes):
+                value = value.decode('utf-8', errors='replace')
+            if isinstance(key, bytes):
+                key = key.decode('utf-8', errors='replace')
+            try:
+                record = json.loads(value) if value else ''
+            except ValueError:
+                record = value
+            yield key, record_text(record, fields)
+        if len(keys) < batch:
+            break
+        start = keys[-1]
+
+
+def scan(records, automaton, output, processes=None, chunk_size=256):
+    """
+    扫描(key, 文本)记录，把命中写入output
+    :return: 统计信息：records、hits、matches、mb、seconds、mb_per_second
+    """
+    stats = {'records': 0, 'bytes': 0, 'hits': 0, 'matches': 0}
+    # 结果按输入顺序返回，只需保留尚未返回结果的记录的key
+    keys = collections.deque()
+
+    def texts():
+        for key, text in records:
+            stats['records'] += 1
+            stats['bytes'] += len(text.encode('utf-8'))
+            keys.append(key)
+            yield text
+
+    start = time.perf_counter()
+    index = 0
+    for hit_index, matches in filter_batch(texts(), automaton, processes, chunk_size):
+        while index < hit_index:
+            keys.popleft()
+            index += 1
+        key = keys.popleft()
+        index += 1
+        stats['hits'] += 1
+        stats['matches'] += len(matches)
+        output.write(json.dumps({'key': key, 'matches': matches}, ensure_ascii=False) + '\n')
+    seconds = time.perf_counter() - start
+
+    mb = stats.pop('bytes') / 1024 / 1024
+    stats.update(mb=round(mb, 2), seconds=round(seconds, 3),
+                 mb_per_second=round(mb / seconds, 2) if seconds else 0.0)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量扫描历史消息中的敏感词')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--jsonl', help='JSONL文件路径')
+    source.add_argument('--ssdb', metavar='PREFIX', help='扫描SSDB中以PREFIX开头的键，如wxuser_')
+    parser.add_argument('--fields', nargs='*', help='要扫描的字段，默认为所有字符串字段')
+    parser.add_argument('--config', default='config.ini', help='配置文件，读取[sensitive]词典设置和[ssdb]地址')
+    parser.add_argument('--words', help='敏感词词典文件，默认使用配置中的words_file')
+    parser.add_argument('--processes', type=int, default=None, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--chunk-size', type=int, default=256, help='每个任务包含的记录数')
+    parser.add_argument('--output', help='命中记录输出文件，默认输出到stdout')
+    args = parser.parse_args(argv)
+
+    config = configparser.ConfigParser()
+    config.read(args.config, encoding='utf-8')
+    noise_chars = config.get('sensitive', 'noise_chars', raw=True, fallback='')
+    dictionary = SensitiveDictionary(
+        file_path=args.words or config.get('sensitive', 'words_file', fallback='sensitive_words.txt'),
+        cache_path=None if args.words else config.get('sensitive', 'cache_file', fallback='') or None,
+        normalizer=TextNormalizer(noise_chars=noise_chars + ' \t\r\n' if noise_chars else DEFAULT_NOISE_CHARS))
+    dictionary.reload()
+
+    if args.jsonl:
+        records = iter_jsonl(args.jsonl, args.fields)
+    else:
+        from ssdb import SSDB
+        client = SSDB(str(config['ssdb']['ip']), 8448)
+        records = iter_ssdb(client, args.ssdb, args.fields)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        stats = scan(records, dictionary.automaton, output, args.processes, args.chunk_size)
+    finally:
+        if args.output:
+            output.close()
+    print(f"扫描{stats['records']}条记录（{stats['mb']} MB），{stats['hits']}条命中，共{stats['matches']}处，"
+          f"耗时{stats['seconds']}秒，{stats['mb_per_second']} MB/s", file=sys.stderr)
+    return stats
+
+
+if __name__ == '__main__':
+    main()
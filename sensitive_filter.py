@@ -0,0 +1,874 @@
+"""
+编译后的AC自动机：字符先映射到紧凑的字母表编号，状态转移存放在array/NumPy缓冲区中
+- 状态数×字母表大小不超过dense_budget时使用稠密转移表，失败转移在构建时补全（goto-completed），
+  每个字符只需一次查表
+- 否则使用双数组trie（base/check）加失败指针，内存与状态数成正比
+每个状态预先计算输出链接（沿失败指针最近的敏感词结尾状态），不再逐个遍历失败链收集命中
+
+字符归一化（全角转半角、大小写、繁体转简体）融合在字母表映射中：各种变体直接映射到同一个字符编号，
+噪声字符（插入在敏感词中间的空格、标点）映射为NOISE，扫描时跳过，不产生中间字符串
+
+扫描长文本时，字母表外的字符使自动机回到根状态，文本被切分为若干段字母表内的连续字符，
+各段互相独立，用NumPy按步同时推进所有短段的状态；短文本和超长段逐字符扫描
+
+SensitiveDictionary在后台线程中监视词典文件（或Redis键），在请求路径之外构建新自动机后原子替换，
+编译结果序列化到磁盘，词典未变化时新进程直接加载，无需重新构建
+
+filter_batch把批量文本分块交给多个工作进程扫描，工作进程通过fork继承自动机（array缓冲区写时复制，不需要序列化）
+"""
+
+import collections
+import hashlib
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from array import array
+
+import numpy as np
+
+
+NOISE = -1  # 噪声字符的编号：扫描时跳过，不改变自动机状态
+
+# 默认噪声字符：空白和常见中英文标点
+DEFAULT_NOISE_CHARS = " \t\r\n*-_.,;:!?'\"`~@#$^&+=|/\\()[]{}<>，。、；：！？·…—～“”‘’（）【】《》「」『』"
+
+# 常见繁体字到简体字的映射（每项为“繁简”两个字符）
+TRADITIONAL_VARIANTS = (
+    "個个 們们 來来 時时 後后 說说 會会 對对 學学 國国 過过 還还 經经 發发 動动 見见 問问 題题 開开 關关 "
+    "長长 門门 車车 馬马 東东 無无 為为 與与 從从 這这 邊边 進进 運运 遠远 達达 連连 選选 違违 認认 識识 "
+    "話话 語语 讀读 論论 議议 護护 買买 賣卖 貨货 費费 資资 賭赌 賠赔 財财 軍军 輸输 辦办 農农 醫医 錢钱 "
+    "錯错 間间 隊队 陽阳 陰阴 隱隐 險险 難难 電电 領领 頭头 風风 飛飞 體体 鬥斗 魚鱼 鳥鸟 麼么 黨党 龍龙 "
+    "擊击 罵骂 脅胁 權权 勢势 壓压 滅灭 殺杀 槍枪 彈弹 藥药 嗎吗 嚴严 團团 圖图 場场 壞坏 實实 寫写 導导 "
+    "帶带 應应 廣广 張张 強强 歸归 愛爱 態态 戰战 據据 數数 斷断 書书 條条 業业 極极 樂乐 樣样 機机 檢检 "
+    "歡欢 氣气 漢汉 濟济 災灾 熱热 燈灯 爭争 獨独 獄狱 現现 產产 畫画 當当 療疗 盜盗 監监 碼码 確确 離离 "
+    "種种 穩稳 競竞 絕绝 統统 網网 線线 組组 結结 給给 絡络 總总 繼继 續续 罰罚 羅罗 義义 習习 聞闻 聯联 "
+    "聲声 職职 聽听 腦脑 興兴 舉举 藝艺 處处 號号 裝装 製制 視视 親亲 覺觉 觀观 計计 訊讯 詐诈 騙骗 謠谣 "
+    "誘诱 記记 設设 許许 評评 試试 誤误 調调 請请 講讲 謝谢 證证 變变 讓让 負负 貧贫 貪贪 責责 貴贵 賊贼 "
+    "購购 轉转 輪轮 鎖锁 閉闭 隨随 際际 雖虽 類类 顯显 驗验 驚惊 點点 齊齐 黃黄 詞词 傳传 偽伪 價价 優优 "
+    "兒儿 兩两 劃划 則则 創创 劇剧 務务 勞劳 區区 華华 協协 單单 衛卫 歷历 參参 雙双 員员 啟启 圍围 報报 "
+    "婦妇 媽妈 寶宝 將将 專专 層层 屬属 島岛 幣币 幫帮 廠厂 徵征 懷怀 懼惧 戲戏 掃扫 擔担 擴扩 擁拥 攝摄 "
+    "敗败 敵敌 斃毙 毆殴 決决 淚泪 滿满 灣湾 燒烧 牆墙 狀状 獵猎 獎奖 環环 禍祸 禮礼 竊窃 筆笔 簡简 糧粮 "
+    "紀纪 約约 紅红 級级 細细 終终 織织 罷罢 膽胆 臉脸 艦舰 蟲虫 補补 複复 訂订 討讨 訓训 訪访 詳详 諾诺 "
+    "謀谋 譯译 豐丰 貢贡 賓宾 賴赖 趕赶 躍跃 軟软 載载 輛辆 轟轰 辭辞 遲迟 遺遗 醜丑 鋼钢 錄录 閃闪 閱阅 "
+    "雞鸡 雲云 頁页 順顺 須须 頓顿 頻频 顆颗 飾饰 駕驾 騎骑 髒脏 鬧闹 鮮鲜 鳴鸣 麗丽 齒齿 駭骇 譭毁 誹诽 謗谤"
+)
+
+
+class TextNormalizer:
+    """
+    匹配时的字符归一化：全角转半角、大小写折叠、繁体转简体，噪声字符在扫描时跳过
+    敏感词按同样规则归一化后再插入字典树，每个敏感词只占一条路径
+    """
+
+    def __init__(self, noise_chars=DEFAULT_NOISE_CHARS, variants=None, fold_case=True, fold_width=True):
+        """
+        :param noise_chars: 噪声字符（归一化后的形式），为空时不跳过任何字符
+        :param variants: 变体字符映射{变体: 标准字符}，为None时使用内置的繁简映射
+        :param fold_case: 是否忽略大小写
+        :param fold_width: 是否把全角字符转为半角
+        """
+        if variants is None:
+            variants = {pair[0]: pair[1] for pair in TRADITIONAL_VARIANTS.split()}
+        self.variants = dict(variants)
+        self.fold_case = fold_case
+        self.fold_width = fold_width
+        self.noise_chars = frozenset(self.canonical(char) for char in noise_chars or '')
+
+    def canonical(self, char):
+        """单个字符的标准形式"""
+        if self.fold_width:
+            code = ord(char)
+            if code == 0x3000:  # 全角空格转半角空格
+                char = ' '
+            elif 0xFF01 <= code <= 0xFF5E:  # 全角字符转半角
+                char = chr(code - 0xFEE0)
+        if self.fold_case:
+            lower = char.lower()
+            if len(lower) == 1:
+                char = lower
+        return self.variants.get(char, char)
+
+    def normalize(self, word, noise_chars=None):
+        """
+        敏感词的标准形式（去掉噪声字符）
+        :param noise_chars: 要去掉的字符，默认为全部噪声字符
+        """
+        noise_chars = self.noise_chars if noise_chars is None else noise_chars
+        return ''.join(char for char in map(self.canonical, word) if char not in noise_chars)
+
+    def table(self, alphabet, noise_chars=None):
+        """
+        翻译表：所有标准形式在字母表中或为噪声的原始字符 -> 标准字符
+        :param alphabet: 标准字符集合
+        :param noise_chars: 扫描时跳过的字符，默认为全部噪声字符
+        """
+        noise_chars = self.noise_chars if noise_chars is None else noise_chars
+        candidates = set(alphabet) | set(noise_chars) | set(self.variants)
+        candidates |= {char.upper() for char in candidates if len(char.upper()) == 1}
+        if self.fold_width:
+            candidates |= {chr(code) for code in range(0xFF01, 0xFF5F)} | {'\u3000'}
+        table = {}
+        for char in candidates:
+            target = self.canonical(char)
+            if target in alphabet or target in noise_chars:
+                table[char] = target
+        return table
+
+    def signature(self):
+        """归一化规则的摘要，规则变化时编译缓存失效"""
+        content = repr((sorted(self.noise_chars), sorted(self.variants.items()), self.fold_case, self.fold_width))
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def mask_spans(text, spans, mask_char='*'):
+    """
+    把text中的命中区间替换为mask_char（重叠或相邻的区间合并后一次拼接）
+    :param text: 原文本
+    :param spans: [(start, end, ...), ...]
+    :param mask_char: 替换字符
+    :return: 替换后的文本
+    """
+    if not spans:
+        return text
+    parts = []
+    position = 0
+    for start, end, *_ in sorted(spans):
+        start = max(start, position)
+        if end <= start:
+            continue
+        parts.append(text[position:start])
+        parts.append(mask_char * (end - start))
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+class CompiledACAutomaton:
+    """
+    与utils.ACAutomaton接口一致：add_word添加敏感词，build_fail编译，search返回命中的敏感词集合
+    指定normalizer时按归一化后的形式匹配，返回的仍是词典中的原始敏感词
+    """
+
+    DENSE_BUDGET = 4000000  # 稠密转移表的最大单元数（int32，约16MB）
+    VECTORIZE_MIN_LENGTH = 512  # 文本长度不小于该值时使用NumPy按段并行扫描
+    CONTAINS_BLOCK = 4096  # contains扫描长文本时每块的字符数，命中即停止
+    MAX_LOCKSTEP_RUN = 64  # 超过该长度的段逐字符扫描，避免NumPy逐步推进的调用次数过多
+
+    def __init__(self, dense_budget=None, normalizer=None):
+        """
+        :param dense_budget: 稠密转移表的最大单元数，超过时使用双数组trie
+        :param normalizer: TextNormalizer，为None时按原始字符精确匹配
+        """
+        self.dense_budget = self.DENSE_BUDGET if dense_budget is None else dense_budget
+        self.normalizer = normalizer
+        self._pending = {}  # 待编译的敏感词：{标准形式（保留噪声字符）: 原始敏感词}（dict保持插入顺序并去重）
+        self.words = []
+        self.max_length = 0
+        self.num_states = 1
+        self.dense = True
+        self._alphabet = {}
+        self._noise_chars = frozenset()  # 扫描时跳过的字符
+        self._has_noise = False
+        self._codepoints = np.zeros(0, dtype=np.uint32)
+        self._codes = np.zeros(0, dtype=np.int32)
+
+    def add_word(self, word):
+        """添加敏感词，build_fail之后生效"""
+        form = self.normalizer.normalize(word, noise_chars=()).strip() if self.normalizer else word
+        if form and form not in self._pending:
+            self._pending[form] = word
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getstate__(self):
+        # NumPy视图和待编译词表不序列化，加载时由数组缓冲区重建视图
+        return {key: value for key, value in self.__dict__.items()
+                if not key.endswith('_np') and key != '_pending'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pending = dict(zip(self._forms, self.words))
+        self._emit_np = np.frombuffer(self._emit, dtype=np.uint8)
+        self._fail_np = np.frombuffer(self._fail, dtype=np.int32)
+        if self.dense:
+            self._goto_np = np.frombuffer(self._goto, dtype=np.int32).reshape(self.num_states, self._width)
+        else:
+            self._base_np = np.frombuffer(self._base, dtype=np.int32)
+            self._check_np = np.frombuffer(self._check, dtype=np.int32)
+
+    def _build_trie(self):
+        """
+        构建字典树：children[状态] = {字符编号: 子状态}，word[状态] = 敏感词下标（非结尾为-1）
+        字母表按码位排序，编号从1开始，0表示字母表外的字符
+        """
+        if self.normalizer:
+            # 出现在敏感词首尾的噪声字符（如"C++"中的"+"、只由噪声组成的"**"）是词的一部分，不作为噪声跳过，
+            # 否则敏感词会退化为更短的词（"c"）或空串；夹在词中间的噪声字符仍然去掉
+            self._noise_chars = self.normalizer.noise_chars - {form[i] for form in self._pending for i in (0, -1)}
+            patterns = {}
+            for form, word in self._pending.items():
+                patterns.setdefault(self.normalizer.normalize(form, self._noise_chars), (form, word))
+        else:
+            patterns = {form: (form, word) for form, word in self._pending.items()}
+        self._patterns = list(patterns)
+        self._forms = [form for form, _ in patterns.values()]
+        self.words = [word for _, word in patterns.values()]
+        self._lengths = [len(pattern) for pattern in self._patterns]
+        self.max_length = max(self._lengths, default=0)
+        chars = sorted({char for pattern in self._patterns for char in pattern})
+        codes = {char: i + 1 for i, char in enumerate(chars)}
+        self._width = len(chars) + 1
+
+        # 翻译表：原始字符（包括各种变体）直接映射到字符编号，噪声字符映射为NOISE
+        if self.normalizer:
+            self._alphabet = {char: NOISE if target in self._noise_chars else codes[target]
+                              for char, target in self.normalizer.table(codes, self._noise_chars).items()}
+        else:
+            self._alphabet = codes
+        self._has_noise = NOISE in self._alphabet.values()
+        raw_chars = sorted(self._alphabet)
+        self._codepoints = np.array([ord(char) for char in raw_chars], dtype=np.uint32)
+        self._codes = np.array([self._alphabet[char] for char in raw_chars], dtype=np.int32)
+
+        children = [{}]
+        word = [-1]
+        for index, text in enumerate(self._patterns):
+            state = 0
+            for char in text:
+                code = codes[char]
+                child = children[state].get(code)
+                if child is None:
+                    child = len(children)
+                    children[state][code] = child
+                    children.append({})
+                    word.append(-1)
+                state = child
+            word[state] = index
+        return children, word
+
+    def build_fail(self):
+        """编译自动机（构建失败指针、输出链接和转移表）"""
+        children, word = self._build_trie()
+        self.num_states = len(children)
+        self.dense = self.num_states * self._width <= self.dense_budget
+        if self.dense:
+            fail, order = self._build_dense(children)
+            slot = list(range(self.num_states))
+            size = self.num_states
+        else:
+            fail, order, slot = self._build_double_array(children)
+            size = len(self._check)
+
+        # 输出链接：沿失败指针最近的敏感词结尾状态（按BFS顺序计算，失败状态总是先于当前状态）
+        link = [0] * self.num_states
+        for state in order[1:]:
+            target = fail[state]
+            link[state] = target if word[target] >= 0 else link[target]
+
+        # 以下数组按扫描时的状态号（稠密表为trie状态号，双数组为槽位号）索引
+        self._word = array('i', [-1]) * size
+        self._link = array('i', [0]) * size
+        self._fail = array('i', [0]) * size
+        emit = bytearray(size)
+        for state in range(self.num_states):
+            position = slot[state]
+            self._word[position] = word[state]
+            self._link[position] = slot[link[state]]
+            self._fail[position] = slot[fail[state]]
+            emit[position] = word[state] >= 0 or link[state] != 0
+        self._emit = bytes(emit)
+        self._emit_np = np.frombuffer(self._emit, dtype=np.uint8)
+        self._fail_np = np.frombuffer(self._fail, dtype=np.int32)
+
+    def _build_dense(self, children):
+        """
+        稠密转移表：goto[状态, 字符编号] = 下一状态，失败转移按BFS顺序继承失败状态的行
+        """
+        goto = np.zeros((self.num_states, self._width), dtype=np.int32)
+        fail = [0] * self.num_states
+        order = [0]
+        queue = collections.deque([0])
+        while queue:
+            state = queue.popleft()
+            if state:
+                goto[state] = goto[fail[state]]
+            for code, child in children[state].items():
+                fail[child] = int(goto[fail[state], code]) if state else 0
+                queue.append(child)
+                order.append(child)
+            if children[state]:
+                codes = list(children[state])
+                goto[state, codes] = [children[state][code] for code in codes]
+        self._goto = array('i', goto.tobytes())
+        self._goto_np = np.frombuffer(self._goto, dtype=np.int32).reshape(self.num_states, self._width)
+        return fail, order
+
+    def _build_double_array(self, children):
+        """
+        双数组trie：状态s经字符编号c转移到t = base[s] + c，当且仅当check[t] == s
+        trie状态按BFS顺序放置到数组槽位，槽位号即扫描时的状态号
+        :return: (失败指针, BFS顺序, trie状态对应的槽位号)，失败指针和BFS顺序按trie状态号
+        """
+        size = max(self.num_states * 2, self._width + 1) + 1
+        check = [-1] * size
+        base = [0] * size
+        check[0] = 0  # 根节点占用槽位0
+        # 空闲槽位并查集：free[i]指向不小于i的空闲槽位（带路径压缩），跳过已占用的槽位
+        free = list(range(size))
+        free[0] = 1
+
+        def next_free(position):
+            root = position
+            while free[root] != root:
+                root = free[root]
+            while free[position] != root:
+                free[position], position = root, free[position]
+            return root
+
+        slot = [0] * self.num_states
+        order = [0]
+        queue = collections.deque([0])
+        while queue:
+            state = queue.popleft()
+            if not children[state]:
+                continue
+            codes = sorted(children[state])
+            # 依次尝试空闲槽位，寻找使全部子状态都落在空闲槽位上的base
+            position = next_free(codes[0] + 1)
+            while True:
+                candidate = position - codes[0]
+                if candidate + codes[-1] >= size - 1:
+                    check.extend([-1] * size)
+                    base.extend([0] * size)
+                    free.extend(range(size, size * 2))
+                    size *= 2
+                if all(check[candidate + code] < 0 for code in codes):
+                    break
+                position = next_free(position + 1)
+            base[slot[state]] = candidate
+            for code in codes:
+                child = children[state][code]
+                slot[child] = candidate + code
+                check[candidate + code] = slot[state]
+                free[candidate + code] = candidate + code + 1
+                queue.append(child)
+                order.append(child)
+
+        # 失败指针：沿父状态的失败链查找同一字符的转移
+        fail = [0] * self.num_states
+        for state in order[1:]:
+            for code, child in children[state].items():
+                target = fail[state]
+                while target and code not in children[target]:
+                    target = fail[target]
+                fail[child] = children[target].get(code, 0)
+
+        # 末尾留出一个字母表宽度，base + c总在数组范围内
+        used = max(slot) + 1 + self._width
+        self._base = array('i', base[:used] + [0] * max(used - len(base), 0))
+        self._check = array('i', check[:used] + [-1] * max(used - len(check), 0))
+        self._base_np = np.frombuffer(self._base, dtype=np.int32)
+        self._check_np = np.frombuffer(self._check, dtype=np.int32)
+        return fail, order, slot
+
+    def _step_np(self, states, codes):
+        """一组状态同时做一步转移（NumPy向量化）"""
+        if self.dense:
+            return self._goto_np[states, codes]
+        base, check = self._base_np, self._check_np
+        result = np.zeros_like(states)
+        pending = codes != 0
+        while pending.any():
+            targets = base[states] + codes
+            hit = pending & (check[targets] == states)
+            result[hit] = targets[hit]
+            pending &= ~hit & (states != 0)
+            states = np.where(pending, self._fail_np[states], states)
+        return result
+
+    def _scan_chars(self, text):
+        """
+        逐字符扫描（通过翻译表映射字符编号，跳过噪声字符），产出命中状态：(结束位置（不含）, 状态)
+        """
+        get, emit = self._alphabet.get, self._emit
+        state = 0
+        if self.dense:
+            goto, width = self._goto, self._width
+            for end, char in enumerate(text, 1):
+                code = get(char)
+                if code is None:
+                    state = 0
+                    continue
+                if code < 0:
+                    continue
+                state = goto[state * width + code]
+                if emit[state]:
+                    yield end, state
+        else:
+            base, check, fail = self._base, self._check, self._fail
+            for end, char in enumerate(text, 1):
+                code = get(char)
+                if code is None:
+                    state = 0
+                    continue
+                if code < 0:
+                    continue
+                while True:
+                    target = base[state] + code
+                    if check[target] == state:
+                        state = target
+                        break
+                    if not state:
+                        break
+                    state = fail[state]
+                if emit[state]:
+                    yield end, state
+
+    def _scan_codes(self, codes, offset):
+        """
+        逐个扫描字符编号（不含0和噪声），产出命中状态：(结束位置（不含，加上offset）, 状态)
+        """
+        emit = self._emit
+        state = 0
+        if self.dense:
+            goto, width = self._goto, self._width
+            for end, code in enumerate(codes, offset + 1):
+                state = goto[state * width + code]
+                if emit[state]:
+                    yield end, state
+        else:
+            base, check, fail = self._base, self._check, self._fail
+            for end, code in enumerate(codes, offset + 1):
+                while True:
+                    target = base[state] + code
+                    if check[target] == state:
+                        state = target
+                        break
+                    if not state:
+                        break
+                    state = fail[state]
+                if emit[state]:
+                    yield end, state
+
+    def _encode(self, text):
+        """
+        文本通过翻译表转换为字符编号（NumPy向量化），字母表外的字符为0，噪声字符为NOISE
+        """
+        codepoints = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        index = np.searchsorted(self._codepoints, codepoints)
+        index[index >= len(self._codepoints)] = 0
+        found = self._codepoints[index] == codepoints
+        return np.where(found, self._codes[index], 0).astype(np.int32)
+
+    def _strip_noise(self, codes):
+        """
+        去掉噪声字符
+        :return: (去掉噪声后的编号, 保留字符在原文中的位置)，没有噪声时位置为None
+        """
+        if not self._has_noise:
+            return codes, None
+        kept = np.flatnonzero(codes != NOISE)
+        return codes[kept], kept
+
+    def _scan_runs(self, codes):
+        """
+        按段并行扫描：各段按长度降序排列，第k步推进长度大于k的段，
+        超过MAX_LOCKSTEP_RUN的段逐字符扫描
+        :param codes: 不含噪声的字符编号
+        :return: 命中状态(结束位置数组（不含，codes中的位置）, 状态数组)，未排序
+        """
+        positions = np.flatnonzero(codes)
+        hit_ends, hit_states = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int32)]
+        if not len(positions):
+            return hit_ends[0], hit_states[0]
+        breaks = np.flatnonzero(np.diff(positions) != 1)
+        starts = np.concatenate([positions[:1], positions[breaks + 1]])
+        lengths = np.concatenate([positions[breaks], positions[-1:]]) + 1 - starts
+
+        long_runs = lengths > self.MAX_LOCKSTEP_RUN
+        for start, length in zip(starts[long_runs].tolist(), lengths[long_runs].tolist()):
+            hits = list(self._scan_codes(codes[start:start + length].tolist(), start))
+            if hits:
+                ends, states = zip(*hits)
+                hit_ends.append(np.array(ends, dtype=np.int64))
+                hit_states.append(np.array(states, dtype=np.int32))
+
+        order = np.argsort(-lengths[~long_runs], kind='stable')
+        starts, lengths = starts[~long_runs][order], lengths[~long_runs][order]
+        states = np.zeros(len(starts), dtype=np.int32)
+        for k in range(int(lengths[0]) if len(lengths) else 0):
+            active = int(np.searchsorted(-lengths, -k, side='left'))  # 长度大于k的段数
+            index = starts[:active] + k
+            states = self._step_np(states[:active], codes[index])
+            emitted = np.flatnonzero(self._emit_np[states])
+            if len(emitted):
+                hit_ends.append(index[emitted] + 1)
+                hit_states.append(states[emitted])
+        return np.concatenate(hit_ends), np.concatenate(hit_states)
+
+    def _scan_text(self, text):
+        """
+        长文本扫描：编码、去掉噪声后按段并行扫描，结束位置映射回原文
+        :return: (结束位置数组（不含，原文中的位置）, 状态数组)，未排序
+        """
+        codes, kept = self._strip_noise(self._encode(text))
+        ends, states = self._scan_runs(codes)
+        if kept is not None:
+            ends = kept[ends - 1] + 1
+        return ends, states
+
+    def _outputs(self, state):
+        """状态对应的全部敏感词下标（自身及输出链接）"""
+        word, link = self._word, self._link
+        target = state if word[state] >= 0 else link[state]
+        while target:
+            yield word[target]
+            target = link[target]
+
+    def iter_matches(self, text):
+        """
+        逐个产出命中：(结束位置（不含）, 敏感词下标)，按结束位置升序
+        """
+        if not self.words or not text:
+            return
+        if len(text) >= self.VECTORIZE_MIN_LENGTH:
+            ends, states = self._scan_text(text)
+            order = np.argsort(ends, kind='stable')
+            hits = zip(ends[order].tolist(), states[order].tolist())
+        else:
+            hits = self._scan_chars(text)
+        for end, state in hits:
+            for index in self._outputs(state):
+                yield end, index
+
+    def contains(self, text):
+        """
+        是否包含敏感词，命中第一个即返回
+        长文本按块扫描，相邻块重叠max_length - 1个字符（不计噪声），跨块的敏感词完整落在前一块中
+        """
+        if not self.words or not text:
+            return False
+        if len(text) < self.VECTORIZE_MIN_LENGTH:
+            return next(self._scan_chars(text), None) is not None
+        codes, _ = self._strip_noise(self._encode(text))
+        block, overlap = self.CONTAINS_BLOCK, self.max_length - 1
+        for start in range(0, len(codes), block):
+            if len(self._scan_runs(codes[start:start + block + overlap])[1]):
+                return True
+        return False
+
+    def _start(self, text, end, length):
+        """
+        命中的起始位置：从结束位置向前数length个非噪声字符
+        """
+        if not self._has_noise:
+            return end - length
+        get = self._alphabet.get
+        position = end
+        while length:
+            position -= 1
+            if get(text[position]) != NOISE:
+                length -= 1
+        return position
+
+    def find_all(self, text):
+        """
+        查找全部命中位置（包括重叠的命中），位置对应原文
+        :return: [(start, end, word), ...]，按结束位置升序，未指定normalizer时text[start:end] == word
+        """
+        words, lengths = self.words, self._lengths
+        return [(self._start(text, end, lengths[index]), end, words[index])
+                for end, index in self.iter_matches(text)]
+
+    def mask(self, text, mask_char='*'):
+        """
+        把文本中的敏感词（包括其中夹杂的噪声字符）替换为mask_char，每个字符替换为一个mask_char
+        """
+        return mask_spans(text, self.find_all(text), mask_char)
+
+    def search(self, text):
+        """在文本中搜索敏感词，返回命中的敏感词集合"""
+        if not self.words or not text:
+            return set()
+        if len(text) >= self.VECTORIZE_MIN_LENGTH:
+            states = np.unique(self._scan_text(text)[1]).tolist()
+        else:
+            states = {state for _, state in self._scan_chars(text)}
+        words = self.words
+        return {words[index] for state in states for index in self._outputs(state)}
+
+
+def parse_words(content):
+    """
+    解析词典内容：每行一个敏感词，忽略空行和#开头的注释
+    """
+    words = []
+    for line in content.splitlines():
+        word = line.strip()
+        if word and not word.startswith('#'):
+            words.append(word)
+    return words
+
+
+def build_automaton(words, normalizer=None, dense_budget=None):
+    """
+    构建敏感词自动机
+    :param words: 敏感词列表
+    :param normalizer: TextNormalizer，为None时精确匹配
+    """
+    automaton = CompiledACAutomaton(dense_budget, normalizer=normalizer)
+    for word in words:
+        automaton.add_word(word)
+    automaton.build_fail()
+    return automaton
+
+
+_batch_automaton = None  # 批量扫描工作进程使用的自动机，fork前设置，子进程直接继承
+# 当前进程中正在运行的批量扫描进程池数，期间fork出的工作进程不重启词典检查线程
+_batch_pools = 0
+_batch_pools_lock = threading.Lock()
+
+
+def _init_batch_worker(automaton):
+    global _batch_automaton
+    _batch_automaton = automaton
+
+
+def _filter_chunk(chunk):
+    """
+    扫描一块文本
+    :param chunk: (第一条文本的序号, 文本列表)
+    :return: [(序号, [(start, end, word), ...]), ...]，只包含有命中的文本
+    """
+    start, texts = chunk
+    find_all = _batch_automaton.find_all
+    results = []
+    for offset, text in enumerate(texts):
+        if text:
+            matches = find_all(text)
+            if matches:
+                results.append((start + offset, matches))
+    return results
+
+
+def _chunks(texts, chunk_size):
+    chunk = []
+    start = 0
+    for index, text in enumerate(texts):
+        chunk.append(text)
+        if len(chunk) >= chunk_size:
+            yield start, chunk
+            start = index + 1
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def filter_batch(texts, automaton, processes=None, chunk_size=256, max_pending=4):
+    """
+    多进程批量扫描敏感词，按输入顺序流式返回结果
+    支持fork时工作进程继承父进程中的自动机，否则在工作进程初始化时传入一次
+    texts按需读取，同时在处理中的块数不超过processes * max_pending，可以传入生成器扫描任意大的数据
+    :param texts: 文本的可迭代对象
+    :param automaton: CompiledACAutomaton
+    :param processes: 工作进程数，默认为CPU核数，为1时在当前进程中扫描
+    :param chunk_size: 每个任务包含的文本条数
+    :param max_pending: 每个工作进程最多排队的块数
+    :return: 生成器，产生(序号, [(start, end, word), ...])，只包含有命中的文本
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1:
+        _init_batch_worker(automaton)
+        for chunk in _chunks(texts, chunk_size):
+            yield from _filter_chunk(chunk)
+        return
+
+    global _batch_pools
+    with _batch_pools_lock:
+        _batch_pools += 1
+    try:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            _init_batch_worker(automaton)
+            pool = multiprocessing.get_context('fork').Pool(processes)
+        else:
+            pool = multiprocessing.get_context().Pool(processes, initializer=_init_batch_worker,
+                                                      initargs=(automaton,))
+        # 不使用imap：imap会在后台线程中一次读完texts，大批量数据时占满内存
+        pending = collections.deque()
+        with pool:
+            for chunk in _chunks(texts, chunk_size):
+                pending.append(pool.apply_async(_filter_chunk, (chunk,)))
+                if len(pending) >= processes * max_pending:
+                    yield from pending.popleft().get()
+            while pending:
+                yield from pending.popleft().get()
+    finally:
+        with _batch_pools_lock:
+            _batch_pools -= 1
+
+
+class SensitiveDictionary:
+    """
+    版本化的敏感词词典：
+    - 词典来源为文件（按修改时间和大小检测变化）或Redis键（按内容摘要检测变化）
+    - 后台线程定期检查，在请求路径之外构建新自动机，构建完成后替换引用（读取方无需加锁）
+    - 编译好的自动机连同词典摘要序列化到cache_path，摘要一致时直接加载
+    - 首次加载成功前loaded为False，调用方应把所有内容视为敏感（fail closed）；
+      之后重新加载失败时继续使用上一个版本
+    """
+
+    CACHE_FORMAT = 3  # 自动机结构变化时递增，旧缓存文件失效
+
+    def __init__(self, file_path='sensitive_words.txt', cache_path=None, redis_client=None, redis_key=None,
+                 check_interval=5.0, normalizer=None):
+        """
+        :param file_path: 词典文件路径（未配置redis_key时使用）
+        :param cache_path: 编译结果缓存文件路径，为None时不缓存
+        :param redis_client: Redis客户端
+        :param redis_key: 存放词典内容的Redis键（内容格式与词典文件相同）
+        :param check_interval: 后台检查词典变化的间隔（秒）
+        :param normalizer: 匹配时的字符归一化规则，为None时使用默认的TextNormalizer
+        """
+        self.file_path = file_path
+        self.cache_path = cache_path
+        self.redis_client = redis_client
+        self.redis_key = redis_key
+        self.check_interval = check_interval
+        self.normalizer = normalizer or TextNormalizer()
+        self.automaton = CompiledACAutomaton(normalizer=self.normalizer)
+        self.automaton.build_fail()
+        self.version = 0
+        self.digest = None
+        self._token = None
+        self._lock = threading.Lock()  # 串行化重新加载
+        self._watching = False
+        self._stats = {'loads': 0, 'cache_loads': 0, 'errors': 0, 'build_seconds': 0.0, 'load_seconds': 0.0}
+
+    @property
+    def loaded(self):
+        """
+        是否已成功加载过词典
+        """
+        return self.version > 0
+
+    def _read_source(self):
+        """
+        :return: (变化检测标记, 词典内容)，内容为None表示标记未变化无需读取
+        """
+        if self.redis_client is not None and self.redis_key:
+            content = self.redis_client.get(self.redis_key)
+            if content is None:
+                raise KeyError(f"Redis key not found: {self.redis_key}")
+            if isinstance(content, bytes):
+                content = content.decode('utf-8')
+            return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest(), content
+        stat = os.stat(self.file_path)
+        token = (stat.st_mtime_ns, stat.st_size)
+        if token == self._token:
+            return token, None
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            return token, f.read()
+
+    def _load_cache(self, digest):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('format') == self.CACHE_FORMAT and cached.get('digest') == digest:
+                return cached['automaton']
+        except Exception as e:
+            print(f"敏感词缓存加载失败：{str(e)}")
+        return None
+
+    def _save_cache(self, digest, automaton):
+        # 先写临时文件再原子替换，其他进程不会读到写了一半的文件
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump({'format': self.CACHE_FORMAT, 'digest': digest, 'automaton': automaton}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+        except Exception as e:
+            print(f"敏感词缓存写入失败：{str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def reload(self):
+        """
+        检查词典来源，有变化时加载（优先读缓存）或重新构建自动机并替换
+        :return: 是否替换了自动机
+        """
+        with self._lock:
+            token, content = self._read_source()
+            if content is None:
+                return False
+            # 摘要包含归一化规则，规则变化时不使用旧的编译缓存
+            digest = hashlib.blake2b((content + self.normalizer.signature()).encode('utf-8'),
+                                     digest_size=16).hexdigest()
+            if digest == self.digest:
+                self._token = token
+                return False
+
+            start = time.perf_counter()
+            automaton = self._load_cache(digest)
+            if automaton is not None:
+                self._stats['cache_loads'] += 1
+                self._stats['load_seconds'] = round(time.perf_counter() - start, 4)
+            else:
+                automaton = build_automaton(parse_words(content), self.normalizer)
+                self._stats['build_seconds'] = round(time.perf_counter() - start, 4)
+                if self.cache_path:
+                    self._save_cache(digest, automaton)
+
+            # 替换引用是原子操作，正在扫描的请求继续使用旧自动机
+            self.automaton = automaton
+            self.digest = digest
+            self._token = token
+            self.version += 1
+            self._stats['loads'] += 1
+            return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"敏感词词典重新加载失败：{str(e)}")
+
+    def start(self):
+        """
+        启动后台检查线程；启动过检查线程的进程fork出的子进程（gunicorn/celery worker）中自动重新启动，
+        filter_batch的工作进程除外
+        """
+        if self._watching or not self.check_interval or self.check_interval <= 0:
+            return
+        self._watching = True
+        threading.Thread(target=self._watch, name='sensitive-words', daemon=True).start()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # fork不复制线程，父进程的锁可能正被检查线程持有，子进程中重建锁并重新启动检查线程
+        self._lock = threading.Lock()
+        if not self._watching:
+            return
+        if _batch_pools:
+            # 批量扫描的工作进程只使用传入的自动机，不需要检查线程，其子进程也不再启动
+            self._watching = False
+            return
+        threading.Thread(target=self._watch, name='sensitive-words', daemon=True).start()
+
+    def stats(self):
+        """
+        当前版本、词条数和加载统计
+        """
+        automaton = self.automaton
+        return dict(self._stats, version=self.version, digest=self.digest, words=len(automaton),
+                    states=automaton.num_states, dense=automaton.dense,
+                    source=f"redis:{self.redis_key}" if self.redis_client is not None and self.redis_key
+                    else self.file_path)
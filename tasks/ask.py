@@ -8,6 +8,7 @@ import base64
 import openai
 import  time
 import  utils
+from app.utils import http_client
 
 # 尝试导入SSDB客户端，若失败则跳过
 ssdb_available = False
@@ -37,7 +38,8 @@ def sendCustomMsg(answer,from_user) :
         headers = {"Content-Type": "application/json charset=utf-8"}
         _data = json.dumps(message, ensure_ascii=False)
         # print(_data)
-        response= requests.post(url, data=_data.encode('utf-8'), headers=headers)
+        # 发送消息不是幂等的，不重试，避免用户收到重复消息
+        response= http_client.get_client('wechat', read_timeout=10.0, max_retries=0).post(url, data=_data.encode('utf-8'), headers=headers)
         response.raise_for_status() 
         print(response.text)
     except requests.exceptions.RequestException as e:
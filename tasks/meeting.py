@@ -5,6 +5,7 @@ import json
 from werkzeug.utils import secure_filename
 import configparser
 from app.utils.storage import storage
+from app.utils import http_client
 
 # 加载配置文件
 config = configparser.ConfigParser()
@@ -35,7 +36,8 @@ def generate_meeting_minutes(audio_file_path, audio_filename, background_id=None
         
         with storage.open_file(audio_file_path, 'rb') as f:
             files = {'audio': (audio_filename, f, 'audio/wav')}
-            response = requests.post(audio_recognition_url, files=files)
+            response = http_client.get_client('audio', audio_recognition_url, read_timeout=300.0).post(
+                audio_recognition_url, files=files)
             response.raise_for_status()
         
         # 解析音频识别结果
@@ -74,7 +76,7 @@ def generate_meeting_minutes(audio_file_path, audio_filename, background_id=None
         
         # 调用大模型生成会议记录
         VLLM_SERVER_URL = config.get('vllm', 'server_url', fallback='http://localhost:8000/generate')
-        response = requests.post(
+        response = http_client.get_client('generate', VLLM_SERVER_URL, read_timeout=120.0, max_retries=1).post(
             VLLM_SERVER_URL,
             json={'prompt': prompt, 'temperature': 0.7, 'max_tokens': 1024}
         )
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试语义答案缓存
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import time
+
+import numpy as np
+
+from app.utils.answer_cache import AnswerCache
+
+
+def test_similarity_threshold():
+    """测试相似查询命中，不相似的查询不命中"""
+    cache = AnswerCache(threshold=0.95)
+    cache.put(np.array([1.0, 0.0, 0.0]), 'answer')
+
+    value, similarity = cache.get(np.array([10.0, 1.0, 0.0]))
+    assert value == 'answer' and similarity > 0.99
+    value, similarity = cache.get(np.array([1.0, 1.0, 0.0]))
+    assert value is None and similarity < 0.95
+
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+
+def test_version_and_ttl():
+    """测试语料版本变化和过期后不再命中"""
+    cache = AnswerCache(ttl=0.05)
+    cache.put(np.array([0.0, 1.0]), 'old')
+    cache.bump_version()
+    assert cache.get(np.array([0.0, 1.0]))[0] is None
+
+    cache.put(np.array([0.0, 1.0]), 'new')
+    assert cache.get(np.array([0.0, 1.0]))[0] == 'new'
+    time.sleep(0.1)
+    assert cache.get(np.array([0.0, 1.0]))[0] is None
+
+
+def test_put_with_stale_version():
+    """测试检索期间语料更新时，基于旧语料生成的答案不写入"""
+    cache = AnswerCache()
+    version = cache.version
+    cache.bump_version()
+    assert not cache.put(np.array([0.0, 1.0]), 'stale', version=version)
+    assert cache.get(np.array([0.0, 1.0]))[0] is None
+    assert cache.put(np.array([0.0, 1.0]), 'fresh', version=cache.version)
+    assert cache.get(np.array([0.0, 1.0]))[0] == 'fresh'
+
+
+def test_eviction():
+    """测试满时优先淘汰失效条目，其次淘汰最久未命中的条目"""
+    cache = AnswerCache(max_size=2)
+    cache.put(np.array([1.0, 0.0, 0.0]), 'a')
+    cache.put(np.array([0.0, 1.0, 0.0]), 'b')
+    cache.get(np.array([1.0, 0.0, 0.0]))
+    cache.put(np.array([0.0, 0.0, 1.0]), 'c')
+
+    assert cache.get(np.array([1.0, 0.0, 0.0]))[0] == 'a'
+    assert cache.get(np.array([0.0, 1.0, 0.0]))[0] is None
+    assert cache.get(np.array([0.0, 0.0, 1.0]))[0] == 'c'
+    assert cache.stats()['evictions'] == 1
+
+
+if __name__ == "__main__":
+    test_similarity_threshold()
+    test_version_and_ttl()
+    test_put_with_stale_version()
+    test_eviction()
+    print("所有测试通过")
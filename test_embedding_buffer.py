@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试连续向量缓冲区
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+
+import faiss
+import numpy as np
+
+from app.utils.embedding_buffer import EmbeddingBuffer
+
+
+def test_growth():
+    """测试追加时按倍数扩容且数据保持不变"""
+    rng = np.random.default_rng(0)
+    buffer = EmbeddingBuffer(4, capacity=2)
+    batches = [rng.random((n, 4), dtype='float32') for n in (1, 2, 5)]
+    for batch in batches:
+        buffer.append(batch)
+
+    assert len(buffer) == 8
+    assert buffer.capacity == 8
+    assert np.array_equal(buffer.as_float32(), np.vstack(batches))
+    # float32存储返回视图，不复制
+    assert np.shares_memory(buffer.get(0, 2), buffer.as_float32())
+
+
+def test_quantized():
+    """测试float16和int8量化存储的精度和内存占用"""
+    rng = np.random.default_rng(1)
+    embeddings = rng.standard_normal((10, 16)).astype('float32')
+    for dtype, tolerance, row_bytes in (('float16', 1e-2, 32), ('int8', 5e-2, 20)):
+        buffer = EmbeddingBuffer(16, dtype=dtype)
+        buffer.append(embeddings)
+        assert np.allclose(buffer.as_float32(), embeddings, atol=tolerance * np.abs(embeddings).max())
+        assert buffer.memory_usage()['bytes_per_vector'] == row_bytes
+
+
+def test_save_and_load():
+    """测试保存后mmap加载，追加的行写入私有尾部，映射的部分不复制"""
+    embeddings = np.arange(12, dtype='float32').reshape(3, 4)
+    buffer = EmbeddingBuffer(4, dtype='int8')
+    buffer.append(embeddings)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'embeddings.npy')
+        buffer.save(path)
+        loaded = EmbeddingBuffer.load(path, dtype='int8')
+        assert np.allclose(loaded.as_float32(), buffer.as_float32())
+
+        loaded.append(np.ones((1, 4), dtype='float32'))
+        assert len(loaded) == 4
+        assert np.allclose(loaded.get(3, 4), 1.0)
+        assert np.allclose(loaded.get(0, 3), buffer.as_float32())
+        assert loaded.memory_usage()['mapped_bytes'] == 3 * 8
+
+
+def test_attach_and_replace():
+    """测试引用其他缓冲区的行不复制，私有的行可以换成内容相同的映射"""
+    rng = np.random.default_rng(3)
+    embeddings = rng.random((6, 4), dtype='float32')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'embeddings.npy')
+        source = EmbeddingBuffer(4)
+        source.append(embeddings[:4])
+        source.save(path)
+
+        buffer = EmbeddingBuffer(4)
+        buffer.append(embeddings[:1])
+        buffer.attach(EmbeddingBuffer.load(path), offset=1)
+        buffer.append(embeddings[4:])
+        assert np.array_equal(buffer.as_float32(), embeddings)
+        assert buffer.memory_usage()['mapped_bytes'] == 3 * 16
+        D, I = buffer.search(embeddings[[0, 2, 5]], 1, faiss.METRIC_L2)
+        assert I[:, 0].tolist() == [0, 2, 5]
+
+        # 尾部中的行已保存到文件后换成映射，范围不对齐时不替换
+        tail_path = os.path.join(tmp_dir, 'tail.npy')
+        buffer.save(tail_path, 4, 6)
+        assert not buffer.replace(3, 6, lambda: EmbeddingBuffer.load(tail_path))
+        assert buffer.replace(4, 6, lambda: EmbeddingBuffer.load(tail_path))
+        assert np.array_equal(buffer.as_float32(), embeddings)
+        assert buffer.memory_usage()['private_bytes'] == 16
+
+
+def test_search():
+    """测试在缓冲区上精确检索，量化存储分块检索的结果与整体检索一致"""
+    rng = np.random.default_rng(2)
+    embeddings = rng.standard_normal((50, 8)).astype('float32')
+    queries = embeddings[[3, 17]]
+    for dtype in EmbeddingBuffer.DTYPES:
+        buffer = EmbeddingBuffer(8, dtype=dtype)
+        buffer.append(embeddings)
+        expected = faiss.knn(queries, buffer.as_float32()[:40], 5, metric=faiss.METRIC_L2)
+        buffer.SEARCH_BLOCK_ROWS = 7
+        D, I = buffer.search(queries, 5, faiss.METRIC_L2, end=40)
+        assert np.array_equal(I, expected[1])
+        assert np.allclose(D, expected[0], atol=1e-4)
+        assert I[0, 0] == 3 and I[1, 0] == 17
+
+
+if __name__ == "__main__":
+    test_growth()
+    test_quantized()
+    test_save_and_load()
+    test_attach_and_replace()
+    test_search()
+    print("所有测试通过")
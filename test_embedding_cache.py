@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试查询向量缓存
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import time
+
+import numpy as np
+
+from app.utils.embedding_cache import EmbeddingCache
+
+
+class DictRedis:
+    """只实现缓存用到的get/set/setex"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+
+def test_lru_and_normalize():
+    """测试归一化后的相同查询命中，超出容量时淘汰最久未使用的条目"""
+    cache = EmbeddingCache(max_size=2)
+    cache.put('m', '什么是 RAG？', np.array([1, 2], dtype='float32'))
+    assert np.array_equal(cache.get('m', '  什么是   rag？ '), [1, 2])
+    assert cache.get('other-model', '什么是 RAG？') is None
+
+    cache.put('m', 'a', np.zeros(2))
+    cache.get('m', '什么是 RAG？')
+    cache.put('m', 'b', np.ones(2))
+    assert cache.get('m', 'a') is None
+    assert cache.get('m', '什么是 rag？') is not None
+
+    stats = cache.stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 2
+    assert stats['size'] == 2
+
+
+def test_ttl():
+    """测试过期条目不再命中"""
+    cache = EmbeddingCache(ttl=0.05)
+    cache.put('m', 'q', np.ones(4))
+    assert cache.get('m', 'q') is not None
+    time.sleep(0.1)
+    assert cache.get('m', 'q') is None
+
+
+def test_redis_tier():
+    """测试进程内未命中时从Redis读取并回填"""
+    redis_client = DictRedis()
+    EmbeddingCache(redis_client=redis_client).put('m', 'q', np.arange(3))
+
+    cache = EmbeddingCache(redis_client=redis_client)
+    assert np.array_equal(cache.get('m', 'q'), [0, 1, 2])
+    assert cache.get('m', 'q') is not None
+    stats = cache.stats()
+    assert stats['redis_hits'] == 1
+    assert stats['hits'] == 1
+
+
+if __name__ == "__main__":
+    test_lru_and_normalize()
+    test_ttl()
+    test_redis_tier()
+    print("所有测试通过")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试并发嵌入流水线
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import threading
+
+import numpy as np
+
+from app.utils.embedding_pipeline import EmbeddingPipeline, make_batches
+
+
+def fake_embed(texts):
+    return [[float(text), 1.0] for text in texts]
+
+
+def test_make_batches():
+    """测试按token预算和条数上限切分，超长文本单独成批"""
+    texts = ['a' * 10, 'b' * 10, 'c' * 100, 'd' * 10, 'e' * 10, 'f' * 10]
+    batches = make_batches(texts, max_batch_tokens=30, max_batch_size=2, count_tokens=len)
+    assert batches == [(0, 2), (2, 3), (3, 5), (5, 6)]
+    assert make_batches([]) == []
+
+
+def test_order_preserved():
+    """测试并发执行后结果保持原顺序"""
+    texts = [str(i) for i in range(100)]
+    pipeline = EmbeddingPipeline(fake_embed, max_batch_size=7, max_workers=4)
+    embeddings, stats = pipeline.embed(texts)
+    assert embeddings.shape == (100, 2)
+    assert np.array_equal(embeddings[:, 0], np.arange(100))
+    assert stats['batches'] == 15
+    assert stats['retried_batches'] == 0
+
+
+def test_retry_failed_batches():
+    """测试只重试失败的批次"""
+    calls = {}
+    lock = threading.Lock()
+
+    def flaky_embed(texts):
+        with lock:
+            calls[texts[0]] = calls.get(texts[0], 0) + 1
+            first_call = calls[texts[0]] == 1
+        if texts[0] == '10' and first_call:
+            raise ConnectionError('backend unavailable')
+        return fake_embed(texts)
+
+    pipeline = EmbeddingPipeline(flaky_embed, max_batch_size=10, max_workers=2)
+    embeddings, stats = pipeline.embed([str(i) for i in range(30)])
+    assert np.array_equal(embeddings[:, 0], np.arange(30))
+    assert stats['retried_batches'] == 1
+    assert calls == {'0': 1, '10': 2, '20': 1}
+
+    def broken_embed(texts):
+        raise ConnectionError('backend unavailable')
+
+    try:
+        EmbeddingPipeline(broken_embed, max_retries=1).embed(['a'])
+        assert False, 'expected ConnectionError'
+    except ConnectionError:
+        pass
+
+
+if __name__ == "__main__":
+    test_make_batches()
+    test_order_preserved()
+    test_retry_failed_batches()
+    print("所有测试通过")
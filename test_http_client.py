@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试带连接池、超时和重试的HTTP客户端
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.utils.http_client import HttpClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 前fail_count次请求返回503
+    fail_count = 0
+    client_ports = []
+
+    def do_POST(self):
+        Handler.client_ports.append(self.client_address[1])
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path == '/slow':
+            time.sleep(0.5)
+        if Handler.fail_count > 0:
+            Handler.fail_count -= 1
+            status, payload = 503, b'{}'
+        else:
+            status, payload = 200, body
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except BrokenPipeError:
+            # 客户端已超时断开
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def test_keep_alive():
+    """测试多次请求复用同一个连接"""
+    server, base_url = start_server()
+    try:
+        Handler.client_ports = []
+        client = HttpClient('test', base_url + '/echo')
+        for i in range(5):
+            response = client.post(json={'i': i})
+            assert response.json() == {'i': i}
+        assert len(set(Handler.client_ports)) == 1
+        assert client.metrics()['requests'] == 5
+    finally:
+        server.shutdown()
+
+
+def test_retry():
+    """测试幂等请求在503时按退避重试，超过重试次数返回最后一次响应"""
+    server, base_url = start_server()
+    try:
+        client = HttpClient('test', base_url + '/echo', max_retries=2, backoff=0.01, idempotent=True)
+        Handler.fail_count = 2
+        assert client.post(data=json.dumps({'ok': 1})).status_code == 200
+
+        Handler.fail_count = 5
+        assert client.post(data='{}').status_code == 503
+        Handler.fail_count = 0
+
+        metrics = client.metrics()
+        assert metrics['requests'] == 2
+        assert metrics['retries'] == 4
+        assert metrics['errors'] == 1
+    finally:
+        server.shutdown()
+
+
+def test_no_retry_for_non_idempotent_post():
+    """测试非幂等的POST在503和读取超时时不重试"""
+    server, base_url = start_server()
+    try:
+        client = HttpClient('test', base_url + '/echo', max_retries=2, backoff=0.01)
+        Handler.fail_count = 1
+        assert client.post(data='{}').status_code == 503
+        assert Handler.fail_count == 0
+        assert client.post(data='{}').status_code == 200
+
+        client = HttpClient('test', base_url + '/slow', read_timeout=0.1, max_retries=2, backoff=0.01)
+        Handler.client_ports = []
+        try:
+            client.post(json={})
+            assert False, 'expected timeout'
+        except requests.exceptions.Timeout:
+            pass
+        assert len(Handler.client_ports) == 1
+        assert client.metrics()['retries'] == 0
+    finally:
+        server.shutdown()
+
+
+def test_timeout():
+    """测试读取超时抛出异常并计入错误"""
+    server, base_url = start_server()
+    try:
+        client = HttpClient('test', base_url + '/slow', read_timeout=0.1, max_retries=0)
+        try:
+            client.post(json={})
+            assert False, 'expected timeout'
+        except requests.exceptions.Timeout:
+            pass
+        assert client.metrics()['errors'] == 1
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_keep_alive()
+    test_retry()
+    test_no_retry_for_non_idempotent_post()
+    test_timeout()
+    print("所有测试通过")
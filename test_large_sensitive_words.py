@@ -13,6 +13,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from utils import ACAutomaton
+from sensitive_filter import CompiledACAutomaton
 
 def generate_large_sensitive_words(count=10000):
     """生成大量敏感词"""
@@ -88,8 +89,22 @@ def test_performance_with_large_words():
         ac_result = ac_filter(large_test_text)
         ac_time = time.time() - start_time
         
+        # 测试编译后的AC自动机
+        start_time = time.time()
+        compiled = CompiledACAutomaton()
+        for word in sensitive_words:
+            compiled.add_word(word.lower())
+        compiled.build_fail()
+        compile_time = time.time() - start_time
+        
+        start_time = time.time()
+        compiled_result = len(compiled.search(large_test_text.lower())) > 0
+        compiled_time = time.time() - start_time
+        
         print(f"线性匹配: {linear_time:.4f}秒, 结果: {'敏感' if linear_result else '正常'}")
         print(f"AC自动机: {ac_time:.4f}秒, 结果: {'敏感' if ac_result else '正常'}")
+        print(f"编译AC自动机: {compiled_time:.4f}秒（构建{compile_time:.4f}秒，"
+              f"{'稠密转移表' if compiled.dense else '双数组'}）, 结果: {'敏感' if compiled_result else '正常'}")
         print(f"性能差异: {'AC自动机快' if ac_time < linear_time else '线性匹配快'}, 速度提升: {max(linear_time, ac_time)/min(linear_time, ac_time):.2f}倍")
     
     print("\n=== 测试总结 ===")
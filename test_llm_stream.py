@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试大模型流式输出解析
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import json
+
+from app.utils.llm_stream import stream_completion
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False, delimiter=None):
+        for line in self.body.split(delimiter or b'\n'):
+            yield line.decode('utf-8') if decode_unicode else line
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, body):
+        self.response = FakeResponse(body)
+        self.payload = None
+
+    def post(self, url=None, json=None, stream=False):
+        assert stream
+        self.payload = json
+        return self.response
+
+
+def test_vllm_stream():
+    """测试vLLM /generate流：累计文本（含prompt）转换为增量片段"""
+    prompt = '问题：'
+    outputs = [prompt + '你', prompt + '你好', prompt + '你好，世界']
+    body = b'\0'.join(json.dumps({'text': [text]}).encode('utf-8') for text in outputs) + b'\0'
+    client = FakeClient(body)
+    assert list(stream_completion(client, prompt)) == ['你', '好', '，世界']
+    assert client.payload['stream'] is True
+    assert client.response.closed
+
+
+def test_openai_stream():
+    """测试OpenAI兼容SSE流，兼容completions和chat两种格式"""
+    events = [
+        {'choices': [{'text': 'Hello'}]},
+        {'choices': [{'delta': {'content': ' world'}}]},
+        {'choices': [{'delta': {}}]},
+    ]
+    body = ''.join(f'data: {json.dumps(event)}\n\n' for event in events) + 'data: [DONE]\n\n'
+    client = FakeClient(body.encode('utf-8'))
+    assert list(stream_completion(client, 'p', api='openai', model='m')) == ['Hello', ' world']
+    assert client.payload['model'] == 'm'
+
+
+if __name__ == "__main__":
+    test_vllm_stream()
+    test_openai_stream()
+    print("所有测试通过")
@@ -13,6 +13,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from utils import filter_content, ACAutomaton
+from sensitive_filter import CompiledACAutomaton
 
 # 创建测试数据
 def create_test_data():
@@ -29,7 +30,7 @@ def create_test_data():
     
     return normal_text, sensitive_text, large_text, large_sensitive_text
 
-def test_linear_performance(sensitive_words, test_texts):
+def benchmark_linear_performance(sensitive_words, test_texts):
     """测试线性匹配性能"""
     print("\n=== 线性匹配性能测试 ===")
     
@@ -50,7 +51,7 @@ def test_linear_performance(sensitive_words, test_texts):
         elapsed = end_time - start_time
         print(f"{name}: {elapsed:.4f}秒, 结果: {'敏感' if result else '正常'}")
 
-def test_ac_performance(automaton, test_texts):
+def benchmark_ac_performance(automaton, test_texts):
     """测试AC自动机性能"""
     print("\n=== AC自动机性能测试 ===")
     
@@ -69,6 +70,32 @@ def test_ac_performance(automaton, test_texts):
         elapsed = end_time - start_time
         print(f"{name}: {elapsed:.4f}秒, 结果: {'敏感' if result else '正常'}")
 
+def benchmark_compiled_performance(sensitive_words, test_texts, runs=10):
+    """对比原AC自动机与编译后的AC自动机（数组存储的转移表）"""
+    print("\n=== 原AC自动机 vs 编译AC自动机 ===")
+    
+    automata = []
+    for cls in (ACAutomaton, CompiledACAutomaton):
+        start_time = time.time()
+        automaton = cls()
+        for word in sensitive_words:
+            automaton.add_word(word.lower())
+        automaton.build_fail()
+        automata.append(automaton)
+        print(f"{cls.__name__} 构建: {time.time() - start_time:.4f}秒")
+    
+    for name, text in test_texts:
+        processed_content = text.lower()
+        elapsed = []
+        for automaton in automata:
+            start_time = time.time()
+            for i in range(runs):
+                found = automaton.search(processed_content)
+            elapsed.append((time.time() - start_time) / runs)
+        assert automata[0].search(processed_content) == found
+        print(f"{name}: 原AC自动机 {elapsed[0]:.6f}秒, 编译AC自动机 {elapsed[1]:.6f}秒, "
+              f"提升 {elapsed[0] / elapsed[1]:.2f}倍")
+
 def main():
     # 加载敏感词
     with open('sensitive_words.txt', 'r', encoding='utf-8') as f:
@@ -96,10 +123,10 @@ def main():
     print(f"长文本长度: {len(large_text)}字符")
     
     # 测试线性匹配性能
-    test_linear_performance(sensitive_words, test_texts)
+    benchmark_linear_performance(sensitive_words, test_texts)
     
     # 测试AC自动机性能
-    test_ac_performance(automaton, test_texts)
+    benchmark_ac_performance(automaton, test_texts)
     
     # 测试多次运行的平均性能
     print("\n=== 多次运行平均性能测试 (10次) ===")
@@ -122,6 +149,9 @@ def main():
     print(f"AC自动机平均: {(ac_total/runs):.4f}秒")
     
     print(f"\n性能提升倍数: {(linear_total/ac_total):.2f}倍")
+    
+    # 对比编译后的AC自动机
+    benchmark_compiled_performance(sensitive_words, test_texts)
 
 def linear_filter(content):
     """模拟原始的线性匹配"""
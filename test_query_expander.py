@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试查询扩展引擎
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+
+from query_expansion import QueryExpander, expand_query, get_query_expander
+
+
+def write_dict(path, content, mtime):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.utime(path, (mtime, mtime))
+
+
+def test_expand_and_cache():
+    """测试扩展结果与expand_query一致，重复查询命中缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'keywords.txt')
+        write_dict(path, '电脑 计算机 微机 PC\n', 1000)
+        expander = QueryExpander(path, topn=2)
+
+        expanded = expander.expand('电脑坏了')
+        assert expanded == expand_query('电脑坏了', {'电脑': ['计算机', '微机', 'PC']}, topn=2)
+        assert '计算机' in expanded and 'PC' not in expanded
+        assert expander.expand('电脑坏了') == expanded
+
+        stats = expander.stats()
+        assert stats['calls'] == 2
+        assert stats['hits'] == 1
+
+
+def test_reload_on_mtime_change():
+    """测试词典文件修改后重新加载并清空缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'keywords.txt')
+        write_dict(path, '电脑 计算机\n', 1000)
+        expander = QueryExpander(path, check_interval=0)
+        assert '计算机' in expander.expand('电脑')
+
+        write_dict(path, '电脑 笔记本\n', 2000)
+        expanded = expander.expand('电脑')
+        assert '笔记本' in expanded and '计算机' not in expanded
+        assert expander.stats()['loads'] == 2
+
+
+def test_topn_per_call():
+    """测试每次调用指定的topn生效，不同topn的结果分别缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'keywords.txt')
+        write_dict(path, '电脑 计算机 微机 PC\n', 1000)
+        expander = QueryExpander(path, topn=2)
+        assert 'PC' not in expander.expand('电脑坏了')
+        assert 'PC' in expander.expand('电脑坏了', topn=3)
+        assert '计算机' not in expander.expand('电脑坏了', topn=0)
+        assert expander.stats()['hits'] == 0
+
+        # 共享的扩展引擎按词典文件区分
+        other = os.path.join(tmp_dir, 'other.txt')
+        write_dict(other, '电脑 笔记本\n', 1000)
+        assert get_query_expander(path) is get_query_expander(path)
+        assert '笔记本' in get_query_expander(other).expand('电脑', topn=1)
+        assert '笔记本' not in get_query_expander(path).expand('电脑', topn=3)
+
+
+if __name__ == "__main__":
+    test_expand_and_cache()
+    test_reload_on_mtime_change()
+    test_topn_per_call()
+    print("所有测试通过")
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试增量混合检索索引
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from app.utils.rag_index import HybridIndex, BM25Index, IndexSnapshot, ReadWriteLock
+
+
+def make_embeddings(n, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((n, dim), dtype='float32')
+
+
+def test_incremental_add():
+    """测试多次上传后索引与文档保持一致"""
+    index = HybridIndex()
+    index.add(['apple banana', 'banana cherry'], make_embeddings(2, seed=1))
+    index.add(['cherry durian apple'], make_embeddings(1, seed=2))
+
+    assert len(index) == 3
+    # flat直接在向量缓冲区上检索，FAISS中不保存第二份向量
+    assert len(index.embeddings) == 3
+    assert index.vector_index.ntotal == 0
+    assert index.bm25.total_len == 7
+
+    results = index.search_bm25('durian', 10)
+    assert [doc_id for doc_id, _ in results] == [2]
+
+    results = index.search_bm25('apple', 10)
+    assert sorted(doc_id for doc_id, _ in results) == [0, 2]
+
+
+def test_vector_search():
+    """测试向量检索返回最近的文档"""
+    index = HybridIndex()
+    embeddings = make_embeddings(5)
+    index.add([f'doc{i}' for i in range(5)], embeddings)
+
+    results = index.search_vector(embeddings[3:4], 1)
+    assert results[0][0] == 3
+
+
+def test_snapshot_isolation():
+    """测试快照不包含之后新增的文档"""
+    index = HybridIndex()
+    index.add(['apple'], make_embeddings(1, seed=1))
+    snapshot = index.snapshot()
+    embeddings = make_embeddings(1, seed=2)
+    index.add(['apple'], embeddings)
+
+    assert [doc_id for doc_id, _ in index.search_bm25('apple', 10, snapshot)] == [0]
+    assert all(doc_id < 1 for doc_id, _ in index.search_vector(embeddings, 2, snapshot))
+    assert len(index.search_bm25('apple', 10)) == 2
+
+
+def test_bm25_merge():
+    """测试增量段合并进CSR主段前后得分一致"""
+    rng = np.random.default_rng(3)
+    vocab = [f'w{i}' for i in range(30)]
+    docs = [list(rng.choice(vocab, size=rng.integers(1, 12))) for _ in range(50)]
+
+    merged = BM25Index(merge_min_docs=8)
+    unmerged = BM25Index(merge_min_docs=10 ** 9)
+    for i in range(0, len(docs), 5):
+        merged.add(docs[i:i + 5])
+        unmerged.add(docs[i:i + 5])
+    assert merged._state[0] and not unmerged._state[0]
+
+    snapshot = IndexSnapshot(len(merged), merged.total_len)
+    for query in (['w1'], ['w2', 'w3', 'w4'], ['w5', 'missing']):
+        expected = unmerged.top_n(query, 10, snapshot)
+        actual = merged.top_n(query, 10, snapshot)
+        assert [doc_id for doc_id, _ in actual] == [doc_id for doc_id, _ in expected]
+        assert np.allclose([score for _, score in actual], [score for _, score in expected])
+
+
+def test_keyword_search():
+    """测试二元组倒排索引的关键词匹配结果与线性扫描一致"""
+    docs = ['机器学习是人工智能的核心', '深度学习使用神经网络', '人工智能与机器人', 'RAG系统结合检索']
+    index = HybridIndex()
+    index.add(docs, make_embeddings(len(docs)))
+    keywords = ['人工', '智能', '人工智能', '学习', '学习', 'RAG', '不存在']
+
+    expected = []
+    for i, doc in enumerate(docs):
+        score = sum(1 for kw in keywords if kw in doc)
+        if score > 0:
+            expected.append((i, score))
+    expected = sorted(expected, key=lambda x: x[1], reverse=True)
+
+    assert index.search_keywords(keywords, 10) == expected
+
+
+def test_save_and_load():
+    """测试持久化后以mmap方式加载并继续追加"""
+    index = HybridIndex()
+    embeddings = make_embeddings(3)
+    index.add(['apple banana', '苹果 香蕉', 'cherry'], embeddings)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, 'corpus')
+        index.save(corpus_dir)
+        loaded = HybridIndex.load(corpus_dir)
+
+        assert len(loaded) == 3
+        assert loaded.documents[1] == '苹果 香蕉'
+        assert loaded.search_bm25('apple', 10) == index.search_bm25('apple', 10)
+        assert loaded.search_vector(embeddings[2:3], 1)[0][0] == 2
+        assert loaded.search_keywords(['香蕉'], 10) == [(1, 1)]
+        # 内积度量下存储的是归一化后的向量
+        assert np.allclose(loaded.embeddings.as_float32(), embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True))
+
+        loaded.add(['apple durian'], make_embeddings(1, seed=5))
+        assert len(loaded) == 4
+        assert loaded.documents[3] == 'apple durian'
+        assert sorted(doc_id for doc_id, _ in loaded.search_bm25('apple', 10)) == [0, 3]
+
+        # 再次保存覆盖旧目录
+        loaded.save(corpus_dir)
+        assert len(HybridIndex.load(corpus_dir)) == 4
+
+
+def test_segmented_save():
+    """测试每次保存只写入新增文档组成的段，段按大小合并，加载结果与内存中的索引一致"""
+    index = HybridIndex()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, 'corpus')
+        for step in range(6):
+            docs = [f'doc{step} w{i} w{step}' for i in range(step + 2)]
+            index.add(docs, make_embeddings(len(docs), seed=step))
+            manifest = index.save(corpus_dir)
+            # 最后一个段只包含本次新增的文档，或者是合并后的段
+            assert manifest['segments'][-1]['end'] == len(index)
+        assert manifest['num_docs'] == len(index) == 27
+        assert [(s['start'], s['end']) for s in manifest['segments']] == [(0, 14), (14, 27)]
+        assert index.save(corpus_dir)['version'] == manifest['version']
+
+        loaded = HybridIndex.load(corpus_dir)
+        assert list(loaded.documents) == list(index.documents)
+        for query in ('w1', 'w3 doc5', 'missing'):
+            assert loaded.search_bm25(query, 10) == index.search_bm25(query, 10)
+        assert loaded.search_keywords(['doc4'], 10) == index.search_keywords(['doc4'], 10)
+        embeddings = make_embeddings(2, seed=9)
+        assert loaded.search_vector_batch(embeddings, 5) == index.search_vector_batch(embeddings, 5)
+        # 旧版本的段和manifest只保留上一个版本
+        names = os.listdir(corpus_dir)
+        assert sum(name.startswith('manifest-') for name in names) == 2
+
+
+def test_shared_corpus():
+    """测试多个进程共享语料目录：追加前同步其他进程发布的文档，不互相覆盖；有未保存文档时冲突报错"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, 'corpus')
+        workers = [HybridIndex(), HybridIndex()]
+        for step in range(4):
+            for i, worker in enumerate(workers):
+                worker.add_and_persist(corpus_dir, [f'w{i} step{step}'], make_embeddings(1, seed=step * 2 + i))
+        # 最后一次追加之后，worker 0还缺少worker 1发布的一个文档
+        assert workers[0].sync(corpus_dir) == 1
+        assert workers[1].sync(corpus_dir) == 0
+        loaded = HybridIndex.load(corpus_dir)
+        assert len(loaded) == 8
+        for worker in workers:
+            assert list(worker.documents) == list(loaded.documents)
+            assert worker.search_bm25('step2', 5) == loaded.search_bm25('step2', 5)
+
+        # 新启动的空索引接管已有语料
+        fresh = HybridIndex()
+        fresh.add_and_persist(corpus_dir, ['fresh'], make_embeddings(1, seed=20))
+        assert list(fresh.documents) == list(loaded.documents) + ['fresh']
+
+        workers[1].add(['local only'], make_embeddings(1, seed=21))
+        try:
+            workers[1].save(corpus_dir)
+            assert False, 'expected RuntimeError'
+        except RuntimeError:
+            pass
+        assert len(HybridIndex.load(corpus_dir)) == 9
+
+
+def test_mapped_segments():
+    """测试已发布的文档以mmap方式映射：同步和上传之后各进程不持有语料的私有副本"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, 'corpus')
+        index = HybridIndex()
+        index.add([f'doc{i} w{i % 3}' for i in range(10)], make_embeddings(10))
+        index.save(corpus_dir)
+        workers = [HybridIndex.load(corpus_dir), HybridIndex.load(corpus_dir)]
+        for step in range(6):
+            worker = workers[step % 2]
+            worker.add_and_persist(corpus_dir, [f'new{step} w{step % 3}'], make_embeddings(1, seed=step + 1))
+        worker.save(corpus_dir)
+        for worker in workers:
+            worker.sync(corpus_dir)
+            assert worker.embeddings.memory_usage()['private_bytes'] == 0
+            assert not any(part.private for part in worker.bm25._state[0])
+            assert not any(isinstance(part, list) for part in worker.documents._state[1])
+
+        loaded = HybridIndex.load(corpus_dir)
+        embeddings = make_embeddings(2, seed=9)
+        for worker in workers:
+            assert list(worker.documents) == list(loaded.documents)
+            assert worker.search_bm25('w1 new3', 10) == loaded.search_bm25('w1 new3', 10)
+            assert worker.search_keywords(['new'], 10) == loaded.search_keywords(['new'], 10)
+            assert worker.search_vector_batch(embeddings, 5) == loaded.search_vector_batch(embeddings, 5)
+
+
+def test_tokenize_once():
+    """测试每个文本块只在入库时分词一次，写段和同步其他进程的段不重新分词"""
+    calls = []
+
+    def tokenizer(text):
+        calls.append(text)
+        return text.split()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, 'corpus')
+        writer = HybridIndex(tokenizer=tokenizer)
+        reader = HybridIndex(tokenizer=tokenizer)
+        writer.add_and_persist(corpus_dir, ['apple banana', 'banana cherry'], make_embeddings(2))
+        writer.add_and_persist(corpus_dir, ['cherry durian'], make_embeddings(1, seed=1))
+        writer.save(corpus_dir)
+        assert reader.sync(corpus_dir) == 3
+        assert calls == ['apple banana', 'banana cherry', 'cherry durian']
+        assert reader.search_bm25('banana', 10) == writer.search_bm25('banana', 10)
+        assert reader.search_keywords(['rry'], 10) == [(1, 1), (2, 1)]
+
+
+def test_memory_usage():
+    """测试内存统计包括BM25和关键词倒排表，总量等于各部分之和"""
+    index = HybridIndex()
+    index.add(['apple banana', 'banana cherry', '苹果 香蕉'], make_embeddings(3))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, 'corpus')
+        index.save(corpus_dir)
+        loaded = HybridIndex.load(corpus_dir)
+        segment = os.path.join(corpus_dir, loaded._manifest['segments'][0]['name'])
+        postings_bytes = sum(np.load(os.path.join(segment, name)).nbytes for name in (
+            'postings_indptr.npy', 'postings_doc_ids.npy', 'postings_tfs.npy', 'doc_lens.npy'))
+
+        for usage in (index.memory_usage(), loaded.memory_usage()):
+            assert usage['bm25_terms'] == 5
+            assert usage['bm25_bytes'] > 0 and usage['keyword_bytes'] > 0
+            assert usage['total_bytes'] == (usage['text_bytes'] + usage['embeddings']['used_bytes']
+                                            + usage['vector_index_bytes'] + usage['bm25_bytes'] + usage['keyword_bytes'])
+        assert loaded.memory_usage()['bm25_bytes'] == postings_bytes + loaded.bm25._state[2].nbytes
+
+
+def test_dedup():
+    """测试按内容哈希跳过重复文本块，持久化后仍然生效"""
+    index = HybridIndex(dedup=True)
+    index.add(['apple banana', 'cherry', 'apple  banana'], make_embeddings(3))
+    assert len(index) == 2
+    assert index.new_chunks(['cherry', 'durian', 'durian', 'ａｐｐｌｅ banana']) == ['durian']
+
+    added = index.add(['durian', 'cherry'], make_embeddings(2, seed=1))
+    assert list(added) == [2]
+    assert len(index.embeddings) == 3
+    assert len(index.add(['cherry'], make_embeddings(1))) == 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index.save(tmp_dir + '/corpus')
+        loaded = HybridIndex.load(tmp_dir + '/corpus', dedup=True)
+        assert loaded.new_chunks(['durian', 'elderberry']) == ['elderberry']
+        assert loaded.chunk_ids == index.chunk_ids
+
+
+def test_batch_search():
+    """测试批量BM25和向量检索与逐条检索结果一致"""
+    rng = np.random.default_rng(4)
+    vocab = [f'w{i}' for i in range(20)]
+    docs = [' '.join(rng.choice(vocab, size=rng.integers(1, 8))) for _ in range(60)]
+    embeddings = make_embeddings(60, seed=6)
+    index = HybridIndex()
+    index.add(docs, embeddings)
+
+    queries = ['w1 w2', 'w2 w3 w19', 'missing', 'w1']
+    assert index.search_bm25_batch(queries, 5) == [index.search_bm25(query, 5) for query in queries]
+
+    query_embeddings = make_embeddings(3, seed=7)
+    batch = index.search_vector_batch(query_embeddings, 5, min_score=0.5)
+    assert batch == [index.search_vector(query_embeddings[i], 5, min_score=0.5) for i in range(3)]
+
+
+def test_add_rollback():
+    """测试向量索引写入失败时不追加文档，doc_id与FAISS id保持一致"""
+    index = HybridIndex(vector_config={'index_type': 'hnsw'})
+    index.add(['apple', 'banana'], make_embeddings(2, seed=1))
+
+    def fail(embeddings):
+        raise RuntimeError('add failed')
+    vector_add = index.vector_index.add
+    index.vector_index.add = fail
+    try:
+        index.add(['cherry'], make_embeddings(1, seed=2))
+        assert False, 'expected RuntimeError'
+    except RuntimeError:
+        pass
+    assert len(index) == 2 and len(index.documents) == 2 and len(index.embeddings) == 2
+    assert len(index.bm25) == 2 and index.vector_index.ntotal == 2
+
+    index.vector_index.add = vector_add
+    embeddings = make_embeddings(1, seed=3)
+    index.add(['durian'], embeddings)
+    assert index.search_vector(embeddings, 1)[0][0] == 2
+    assert index.search_bm25('durian', 10)[0][0] == 2
+
+
+def test_rw_lock_writer_preference():
+    """测试有写者等待时新的读者等待写者完成"""
+    lock = ReadWriteLock()
+    order = []
+    lock.acquire_read()
+
+    def writer():
+        lock.acquire_write()
+        order.append('writer')
+        lock.release_write()
+
+    def reader():
+        lock.acquire_read()
+        order.append('reader')
+        lock.release_read()
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+    while not lock._waiting_writers:
+        time.sleep(0.001)
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    time.sleep(0.05)
+    assert order == []
+
+    lock.release_read()
+    writer_thread.join(1)
+    reader_thread.join(1)
+    assert order == ['writer', 'reader']
+
+
+if __name__ == "__main__":
+    test_incremental_add()
+    test_vector_search()
+    test_snapshot_isolation()
+    test_bm25_merge()
+    test_keyword_search()
+    test_save_and_load()
+    test_segmented_save()
+    test_shared_corpus()
+    test_mapped_segments()
+    test_tokenize_once()
+    test_memory_usage()
+    test_dedup()
+    test_batch_search()
+    test_add_rollback()
+    test_rw_lock_writer_preference()
+    print("所有测试通过")
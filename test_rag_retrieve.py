@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试RAG检索阶段的并发执行
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import time
+import threading
+
+import numpy as np
+import requests
+
+import app.api.rag as rag_api
+from app.utils.rag_index import HybridIndex
+
+# 预热分词和查询扩展，首次加载词典的耗时不计入检索阶段的截止时间
+rag_api.query_expander.expand('alpha')
+rag_api.extract_keywords('alpha')
+
+
+def make_index():
+    index = HybridIndex()
+    index.add(['alpha beta', 'gamma delta', 'alpha gamma'], np.eye(3, 8, dtype='float32'))
+    return index
+
+
+def run_retrieve(embed_query, index=None, **kwargs):
+    """用测试索引和给定的嵌入函数执行retrieve，结束后恢复模块中的全局对象"""
+    index = index or make_index()
+    saved = rag_api.hybrid_index, rag_api.embed_query
+    rag_api.hybrid_index, rag_api.embed_query = index, embed_query
+    try:
+        return rag_api.retrieve('alpha', index.snapshot(), 3, **kwargs)
+    finally:
+        rag_api.hybrid_index, rag_api.embed_query = saved
+
+
+def test_on_embedding():
+    """测试向量阶段生成的查询向量传给回调（答案缓存复用），BM25阶段不等待嵌入请求"""
+    received = []
+    bm25_done = threading.Event()
+    index = make_index()
+    search_bm25 = index.search_bm25
+
+    def search_bm25_and_notify(*args, **kwargs):
+        results = search_bm25(*args, **kwargs)
+        bm25_done.set()
+        return results
+
+    def embed_query(query, timeout=None):
+        # 嵌入请求阻塞到BM25检索完成；BM25阶段如果等待嵌入请求，直到超时都不会完成
+        received.append('bm25 done' if bm25_done.wait(timeout) else 'bm25 blocked')
+        return np.eye(1, 8, dtype='float32')
+
+    index.search_bm25 = search_bm25_and_notify
+    results, stages = run_retrieve(embed_query, index=index, on_embedding=received.append)
+    assert received[0] == 'bm25 done'
+    assert len(received) == 2 and received[1].shape == (1, 8)
+    assert results['vector'][0][0] == 0
+    assert {doc_id for doc_id, _ in results['bm25']} == {0, 2}
+
+
+def test_vector_deadline():
+    """测试嵌入请求以向量阶段的剩余时间为超时，超时后使用其余阶段的结果"""
+    timeouts = []
+
+    def embed_query(query, timeout=None):
+        timeouts.append(timeout)
+        time.sleep(timeout)
+        raise requests.exceptions.Timeout()
+
+    saved = dict(rag_api.RAG_STAGE_TIMEOUTS)
+    rag_api.RAG_STAGE_TIMEOUTS['vector'] = 0.2
+    try:
+        start = time.perf_counter()
+        results, stages = run_retrieve(embed_query)
+        elapsed = time.perf_counter() - start
+    finally:
+        rag_api.RAG_STAGE_TIMEOUTS.update(saved)
+    assert len(timeouts) == 1 and 0 < timeouts[0] <= 0.2
+    assert stages['vector']['status'] == 'timeout' and 'vector' not in results
+    assert stages['bm25']['status'] == 'ok' and stages['keyword']['status'] == 'ok'
+    assert {doc_id for doc_id, _ in results['bm25']} == {0, 2}
+    assert elapsed < 1.0
+
+
+def test_vector_deadline_expired_in_queue():
+    """测试向量阶段排队期间已超过截止时间时不再发送嵌入请求"""
+    calls = []
+    saved = dict(rag_api.RAG_STAGE_TIMEOUTS)
+    rag_api.RAG_STAGE_TIMEOUTS['vector'] = 0
+    try:
+        results, stages = run_retrieve(lambda query, timeout=None: calls.append(timeout))
+    finally:
+        rag_api.RAG_STAGE_TIMEOUTS.update(saved)
+    assert calls == []
+    assert stages['vector']['status'] == 'timeout'
+    assert stages['bm25']['status'] == 'ok'
+
+
+if __name__ == "__main__":
+    test_on_embedding()
+    test_vector_deadline()
+    test_vector_deadline_expired_in_queue()
+    print("所有测试通过")
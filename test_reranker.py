@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试rerank组件
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.reranker import Reranker, RerankBudget
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class FakeClient:
+    """按文本长度打分，结果按得分降序返回（与输入顺序不同）"""
+
+    def __init__(self):
+        self.requests = []
+
+    def post(self, json=None, **kwargs):
+        self.requests.append(json)
+        results = [{'index': i, 'relevance_score': float(len(doc))} for i, doc in enumerate(json['documents'])]
+        results.sort(key=lambda r: -r['relevance_score'])
+        return FakeResponse({'results': results[:json['top_n']]})
+
+
+def test_map_by_index():
+    """测试按服务返回的index映射得分"""
+    reranker = Reranker(FakeClient())
+    candidates = [(0, '短', 0.9), (1, '很长很长的文本', 0.8), (2, '中等长度', 0.7)]
+    results = reranker.rerank('查询', candidates, top_n=2)
+    assert [r['doc_id'] for r in results] == [1, 2]
+    assert results[0]['rerank_score'] == 7.0
+
+
+def test_cache_skips_scored_chunks():
+    """测试已缓存的(查询, 文本块)不再发送给rerank服务"""
+    client = FakeClient()
+    reranker = Reranker(client, cache_size=10)
+    reranker.scores('查询', ['a', 'bb'])
+    scores = reranker.scores(' 查询 ', ['bb', 'ccc', 'a'])
+    assert scores == [2.0, 3.0, 1.0]
+    assert len(client.requests) == 2
+    assert client.requests[1]['documents'] == ['ccc']
+
+    reranker.scores('查询', ['a', 'bb', 'ccc'])
+    assert len(client.requests) == 2
+    stats = reranker.stats()
+    assert stats['hits'] == 5 and stats['misses'] == 3
+
+
+def test_missing_results_keep_fused_order():
+    """测试服务未返回得分的文档按原融合顺序补在后面"""
+    class PartialClient(FakeClient):
+        def post(self, json=None, **kwargs):
+            self.requests.append(json)
+            return FakeResponse({'results': [{'index': 2, 'score': 0.5}]})
+
+    reranker = Reranker(PartialClient())
+    results = reranker.rerank('q', [(0, 'x', 0.9), (1, 'y', 0.8), (2, 'z', 0.7)], top_n=3)
+    assert [r['doc_id'] for r in results] == [2, 0, 1]
+    assert results[1]['score'] == 0.9
+
+
+def test_adaptive_budget():
+    """测试第一名明显领先时跳过rerank，得分平缓时扩大候选范围"""
+    budget = RerankBudget(mode='adaptive', fixed_candidates=10, min_candidates=5, max_candidates=20)
+    # 第一名在三路检索中都排第一，第二名只出现在一路中
+    assert budget.select([3 / 50, 1 / 51, 1 / 52]) == 0
+    # 各路结果互不重叠，得分平缓
+    flat = sorted([1 / (50 + rank) for rank in range(10)] * 3, reverse=True)
+    assert budget.select(flat) == 20
+    # 第二名接近第一名但其余候选明显落后
+    assert budget.select([3 / 50, 3 / 51] + [1 / (52 + rank) for rank in range(10)]) == 5
+
+    assert budget.record(3, 0) == 3
+    assert budget.record(30, 20) == -10
+    stats = budget.stats()
+    assert stats['queries'] == 2 and stats['skipped'] == 1 and stats['candidates_avoided'] == -7
+
+
+def test_fixed_budget():
+    """测试固定模式总是rerank前fixed_candidates个候选"""
+    budget = RerankBudget(mode='fixed', fixed_candidates=10)
+    assert budget.limit == 10
+    assert budget.select([3 / 50, 1 / 51]) == 2
+    assert budget.select([1 / 50] * 10) == 10
+
+
+if __name__ == "__main__":
+    test_map_by_index()
+    test_cache_skips_scored_chunks()
+    test_missing_results_keep_fused_order()
+    test_adaptive_budget()
+    test_fixed_budget()
+    print("所有测试通过")
@@ -9,7 +9,11 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from utils import filter_content
+from utils import filter_content, mask_content, ACAutomaton
+import pickle
+import tempfile
+
+from sensitive_filter import CompiledACAutomaton, SensitiveDictionary, TextNormalizer, build_automaton, filter_batch
 
 def test_sensitive_filter():
     """测试敏感词过滤功能"""
@@ -47,6 +51,11 @@ def test_sensitive_filter():
         ("这是一个非常敏感的话题", True, "包含敏感词在中间"),
         ("敏感话题需要避免", True, "包含敏感词在开头"),
         ("我们要避免敏感话题", True, "包含敏感词在结尾"),
+        # 测试繁体和插入噪声字符
+        ("賭博是違法的", True, "包含繁体敏感词"),
+        ("这是一个敏 感的问题", True, "敏感词中插入空格"),
+        ("诈-骗行为会被严惩", True, "敏感词中插入标点"),
+        ("这是一个S.E.N.S.I.T.I.V.E的问题", True, "英文敏感词中插入标点"),
     ]
     
     print("开始测试敏感词过滤功能...")
@@ -72,6 +81,192 @@ def test_sensitive_filter():
     
     return failed == 0
 
+def test_compiled_automaton():
+    """测试编译后的AC自动机（稠密转移表和双数组）与原AC自动机结果一致"""
+    words = ["敏感", "敏感词", "感词汇", "违法", "he", "she", "his", "hers"]
+    texts = [
+        "这是一个敏感词汇的问题",
+        "ushers违法",
+        "正常内容",
+        "",
+        ("敏感内容" + "x" * 50 + "违法his") * 20,  # 长文本走NumPy分段扫描
+    ]
+    expected_automaton = ACAutomaton()
+    for word in words:
+        expected_automaton.add_word(word)
+    expected_automaton.build_fail()
+    
+    for dense_budget in (None, 0):
+        automaton = CompiledACAutomaton(dense_budget=dense_budget)
+        for word in words:
+            automaton.add_word(word)
+        automaton.build_fail()
+        assert automaton.dense == (dense_budget is None)
+        for text in texts:
+            assert automaton.search(text) == expected_automaton.search(text), text
+    return True
+
+def test_match_modes():
+    """测试contains、find_all和mask"""
+    automaton = CompiledACAutomaton()
+    for word in ["敏感", "敏感词", "违法"]:
+        automaton.add_word(word)
+    automaton.build_fail()
+    
+    text = "这是敏感词，不要违法"
+    assert automaton.contains(text)
+    assert not automaton.contains("正常内容")
+    assert automaton.find_all(text) == [(2, 4, "敏感"), (2, 5, "敏感词"), (8, 10, "违法")]
+    assert automaton.mask(text) == "这是***，不要**"
+    
+    # 长文本分块扫描，敏感词跨越块边界
+    long_text = "x" * (automaton.CONTAINS_BLOCK - 1) + "违法" + "y" * 1000
+    assert automaton.contains(long_text)
+    assert not automaton.contains("x" * 10000)
+    assert automaton.find_all(long_text) == [(automaton.CONTAINS_BLOCK - 1, automaton.CONTAINS_BLOCK + 1, "违法")]
+    
+    assert mask_content("这是一个ＳＥＮＳＩＴＩＶＥ的问题") == "这是一个*********的问题"
+    return True
+
+def test_normalized_scan():
+    """测试扫描时归一化：全角、大小写、繁简变体和噪声字符，命中位置对应原文"""
+    automaton = CompiledACAutomaton(normalizer=TextNormalizer())
+    for word in ["Sensitive", "sensitive", "违法", "个人信息"]:
+        automaton.add_word(word)
+    automaton.build_fail()
+    # 原始词和小写词归一化后相同，只插入一次
+    assert len(automaton) == 3
+    
+    text = "ＳＥＮＳＩＴＩＶＥ，違 法！個人-信息"
+    assert automaton.search(text) == {"Sensitive", "违法", "个人信息"}
+    assert automaton.find_all(text) == [(0, 9, "Sensitive"), (10, 13, "违法"), (14, 19, "个人信息")]
+    assert automaton.mask(text) == "*********，***！*****"
+    # 敏感词前后的噪声字符不替换
+    assert automaton.mask(" 违法 ") == " ** "
+    
+    # 长文本走NumPy分段扫描，结果一致
+    long_text = ("正常内容" * 100 + text) * 3
+    assert automaton.search(long_text) == {"Sensitive", "违法", "个人信息"}
+    assert automaton.contains(long_text)
+    assert automaton.find_all(long_text)[1] == (410, 413, "违法")
+    return True
+
+def test_noise_in_words():
+    """测试敏感词首尾的噪声字符是词的一部分：C++不退化为c，只由噪声组成的敏感词不被丢弃"""
+    automaton = build_automaton(["C++", "**", "个人-信息"], normalizer=TextNormalizer())
+    assert len(automaton) == 3
+    assert automaton.find_all("I like cats and apples") == []
+    assert automaton.find_all("I like C++ and c ++") == [(7, 10, "C++"), (15, 19, "C++")]
+    assert automaton.find_all("a**b") == [(1, 3, "**")]
+    # 夹在词中间的噪声字符仍然跳过
+    assert automaton.search("个人 信息") == {"个人-信息"}
+    return True
+
+def test_dictionary_reload():
+    """测试词典文件变化后重新构建并替换自动机，编译结果缓存后直接加载"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        words_file = os.path.join(tmp_dir, 'words.txt')
+        cache_file = os.path.join(tmp_dir, 'words.cache')
+        with open(words_file, 'w', encoding='utf-8') as f:
+            f.write("# 注释\n敏感\nBad\n")
+        
+        dictionary = SensitiveDictionary(words_file, cache_path=cache_file, check_interval=0)
+        assert dictionary.reload()
+        assert dictionary.version == 1
+        assert dictionary.automaton.contains("bad内容")
+        assert not dictionary.reload()
+        
+        with open(words_file, 'w', encoding='utf-8') as f:
+            f.write("违法\n")
+        os.utime(words_file, (0, 0))
+        assert dictionary.reload()
+        assert dictionary.version == 2
+        assert not dictionary.automaton.contains("敏感内容")
+        assert dictionary.automaton.contains("违法内容")
+        
+        # 新进程：词典未变化，直接从缓存加载
+        other = SensitiveDictionary(words_file, cache_path=cache_file, check_interval=0)
+        assert other.reload()
+        assert other.stats()['cache_loads'] == 1
+        assert other.automaton.find_all("不要违法") == [(2, 4, "违法")]
+    
+    # 双数组自动机序列化后结果一致
+    automaton = CompiledACAutomaton(dense_budget=0)
+    for word in ["he", "she", "hers"]:
+        automaton.add_word(word)
+    automaton.build_fail()
+    restored = pickle.loads(pickle.dumps(automaton))
+    assert restored.search("ushers" * 100) == {"he", "she", "hers"}
+    return True
+
+
+def test_filter_batch():
+    """测试多进程批量扫描与逐条扫描结果一致"""
+    automaton = build_automaton(["赌博", "违法", "he", "she"], normalizer=TextNormalizer())
+    texts = ["正常内容", "", "禁止赌 博", "ushers", "违法和赌博"] * 50
+    expected = [(i, automaton.find_all(text)) for i, text in enumerate(texts) if automaton.find_all(text)]
+    assert list(filter_batch(texts, automaton, processes=1, chunk_size=7)) == expected
+    assert list(filter_batch(iter(texts), automaton, processes=2, chunk_size=7, max_pending=1)) == expected
+    assert expected[0] == (2, [(2, 5, "赌博")])
+    return True
+
+def test_initial_load_failure():
+    """测试词典从未加载成功时按敏感处理，加载成功后恢复正常判断"""
+    import utils
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        words_file = os.path.join(tmp_dir, 'words.txt')
+        dictionary = SensitiveDictionary(words_file, check_interval=0)
+        try:
+            dictionary.reload()
+            assert False, 'expected FileNotFoundError'
+        except FileNotFoundError:
+            pass
+        assert not dictionary.loaded
+
+        saved = utils.sensitive_dictionary
+        utils.sensitive_dictionary = dictionary
+        try:
+            assert filter_content("正常内容")
+            assert mask_content("正常内容") == "****"
+            with open(words_file, 'w', encoding='utf-8') as f:
+                f.write("违法\n")
+            assert dictionary.reload() and dictionary.loaded
+            assert not filter_content("正常内容")
+            assert mask_content("不要违法") == "不要**"
+        finally:
+            utils.sensitive_dictionary = saved
+    return True
+
+def test_after_fork():
+    """测试fork后只在启动过检查线程的进程中重启，批量扫描的工作进程中不重启"""
+    import threading
+    import sensitive_filter
+
+    def watchers():
+        return sum(thread.name == 'sensitive-words' for thread in threading.enumerate())
+
+    dictionary = SensitiveDictionary('sensitive_words.txt', check_interval=60)
+    before = watchers()
+    dictionary._after_fork()
+    assert watchers() == before
+
+    dictionary._watching = True
+    sensitive_filter._batch_pools += 1
+    try:
+        dictionary._after_fork()
+    finally:
+        sensitive_filter._batch_pools -= 1
+    assert not dictionary._watching and watchers() == before
+    return True
+
 if __name__ == "__main__":
+    assert test_filter_batch()
+    assert test_compiled_automaton()
+    assert test_normalized_scan()
+    assert test_noise_in_words()
+    assert test_dictionary_reload()
+    assert test_initial_load_failure()
+    assert test_after_fork()
+    assert test_match_modes()
     success = test_sensitive_filter()
     sys.exit(0 if success else 1)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试BM25分词器
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.tokenizer import create_tokenizer
+from app.utils.rag_index import BM25Index, IndexSnapshot
+
+
+def test_bigram_tokenizer():
+    """测试中文按字符二元组切分，英文按整词切分"""
+    tokenizer = create_tokenizer('bigram')
+    assert tokenizer('人工智能RAG系统，好') == ['人工', '工智', '智能', 'rag', '系统', '好']
+
+
+def test_jieba_tokenizer():
+    """测试jieba搜索引擎模式分词并过滤标点"""
+    tokenizer = create_tokenizer('jieba')
+    tokens = tokenizer('什么是人工智能？')
+    assert '人工智能' in tokens
+    assert '？' not in tokens
+
+
+def test_chinese_bm25():
+    """测试中文文本的BM25检索"""
+    tokenizer = create_tokenizer('jieba')
+    docs = ['机器学习是人工智能的核心', '深度学习使用神经网络', '今天天气很好']
+    bm25 = BM25Index()
+    bm25.add(tokenizer(doc) for doc in docs)
+    snapshot = IndexSnapshot(len(bm25), bm25.total_len)
+
+    results = bm25.top_n(tokenizer('什么是深度学习'), 3, snapshot)
+    assert results[0][0] == 1
+    assert 2 not in [doc_id for doc_id, _ in results]
+
+
+if __name__ == "__main__":
+    test_bigram_tokenizer()
+    test_jieba_tokenizer()
+    test_chinese_bm25()
+    print("所有测试通过")
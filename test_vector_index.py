@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试可配置的向量索引后端
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+import threading
+
+import numpy as np
+
+from app.utils.rag_index import HybridIndex
+from app.utils.vector_index import VectorIndex
+
+
+def make_embeddings(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((n, dim), dtype='float32')
+
+
+def test_ivf_training_threshold():
+    """测试IVF在达到训练阈值前使用flat，达到后自动训练，增长后重新训练"""
+    index = HybridIndex(vector_config={'index_type': 'ivf_flat', 'nlist': 4, 'train_threshold': 200, 'retrain_factor': 2})
+    index.add([f'doc{i}' for i in range(100)], make_embeddings(100, seed=1))
+    assert index.vector_index.active_type == 'flat'
+
+    index.add([f'doc{i}' for i in range(100)], make_embeddings(100, seed=2))
+    assert index.wait_vector_rebuild()
+    assert index.vector_index.active_type == 'ivf_flat'
+    assert index.vector_index.trained_size == 200
+
+    index.add([f'doc{i}' for i in range(100)], make_embeddings(100, seed=3))
+    assert index.vector_index.trained_size == 200
+    assert index.vector_index.ntotal == 300
+
+    index.add([f'doc{i}' for i in range(100)], make_embeddings(100, seed=4))
+    assert index.wait_vector_rebuild()
+    assert index.vector_index.trained_size == 400
+    assert index.vector_index.ntotal == 400
+
+
+def test_background_rebuild():
+    """测试IVF训练在后台进行：上传不等待训练，训练期间可以查询和追加，追加的向量进入新索引"""
+    index = HybridIndex(vector_config={'index_type': 'ivf_flat', 'nlist': 4, 'train_threshold': 200})
+    embeddings = make_embeddings(250, seed=5)
+    index.add([str(i) for i in range(100)], embeddings[:100])
+    started, release = threading.Event(), threading.Event()
+    build = index.vector_index.build
+
+    def blocked_build(embeddings):
+        started.set()
+        release.wait(10)
+        return build(embeddings)
+
+    index.vector_index.build = blocked_build
+    index.add([str(i) for i in range(100, 200)], embeddings[100:200])
+    assert started.wait(10)
+    assert index.vector_index.active_type == 'flat'
+    assert index.search_vector(embeddings[7:8], 1)[0][0] == 7
+
+    index.add([str(i) for i in range(200, 250)], embeddings[200:])
+    assert not index.wait_vector_rebuild(timeout=0.1)
+    release.set()
+    assert index.wait_vector_rebuild(timeout=10)
+    assert index.vector_index.active_type == 'ivf_flat'
+    assert index.vector_index.trained_size == 250
+    assert index.search_vector(embeddings[230:231], 1, nprobe=4)[0][0] == 230
+
+
+def test_recall():
+    """测试各类索引相对flat的recall"""
+    embeddings = make_embeddings(1000)
+    for index_type in VectorIndex.TYPES:
+        index = HybridIndex(vector_config={'index_type': index_type, 'nlist': 8, 'pq_m': 4})
+        index.add([str(i) for i in range(len(embeddings))], embeddings)
+        index.wait_vector_rebuild()
+        stats = index.vector_recall(k=10, num_queries=50, nprobe=8)
+        if index_type in ('flat', 'ivf_flat'):
+            # nprobe等于nlist时IVF-Flat等价于精确检索
+            assert stats['recall'] == 1.0
+        else:
+            assert stats['recall'] > 0.3
+        assert stats['index_type'] == index_type
+
+
+def test_recall_excludes_query():
+    """测试以已索引向量作为查询时自身命中不计入recall"""
+    embeddings = make_embeddings(400, seed=6)
+    vector_index = VectorIndex(16, index_type='ivf_flat', metric='l2', nlist=20, nprobe=1)
+    vector_index.swap(vector_index.build(embeddings))
+    queries = np.arange(0, 400, 4)
+    # 自身总落在自己的聚类中，k=1时不去掉自身recall恒为1
+    assert vector_index.recall(embeddings[queries], embeddings, k=1) == 1.0
+    assert vector_index.recall(embeddings[queries], embeddings, k=1, query_ids=queries) < 1.0
+    assert vector_index.recall(embeddings[queries], embeddings, k=1, nprobe=20, query_ids=queries) == 1.0
+
+
+def test_change_index_type_on_load():
+    """测试加载时索引类型与配置不同则重新构建"""
+    embeddings = make_embeddings(300)
+    index = HybridIndex()
+    index.add([str(i) for i in range(len(embeddings))], embeddings)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index.save(tmp_dir + '/corpus')
+        loaded = HybridIndex.load(tmp_dir + '/corpus', vector_config={'index_type': 'hnsw'})
+        assert loaded.vector_index.active_type == 'hnsw'
+        assert loaded.search_vector(embeddings[5:6], 1, ef_search=32)[0][0] == 5
+
+        loaded.save(tmp_dir + '/corpus')
+        reloaded = HybridIndex.load(tmp_dir + '/corpus', vector_config={'index_type': 'hnsw', 'ef_search': 128})
+        assert reloaded.vector_index.ef_search == 128
+        assert reloaded.vector_index.ntotal == 300
+
+
+def test_cosine_similarity():
+    """测试内积度量下返回余弦相似度，并按阈值过滤"""
+    embeddings = make_embeddings(50)
+    index = HybridIndex()
+    index.add([str(i) for i in range(len(embeddings))], embeddings * 10)
+
+    query = embeddings[7:8]
+    results = index.search_vector(query, 50)
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = normalized @ (query[0] / np.linalg.norm(query[0]))
+    assert results[0][0] == 7
+    assert abs(results[0][1] - 1.0) < 1e-5
+    assert all(abs(score - expected[doc_id]) < 1e-5 for doc_id, score in results)
+
+    threshold = float(np.median(expected))
+    filtered = index.search_vector(query, 50, min_score=threshold)
+    assert filtered and all(score >= threshold for _, score in filtered)
+    assert len(filtered) < len(results)
+
+
+def test_change_metric_on_load():
+    """测试L2度量的语料按内积度量加载时归一化向量并重建索引"""
+    embeddings = make_embeddings(100)
+    index = HybridIndex(vector_config={'metric': 'l2'})
+    index.add([str(i) for i in range(len(embeddings))], embeddings)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index.save(tmp_dir + '/corpus')
+        loaded = HybridIndex.load(tmp_dir + '/corpus', vector_config={'metric': 'ip'})
+        assert loaded.vector_index.metric == 'ip'
+        assert np.allclose(np.linalg.norm(loaded.embeddings.as_float32(), axis=1), 1.0, atol=1e-5)
+        doc_id, score = loaded.search_vector(embeddings[9:10], 1)[0]
+        assert doc_id == 9 and abs(score - 1.0) < 1e-5
+
+
+def test_ivf_save_load_add():
+    """测试训练后的IVF索引保存、加载后可以继续追加"""
+    for index_type in ('ivf_flat', 'ivf_pq'):
+        embeddings = make_embeddings(300, seed=8)
+        index = HybridIndex(vector_config={'index_type': index_type, 'nlist': 4, 'pq_m': 4, 'train_threshold': 200})
+        index.add([str(i) for i in range(len(embeddings))], embeddings)
+        assert index.wait_vector_rebuild()
+        assert index.vector_index.active_type == index_type
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index.save(tmp_dir + '/corpus')
+            loaded = HybridIndex.load(tmp_dir + '/corpus', vector_config=index.vector_config)
+            assert loaded.vector_index.ntotal == 300
+
+            new_embeddings = make_embeddings(10, seed=9)
+            loaded.add([f'new{i}' for i in range(10)], new_embeddings)
+            assert loaded.vector_index.ntotal == 310
+            assert loaded.search_vector(new_embeddings[3:4], 1, nprobe=4)[0][0] == 303
+
+
+if __name__ == "__main__":
+    test_ivf_training_threshold()
+    test_background_rebuild()
+    test_recall()
+    test_recall_excludes_query()
+    test_change_index_type_on_load()
+    test_cosine_similarity()
+    test_change_metric_on_load()
+    test_ivf_save_load_add()
+    print("所有测试通过")
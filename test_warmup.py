@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试启动预热
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tempfile
+
+from app.utils import warmup
+
+
+def test_warm_up():
+    """测试预热完成后标记就绪，重复调用直接返回"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        status = warmup.warm_up(cache_file=os.path.join(tmp_dir, 'jieba.cache'))
+        assert warmup.is_ready()
+        assert status['state'] in ('ready', 'degraded')
+        assert set(status['steps']) <= {'jieba', 'posseg'}
+
+        assert warmup.warm_up() == status
+
+
+if __name__ == "__main__":
+    test_warm_up()
+    print("所有测试通过")
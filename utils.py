@@ -8,6 +8,7 @@ import requests
 import json
 import jieba
 import jieba.posseg as pseg
+from sensitive_filter import SensitiveDictionary, TextNormalizer, DEFAULT_NOISE_CHARS
 
 # 尝试导入SSDB客户端，若失败则跳过
 ssdb_available = False
@@ -109,32 +110,25 @@ class ACAutomaton:
         
         return found_words
 
-# 加载敏感词并构建AC自动机
-sensitive_automaton = ACAutomaton()
-with open('sensitive_words.txt', 'r', encoding='utf-8') as f:
-    for line in f:
-        word = line.strip()
-        if word and not word.startswith('#'):
-            # 同时添加原始词、小写词、全角转半角词，提高匹配效率
-            sensitive_automaton.add_word(word)
-            sensitive_automaton.add_word(word.lower())
-            # 构建时不需要重复添加全角转半角词，运行时统一处理
-
-# 构建失败指针
-sensitive_automaton.build_fail()
-
-# 全角转半角函数
-def full_to_half(s):
-    result = []
-    for char in s:
-        code = ord(char)
-        if code == 0x3000:  # 全角空格转半角空格
-            result.append(' ')
-        elif 0xFF01 <= code <= 0xFF5E:  # 全角字符转半角
-            result.append(chr(code - 0xFEE0))
-        else:
-            result.append(char)
-    return ''.join(result)
+# 加载敏感词并构建AC自动机（编译为数组存储的转移表，接口与ACAutomaton一致）
+# 后台线程监视词典文件（或Redis键），变化后在请求路径之外重新构建并原子替换，编译结果缓存到磁盘
+sensitive_noise_chars = config.get('sensitive', 'noise_chars', raw=True, fallback='')
+sensitive_dictionary = SensitiveDictionary(
+    file_path=config.get('sensitive', 'words_file', fallback='sensitive_words.txt'),
+    cache_path=config.get('sensitive', 'cache_file', fallback='') or None,
+    redis_client=redis_client,
+    redis_key=config.get('sensitive', 'redis_key', fallback='') or None,
+    check_interval=config.getfloat('sensitive', 'check_interval', fallback=5.0),
+    # 匹配时忽略全角/半角、大小写和繁简差异，跳过插入在敏感词中的噪声字符
+    normalizer=TextNormalizer(noise_chars=sensitive_noise_chars + ' \t\r\n' if sensitive_noise_chars
+                              else DEFAULT_NOISE_CHARS),
+)
+try:
+  sensitive_dictionary.reload()
+except Exception as e:
+  # 后台检查线程会继续重试；加载成功前filter_content把所有内容视为敏感
+  print(f"An error occurred while loading sensitive words, all content is treated as sensitive until loaded: {e}")
+sensitive_dictionary.start()
 
 def  send_msg_back(answer,chatid):  #save  answoer  for request 
     redis_client.set(chatid, answer)
@@ -210,18 +204,27 @@ def buildJsonResponse(from_user, to_user, chatid):
 def filter_content(content):
     if not content:
         return False
+    if not sensitive_dictionary.loaded:
+        # 词典从未成功加载，不能确认内容安全
+        print("Alert: Sensitive words not loaded, content treated as sensitive")
+        return True
     
-    # 预处理内容：全角转半角、转为小写
-    processed_content = full_to_half(content).lower()
-    
-    # 使用AC自动机搜索敏感词
-    found_words = sensitive_automaton.search(processed_content)
-    
-    if found_words:
-        for word in found_words:
-            print(f"Alert: Content contains sensitive word '{word}'")
+    # 使用AC自动机检查敏感词（全角、大小写、繁简归一化在扫描时完成），命中第一个即返回
+    if sensitive_dictionary.automaton.contains(content):
+        print("Alert: Content contains sensitive words")
         return True
     return False;
+
+def mask_content(content, mask_char='*'):
+    """
+    把内容中的敏感词替换为mask_char，用于脱敏而不是直接拒绝
+    """
+    if not content:
+        return content
+    if not sensitive_dictionary.loaded:
+        # 词典从未成功加载，整段脱敏
+        return mask_char * len(content)
+    return sensitive_dictionary.automaton.mask(content, mask_char)
 def buildJsonResponse(from_user, to_user, chatid):
     response = {
         "ToUserName": from_user,